@@ -1,77 +1,194 @@
+import atexit
 import time
-import nidaqmx
-from nidaqmx.constants import LineGrouping
-import keyboard
+import logging
+import math
+import threading
+import numpy as np
+from acquisition import AcquisitionBackend, ContinuousAcquisition, MockDAQBackend
+from mock_daq import MockDAQDevice
+from output_session import OutputSession, MockOutputSession
+from structured_logging import configure_logging
+from waveforms import square_wave
 
-def read_digital_input(pin_name):
+try:
+    import nidaqmx
+    from nidaqmx.constants import AcquisitionType, LineGrouping
+    from nidaqmx.error_codes import DAQmxErrors
+    from nidaqmx.stream_readers import DigitalSingleChannelReader
+except ImportError:
+    # Without the NI driver only the mock backend is available
+    nidaqmx = None
+try:
+    import keyboard
+except ImportError:
+    keyboard = None
+
+logger = logging.getLogger(__name__)
+
+# Exceptions of the driver, nothing to catch without it
+DAQ_ERRORS = (nidaqmx.errors.DaqError,) if nidaqmx else ()
+
+class NIDAQmxBackend(AcquisitionBackend):
+    """
+    Hardware-timed acquisition on an NI device: the device's sample clock takes the samples into the driver's
+    buffer and each read copies a whole block into the caller's NumPy buffer in one call.
+    The device must support hardware-timed digital input, e.g. X Series cards.
+    """
+
+    def __init__(self):
+        if nidaqmx is None:
+            raise ImportError("NIDAQmxBackend needs the nidaqmx package and the NI-DAQmx driver")
+        self._task = None
+
+    def start(self, channel, rate, buffer_size):
+        self.stop()
+        self._task = nidaqmx.Task()
+        self._task.di_channels.add_di_chan(channel, line_grouping=LineGrouping.CHAN_FOR_ALL_LINES)
+        self._task.timing.cfg_samp_clk_timing(rate, sample_mode=AcquisitionType.CONTINUOUS, samps_per_chan=buffer_size)
+        self._reader = DigitalSingleChannelReader(self._task.in_stream)
+        self._task.start()
+
+    def read_into(self, buffer, timeout):
+        try:
+            return self._reader.read_many_sample_port_uint32(buffer, number_of_samples_per_channel=len(buffer),
+                                                             timeout=timeout)
+        except nidaqmx.errors.DaqError as error:
+            # The driver reports a read timeout as an error code, raised as TimeoutError like the other backends
+            if error.error_code == DAQmxErrors.SAMPLES_NOT_YET_AVAILABLE:
+                raise TimeoutError(f"{len(buffer)} samples were not available within {timeout} s") from error
+            raise
+
+    def stop(self):
+        if self._task is not None:
+            self._task.close()
+            self._task = None
+
+class NIDAQmxOutputSession(OutputSession):
+    """
+    Digital output on an NI device through tasks that are created and started once and reused by every write,
+    instead of a task per write. Each port gets one task over all its lines, which its line writes go through.
+    """
+
+    def __init__(self):
+        if nidaqmx is None:
+            raise ImportError("NIDAQmxOutputSession needs the nidaqmx package and the NI-DAQmx driver")
+        super().__init__()
+
+    def _open_task(self, channel):
+        task = nidaqmx.Task()
+        try:
+            task.do_channels.add_do_chan(channel, line_grouping=LineGrouping.CHAN_FOR_ALL_LINES)
+            task.start()
+        except Exception:
+            task.close()
+            raise
+        return task
+
+    def _read(self, task):
+        # Output lines read back the state they drive
+        return int(task.read())
+
+    def _write(self, task, value):
+        task.write(value)
+
+    def _close_task(self, task):
+        task.close()
+
+# Session of write_digital_output, created on first use and closed at exit
+_output_session = None
+_output_session_lock = threading.Lock()
+
+def default_output_session():
+    global _output_session
+    with _output_session_lock:
+        if _output_session is None:
+            _output_session = NIDAQmxOutputSession()
+            atexit.register(_output_session.close)
+        return _output_session
+
+def read_digital_input(pin_name, rate=1000.0, samples_per_read=100, backend=None, callback=None, duration=None):
+    """
+    Continuously read a digital line or port on a sample clock until 'q' is pressed or `duration` is over.
+    Args:
+        pin_name (str): The name of the line or port.
+        rate (float): Samples per second.
+        samples_per_read (int): Samples per block.
+        backend (AcquisitionBackend): NIDAQmxBackend by default, MockDAQBackend(device) without hardware.
+        callback (callable): Receives every block of samples, a reused NumPy buffer.
+        duration (float): Seconds to read, until 'q' is pressed by default.
+    """
     try:
-        # Create a task to read digital input
-        with nidaqmx.Task() as task:
-            # Add the digital input channel
-            task.di_channels.add_di_chan(pin_name, line_grouping=LineGrouping.CHAN_FOR_ALL_LINES)
-            
-            # Infinite loop for continuous reading
-            while True:
-                # Record the start time of the read operation
-                read_start_time = time.time()
-                # Read the digital input
-                data = task.read()
-                # Record the end time of the read operation
-                read_end_time = time.time()
-
-                # Calculate the actual read duration
-                read_duration = read_end_time - read_start_time
-                # Calculate the expected read duration (time.sleep(0.1))
-                expected_duration = 0.1
-                # Calculate the tolerance threshold
-                tolerance = 0.01  # 10 milliseconds tolerance
-
-                # Print the acquired data and the actual read duration
-                print(f"Acquired data: {data}, Read Duration: {read_duration:.4f}s")
-
-                # Check if the actual read duration is within the tolerance range of the expected duration
-                if abs(read_duration - expected_duration) > tolerance:
-                    print("Warning: Read duration deviates from expected duration!")
-
-                # Wait for a short duration before reading again
-                time.sleep(0.1)
+        with ContinuousAcquisition(backend or NIDAQmxBackend(), pin_name, rate, samples_per_read) as acquisition:
+            # A block is due every samples_per_read / rate seconds
+            expected_duration = samples_per_read / rate
+            count = None if duration is None else math.ceil(duration / expected_duration)
+            for block in acquisition.blocks(count):
+                # Record how long the consumer takes with the block
+                process_start_time = time.time()
+                if callback is not None:
+                    callback(block)
+                process_duration = time.time() - process_start_time
+
+                # Log the acquired block and the processing duration
+                logger.debug("Acquired data", extra={'fields': {'samples': len(block), 'high': np.count_nonzero(block),
+                                                                'process_duration': f"{process_duration:.4f}"},
+                                                     'sample': 'read'})
+
+                # A consumer slower than the sample clock drains the backend's buffer until it overflows
+                if process_duration > expected_duration:
+                    logger.warning("Processing a block takes longer than the sample clock needs to fill one",
+                                   extra={'fields': {'process_duration': f"{process_duration:.4f}"}})
 
                 # Check for key press to exit the loop
-                if keyboard.is_pressed('q'):
+                if keyboard is not None and keyboard.is_pressed('q'):
                     break
-    except nidaqmx.errors.DaqError as e:
-        print(f"DAQmx Error: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+    except DAQ_ERRORS as e:
+        logger.error("DAQmx Error: %s", e)
+    except Exception:
+        logger.exception("An unexpected error occurred")
 
-def write_digital_output(pin_name, value):
+def write_digital_output(pin_name, value, session=None):
+    """
+    Write a digital line or port through a persistent session, its task is configured on the first write only.
+    Args:
+        pin_name (str): The name of the line or port.
+        value (bool or int): The value to write.
+        session (OutputSession): The process-wide NI-DAQmx session by default, MockOutputSession without hardware.
+    """
     try:
-        # Create a task to write digital output
-        with nidaqmx.Task() as task:
-            # Add the digital output channel
-            task.do_channels.add_do_chan(pin_name, line_grouping=LineGrouping.CHAN_FOR_ALL_LINES)
-            # Start the task
-            task.start()
-            # Write the digital value
-            task.write(value)
-    except nidaqmx.errors.DaqError as e:
-        print(f"DAQmx Error: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        (session or default_output_session()).write(pin_name, value)
+    except DAQ_ERRORS as e:
+        logger.error("DAQmx Error: %s", e)
+    except Exception:
+        logger.exception("An unexpected error occurred")
 
 if __name__ == "__main__":
+    configure_logging(logging.DEBUG)
     # Specify the digital input pin name
     pin_name = "Dev1/port0"  # Change this to the appropriate pin name
     # Specify the duration for reading (in seconds)
     duration = 10
 
+    backend = None
+    if nidaqmx is None:
+        # Without the driver the port is simulated, with a 5 Hz square wave on its first line
+        daq_device = MockDAQDevice()
+        daq_device.configure_port(pin_name, 'output')
+        daq_device.start_waveform(f"{pin_name}/line0", square_wave(5))
+        backend = MockDAQBackend(daq_device)
+
     # Call the function to read the digital input pin
-    read_digital_input(pin_name)
+    read_digital_input(pin_name, backend=backend, duration=duration)
 
     # Specify the digital output pin name for failure pin
     failure_pin_name = "Dev1/port1"  # Change this to the appropriate failure pin name
     # Specify the value to be written (True or False)
     failure_pin_value = True
 
+    session = None
+    if nidaqmx is None:
+        daq_device.configure_port(failure_pin_name, 'output')
+        session = MockOutputSession(daq_device)
+
     # Call the function to write to the digital output pin
-    write_digital_output(failure_pin_name, failure_pin_value)
+    write_digital_output(failure_pin_name, failure_pin_value, session)
@@ -0,0 +1,175 @@
+from abc import ABC, abstractmethod
+import numpy as np
+from edge_history import EdgeHistory, DEFAULT_CAPACITY
+
+class AcquisitionOverflowError(RuntimeError):
+    """Raised when samples were overwritten before they were read, like DAQmx's buffer overflow error."""
+
+class AcquisitionBackend(ABC):
+    """
+    Where ContinuousAcquisition gets its samples from: NIDAQmxBackend in NIDAQMX.py for NI hardware,
+    MockDAQBackend for a MockDAQDevice.
+    """
+
+    @abstractmethod
+    def start(self, channel, rate, buffer_size):
+        """
+        Start sampling `channel` (a line or a port) at `rate` Hz on a sample clock.
+        Args:
+            channel (str): The name of the line or port.
+            rate (float): Samples per second.
+            buffer_size (int): Samples the backend holds until they are read.
+        """
+
+    @abstractmethod
+    def read_into(self, buffer, timeout):
+        """
+        Fill `buffer` (a uint32 array) with the next len(buffer) samples, blocking until they were taken.
+        Raises TimeoutError when they are not available within `timeout` seconds. Returns the sample count.
+        """
+
+    @abstractmethod
+    def stop(self):
+        """Stop sampling and release the channel, start() may be called again afterwards."""
+
+class MockDAQBackend(AcquisitionBackend):
+    """
+    Samples the pins of a MockDAQDevice on a simulated sample clock. The edges of the sampled lines are recorded
+    as they happen and the samples are rebuilt from them at exactly start + i / rate, so like on hardware they carry
+    no software timing jitter and a slow reader loses nothing until the edge history overflows.
+    Reads wait on the device's clock, so on a VirtualClock they advance it and run instantly.
+    """
+
+    def __init__(self, device, capacity=DEFAULT_CAPACITY):
+        self.device = device
+        self.capacity = capacity
+        # (EdgeHistory, edge callback handle, value at the start) per line, line 0 first
+        self._lines = []
+
+    def start(self, channel, rate, buffer_size):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        # A restart samples from scratch, without the edges and callbacks of the previous run
+        self.stop()
+        pins = self.device.digital_pins
+        if channel in pins:
+            names = [channel]
+        else:
+            names = [f"{channel}/line{i}" for i in range(pins.port_width(channel))]
+        for name in names:
+            history = EdgeHistory(self.capacity)
+            handle = self.device.on_edge(name, lambda name, value, timestamp_ns, history=history:
+                                         history.record(value, timestamp_ns))
+            self._lines.append((history, handle, pins[name]['value']))
+        self._period_ns = 1e9 / rate
+        self._start_ns = self.device.clock.now_ns()
+        # Index of the next sample to read
+        self._next = 0
+
+    def read_into(self, buffer, timeout):
+        clock = self.device.clock
+        count = len(buffer)
+        times = self._start_ns + ((self._next + np.arange(count)) * self._period_ns).astype(np.int64)
+        wait_ns = times[-1] - clock.now_ns()
+        if wait_ns > timeout * 1e9:
+            clock.sleep(timeout)
+            raise TimeoutError(f"{count} samples were not available within {timeout} s")
+        if wait_ns > 0:
+            clock.sleep(wait_ns / 1e9)
+        buffer[:] = 0
+        for bit, (history, _, initial) in enumerate(self._lines):
+            timestamps, values = history.arrays()
+            if history.dropped and times[0] < timestamps[0]:
+                raise AcquisitionOverflowError("Edges were overwritten before their samples were read")
+            if len(timestamps) == 0:
+                levels = np.full(count, initial)
+            else:
+                # The level at a sample time is that of the last edge at or before it
+                edge = np.searchsorted(timestamps, times, side='right')
+                levels = np.where(edge > 0, values[edge - 1], initial)
+            np.bitwise_or(buffer, levels.astype(np.uint32) << bit, out=buffer)
+        self._next += count
+        return count
+
+    def stop(self):
+        for _, handle, _ in self._lines:
+            self.device.remove_edge_callback(handle)
+        self._lines = []
+
+class ContinuousAcquisition:
+    """
+    Streams a line or port from a backend in blocks of `samples_per_read` samples taken on a sample clock.
+    Blocks are read into `buffer_count` preallocated uint32 buffers in turn, so a read allocates nothing and a
+    block stays valid until `buffer_count - 1` more blocks were read: copy it to keep it longer.
+    Args:
+        backend (AcquisitionBackend): NIDAQmxBackend or MockDAQBackend.
+        channel (str): The name of the line or port, e.g. 'Dev1/port0'.
+        rate (float): Samples per second.
+        samples_per_read (int): Samples per block.
+        buffer_count (int): Preallocated blocks.
+        backend_buffer_size (int): Samples the backend holds between reads, a second's worth or 10 blocks by default.
+    """
+
+    def __init__(self, backend, channel, rate, samples_per_read, buffer_count=4, backend_buffer_size=None):
+        if samples_per_read < 1:
+            raise ValueError("samples_per_read must be at least 1")
+        if buffer_count < 1:
+            raise ValueError("buffer_count must be at least 1")
+        self.backend = backend
+        self.channel = channel
+        self.rate = rate
+        self.samples_per_read = samples_per_read
+        self.backend_buffer_size = backend_buffer_size or max(int(rate), 10 * samples_per_read)
+        # One allocation, handed out as the same row views every time
+        self._buffers = list(np.zeros((buffer_count, samples_per_read), dtype=np.uint32))
+        self.blocks_read = 0
+        self.running = False
+
+    @property
+    def samples_read(self):
+        return self.blocks_read * self.samples_per_read
+
+    def start(self):
+        self.backend.start(self.channel, self.rate, self.backend_buffer_size)
+        self.running = True
+        return self
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.backend.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def read(self, timeout=10.0):
+        """The next block of samples, one of the preallocated buffers."""
+        if not self.running:
+            raise RuntimeError("The acquisition is not running")
+        buffer = self._buffers[self.blocks_read % len(self._buffers)]
+        self.backend.read_into(buffer, timeout)
+        self.blocks_read += 1
+        return buffer
+
+    def blocks(self, count=None, timeout=10.0):
+        """Generator of the next `count` blocks, endless by default."""
+        while count is None or count > 0:
+            yield self.read(timeout)
+            if count is not None:
+                count -= 1
+
+    def run(self, callback, count=None, stop_event=None, timeout=10.0):
+        """
+        Call `callback(block)` for the next `count` blocks, until `stop_event` is set, or forever.
+        Args:
+            callback (callable): Receives each block, which is reused once `buffer_count` more blocks were read.
+            count (int): Blocks to deliver, endless by default.
+            stop_event (threading.Event): Stops the loop before the next block when set.
+        """
+        for block in self.blocks(count, timeout):
+            callback(block)
+            if stop_event is not None and stop_event.is_set():
+                break
@@ -0,0 +1,78 @@
+import time
+
+class MonotonicClock:
+    """Real time from time.monotonic_ns, the default clock. Schedulers run on their own threads."""
+    virtual = False
+
+    def now_ns(self):
+        return time.monotonic_ns()
+
+    def monotonic(self):
+        """The current time in seconds."""
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class VirtualClock:
+    """
+    Simulated time that only moves when advance() or sleep() is called. Schedulers attached to it, like the
+    WaveformEngine of a device, do not start a thread: advance() steps from deadline to deadline and plays every
+    due edge in the calling thread, so a test runs in microseconds of real time and gives the same edges every run.
+    Only one thread should advance the clock at a time, and edge callbacks must not advance it.
+    """
+    virtual = True
+
+    def __init__(self, start_ns=0):
+        self._now_ns = start_ns
+        self._schedulers = []
+
+    def now_ns(self):
+        return self._now_ns
+
+    def monotonic(self):
+        """The current time in seconds."""
+        return self._now_ns / 1e9
+
+    def attach(self, scheduler):
+        """
+        Let advance() run a scheduler, which provides next_deadline_ns() (None when idle) and run_due(now_ns).
+        Attaching it again does nothing.
+        """
+        if scheduler not in self._schedulers:
+            self._schedulers.append(scheduler)
+
+    def detach(self, scheduler):
+        if scheduler in self._schedulers:
+            self._schedulers.remove(scheduler)
+
+    def advance(self, seconds, latency=0.0):
+        """
+        Move the time forward, running every deadline that falls on the way at its simulated time.
+        Args:
+            seconds (float): How far to move.
+            latency (float): Simulated delay of every wake-up past the deadline it was due for, like a loaded
+                machine, so missed and late edges can be reproduced exactly.
+        Returns:
+            int: The number of times a scheduler was woken up.
+        """
+        if seconds < 0:
+            raise ValueError("The clock cannot go backwards")
+        target_ns = self._now_ns + int(seconds * 1e9)
+        latency_ns = int(latency * 1e9)
+        wakeups = 0
+        while True:
+            deadlines = [deadline for deadline in (scheduler.next_deadline_ns() for scheduler in self._schedulers)
+                         if deadline is not None]
+            if not deadlines or min(deadlines) > target_ns:
+                break
+            self._now_ns = max(self._now_ns, min(min(deadlines) + latency_ns, target_ns))
+            for scheduler in list(self._schedulers):
+                scheduler.run_due(self._now_ns)
+            wakeups += 1
+        self._now_ns = target_ns
+        return wakeups
+
+    def sleep(self, seconds):
+        """Same as advance(seconds), so code written against either clock can 'sleep'."""
+        self.advance(seconds)
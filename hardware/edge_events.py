@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RISING = 'rising'
+FALLING = 'falling'
+ANY = 'any'
+EDGES = (RISING, FALLING, ANY)
+
+def _matches(edge, value):
+    return edge == ANY or (edge == RISING) == value
+
+class _Watch:
+    """Edge counters, callbacks and the condition variable of one watched pin."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.rising = 0
+        self.falling = 0
+        # handle -> (edge, callback)
+        self.callbacks = {}
+        self.waiters = 0
+
+    def count(self, edge):
+        if edge == RISING:
+            return self.rising
+        if edge == FALLING:
+            return self.falling
+        return self.rising + self.falling
+
+class EdgeEvents:
+    """
+    Change detection on the pins of a PinStore: callbacks on rising, falling or any edges, and blocking or
+    asyncio waits for the next edge. Only pins somebody subscribed to or waits on are watched, the store
+    reports their changes from the writing thread, so a consumer reacts right after the write without polling.
+    """
+
+    def __init__(self, pins):
+        self.pins = pins
+        # Pin index -> _Watch
+        self._watches = {}
+        self._handles = itertools.count(1)
+        # handle -> pin index
+        self._callback_pins = {}
+        self._lock = threading.Lock()
+        pins.edge_listener = self._on_edge
+
+    def _acquire(self, channel):
+        """The channel's _Watch, its pin is watched until the matching _release."""
+        index = self.pins.index(channel)
+        with self._lock:
+            watch = self._watches.get(index)
+            if watch is None:
+                watch = self._watches[index] = _Watch()
+            watch.waiters += 1
+            if watch.waiters == 1:
+                self.pins.set_watched(channel, True)
+            return index, watch
+
+    def _release(self, channel, watch):
+        with self._lock:
+            watch.waiters -= 1
+            if watch.waiters == 0:
+                self.pins.set_watched(channel, False)
+
+    def on_edge(self, channel, callback, edge=ANY):
+        """
+        Call `callback(channel, value, timestamp_ns)` on every matching edge of a channel, from the thread that
+        changed it. Returns a handle for remove_callback.
+        Args:
+            channel (str): The name of the channel.
+            callback (callable): Receives the channel name, the new value and the monotonic time of the change.
+            edge (str): RISING, FALLING or ANY.
+        """
+        if edge not in EDGES:
+            raise ValueError(f"Edge must be one of {EDGES}")
+        index, watch = self._acquire(channel)
+        handle = next(self._handles)
+        with watch.condition:
+            watch.callbacks[handle] = (edge, callback)
+        with self._lock:
+            self._callback_pins[handle] = index
+        return handle
+
+    def remove_callback(self, handle):
+        """Stop calling a callback registered with on_edge, returns False for an unknown handle."""
+        with self._lock:
+            index = self._callback_pins.pop(handle, None)
+        if index is None:
+            return False
+        watch = self._watches[index]
+        with watch.condition:
+            watch.callbacks.pop(handle)
+        self._release(self.pins.name(index), watch)
+        return True
+
+    def wait_for_edge(self, channel, edge=ANY, timeout=None):
+        """
+        Block until the next matching edge of a channel.
+        Args:
+            channel (str): The name of the channel.
+            edge (str): RISING, FALLING or ANY.
+            timeout (float): Seconds to wait at most, forever by default.
+        Returns:
+            bool: True on an edge, False on timeout.
+        """
+        if edge not in EDGES:
+            raise ValueError(f"Edge must be one of {EDGES}")
+        _, watch = self._acquire(channel)
+        try:
+            with watch.condition:
+                start = watch.count(edge)
+                return watch.condition.wait_for(lambda: watch.count(edge) != start, timeout)
+        finally:
+            self._release(channel, watch)
+
+    async def wait_for_edge_async(self, channel, edge=ANY, timeout=None):
+        """
+        Wait for the next matching edge of a channel without blocking the event loop.
+        Returns the new value of the channel, raises asyncio.TimeoutError after `timeout` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(channel, value, timestamp_ns):
+            # Runs on the writing thread, the future is completed on the loop's thread
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(value))
+
+        handle = self.on_edge(channel, resolve, edge)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.remove_callback(handle)
+
+    def _on_edge(self, index, value, timestamp_ns):
+        watch = self._watches.get(index)
+        if watch is None:
+            return
+        with watch.condition:
+            if value:
+                watch.rising += 1
+            else:
+                watch.falling += 1
+            watch.condition.notify_all()
+            callbacks = [callback for edge, callback in watch.callbacks.values() if _matches(edge, value)]
+        if not callbacks:
+            return
+        channel = self.pins.name(index)
+        for callback in callbacks:
+            try:
+                callback(channel, value, timestamp_ns)
+            except Exception:
+                # A failing consumer must not break the thread that drives the pin
+                logger.exception("Edge callback failed", extra={'fields': {'channel': channel}})
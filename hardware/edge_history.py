@@ -0,0 +1,99 @@
+import array
+import threading
+import numpy as np
+
+# Edges kept per recorded channel, 2 x 9 bytes each, so about 1.2 MB per channel
+DEFAULT_CAPACITY = 65536
+
+class EdgeHistory:
+    """
+    The last `capacity` edges of a channel as (monotonic timestamp in ns, value) pairs in preallocated arrays,
+    older edges are overwritten. Every edge is stored twice, at i and i + capacity, so the recorded edges are
+    always one contiguous slice and are returned as NumPy views without copying.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        self.capacity = capacity
+        # Edges are stored through the array module, several times faster per item than NumPy scalar assignment,
+        # and read through NumPy arrays sharing the same memory
+        self._timestamp_buffer = array.array('q', bytes(16 * capacity))
+        self._value_buffer = bytearray(2 * capacity)
+        self._timestamps = np.frombuffer(self._timestamp_buffer, dtype=np.int64)
+        self._values = np.frombuffer(self._value_buffer, dtype=np.bool_)
+        # Edges recorded so far, including the overwritten ones
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def record(self, value, timestamp_ns):
+        value = 1 if value else 0
+        with self._lock:
+            i = self.total % self.capacity
+            self._timestamp_buffer[i] = self._timestamp_buffer[i + self.capacity] = timestamp_ns
+            self._value_buffer[i] = self._value_buffer[i + self.capacity] = value
+            self.total += 1
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def dropped(self):
+        """Edges that were overwritten by newer ones."""
+        return self.total - len(self)
+
+    def arrays(self):
+        """
+        (timestamps_ns, values) of the recorded edges, oldest first. Both are views into the buffer: edges recorded
+        later can overwrite them once it wraps, copy them to keep them.
+        """
+        with self._lock:
+            count = len(self)
+            start = (self.total - count) % self.capacity
+            return self._timestamps[start:start + count], self._values[start:start + count]
+
+    @property
+    def timestamps(self):
+        return self.arrays()[0]
+
+    @property
+    def values(self):
+        return self.arrays()[1]
+
+    def periods_ns(self, rising=True):
+        """Time between consecutive rising (or falling) edges in nanoseconds."""
+        timestamps, values = self.arrays()
+        return np.diff(timestamps[values == rising])
+
+    def frequency(self):
+        """Mean frequency in Hz over the recorded rising edges, None with fewer than two of them."""
+        periods = self.periods_ns()
+        if len(periods) == 0:
+            return None
+        return 1e9 / periods.mean()
+
+    def duty_cycle(self):
+        """Fraction of the time the line was high, over the whole periods between the first and last rising edge."""
+        timestamps, values = self.arrays()
+        rising = np.flatnonzero(values)
+        if len(rising) < 2:
+            return None
+        first, last = rising[0], rising[-1]
+        # Recorded edges alternate, so each one's level lasts until the next edge
+        durations = np.diff(timestamps[first:last + 1])
+        return durations[values[first:last]].sum() / durations.sum()
+
+    def jitter(self, nominal_period_ns=None):
+        """
+        Statistics of the periods between rising edges in nanoseconds, None with fewer than two rising edges.
+        Args:
+            nominal_period_ns (int): The expected period the deviations are measured against, the mean by default.
+        """
+        periods = self.periods_ns()
+        if len(periods) == 0:
+            return None
+        mean = periods.mean()
+        deviations = periods - (mean if nominal_period_ns is None else nominal_period_ns)
+        return dict(periods=len(periods), mean_period_ns=float(mean), std_ns=float(periods.std()),
+                    min_period_ns=int(periods.min()), max_period_ns=int(periods.max()),
+                    peak_to_peak_ns=int(np.ptp(periods)), max_deviation_ns=float(np.abs(deviations).max()))
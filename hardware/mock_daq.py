@@ -1,13 +1,31 @@
-import time
-import threading
-from collections import defaultdict
+import logging
+from clocks import MonotonicClock, VirtualClock
+from edge_events import EdgeEvents, ANY
+from edge_history import EdgeHistory, DEFAULT_CAPACITY
+from pin_store import PinStore
+from waveforms import Waveform, WaveformEngine, ToggleStats, CATCH_UP, SKIP, MISSED_EDGE_POLICIES
+
+logger = logging.getLogger(__name__)
 
 class MockDAQDevice:
-    def __init__(self):
-        # Dictionary to store the state of each channel
-        self.digital_pins = defaultdict(lambda: {'direction': None, 'value': False})
-        self._stop_toggle = threading.Event()
-        self._toggle_thread = None #Using this as a Place Holder
+    def __init__(self, clock=None):
+        """
+        Args:
+            clock: The time source of the waveforms and edge timestamps, real time (MonotonicClock) by default.
+                With a VirtualClock time only moves when the clock is advanced, see clocks.py.
+        """
+        self.clock = clock or MonotonicClock()
+        # Values and directions of every configured channel, digital_pins[channel]['value'] still reads and writes a pin
+        self.digital_pins = PinStore(clock=self.clock)
+        # Edge callbacks and waits on the pins, see edge_events.py
+        self.edges = EdgeEvents(self.digital_pins)
+        # Channel -> (EdgeHistory, edge callback handle) of every recorded channel
+        self._histories = {}
+        # One thread plays the waveforms of every channel, see waveforms.py
+        self.waveforms = WaveformEngine(self, self.clock)
+        # Input channel -> output channel of every running start_toggle
+        self._toggles = {}
+        self.toggle_stats = ToggleStats()
 
     def configure_digital_channel(self, channel, direction):
         """
@@ -18,7 +36,19 @@ class MockDAQDevice:
         """
         if direction not in ['input', 'output']:
             raise ValueError("Direction must be either 'input' or 'output'")
-        self.digital_pins[channel]['direction'] = direction
+        self.digital_pins.configure(channel, direction)
+
+    def configure_port(self, port, direction, width=8):
+        """
+        Configure a port of 8, 16 or 32 lines, named '<port>/line0' and up, as either 'input' or 'output'.
+        Args:
+            port (str): The name of the port, e.g. 'Dev1/port0'.
+            direction (str): The direction of every line ('input' or 'output').
+            width (int): The number of lines.
+        """
+        if direction not in ['input', 'output']:
+            raise ValueError("Direction must be either 'input' or 'output'")
+        self.digital_pins.configure_port(port, direction, width)
 
     def write_digital(self, channel, value):
         """
@@ -27,10 +57,7 @@ class MockDAQDevice:
             channel (str): The name of the channel.
             value (bool): The value to write (True or False).
         """
-        if self.digital_pins[channel]['direction'] == 'output':
-            self.digital_pins[channel]['value'] = value
-        else:
-            raise ValueError("Cannot write to an input channel")
+        self.digital_pins.write(channel, value, 'output')
 
     def read_digital(self, channel):
         """
@@ -38,58 +65,189 @@ class MockDAQDevice:
         Args:
             channel (str): The name of the channel.
         Returns:
-            bool: The current value of the channel, or None if not an input.
+            bool: The current value of the channel.
+        """
+        return self.digital_pins.read(channel, 'input')
+
+    def write_port(self, port, value):
+        """
+        Write every line of an output port in one operation.
+        Args:
+            port (str): The name of the port.
+            value (int): The line values, line 0 is the least significant bit.
+        """
+        self.digital_pins.write_port(port, value, 'output')
+
+    def read_port(self, port):
+        """
+        Read every line of an input port in one operation.
+        Args:
+            port (str): The name of the port.
+        Returns:
+            int: The line values, line 0 is the least significant bit.
+        """
+        return self.digital_pins.read_port(port, 'input')
+
+    def on_edge(self, channel, callback, edge=ANY):
+        """
+        Call a function on every rising, falling or any edge of a channel, from the thread that changed it.
+        Args:
+            channel (str): The name of the channel.
+            callback (callable): Called as callback(channel, value, timestamp_ns).
+            edge (str): 'rising', 'falling' or 'any'.
+        Returns:
+            int: A handle for remove_edge_callback.
+        """
+        return self.edges.on_edge(channel, callback, edge)
+
+    def remove_edge_callback(self, handle):
+        """
+        Stop calling an edge callback.
+        Args:
+            handle (int): The handle on_edge returned.
+        """
+        self.edges.remove_callback(handle)
+
+    def wait_for_edge(self, channel, edge=ANY, timeout=None):
+        """
+        Block until the next rising, falling or any edge of a channel.
+        Args:
+            channel (str): The name of the channel.
+            edge (str): 'rising', 'falling' or 'any'.
+            timeout (float): Seconds to wait at most, forever by default.
+        Returns:
+            bool: True on an edge, False on timeout.
         """
-        if self.digital_pins[channel]['direction'] == 'input':
-            return self.digital_pins[channel]['value']
-        else:
-            raise ValueError("Cannot read from an output channel")
+        return self.edges.wait_for_edge(channel, edge, timeout)
 
-    def start_toggle(self, input_channel, output_channel, interval=1.0, tolerance=0.01):
+    async def wait_for_edge_async(self, channel, edge=ANY, timeout=None):
+        """
+        Awaitable wait_for_edge for asyncio consumers, returns the new value of the channel.
+        Raises asyncio.TimeoutError after `timeout` seconds.
+        """
+        return await self.edges.wait_for_edge_async(channel, edge, timeout)
+
+    def record_edges(self, channel, capacity=DEFAULT_CAPACITY):
+        """
+        Start recording the edges of a channel into a ring buffer of the last `capacity` edges.
+        Args:
+            channel (str): The name of the channel.
+            capacity (int): The number of edges kept, memory use is fixed at 18 bytes per edge.
+        Returns:
+            EdgeHistory: The history, also returned by edge_history(channel), a running recording is reused.
+        """
+        if channel in self._histories:
+            return self._histories[channel][0]
+        history = EdgeHistory(capacity)
+        handle = self.on_edge(channel, lambda channel, value, timestamp_ns: history.record(value, timestamp_ns))
+        self._histories[channel] = (history, handle)
+        return history
+
+    def edge_history(self, channel):
+        """
+        The EdgeHistory of a recorded channel.
+        Args:
+            channel (str): The name of the channel.
+        """
+        return self._histories[channel][0]
+
+    def stop_recording(self, channel):
+        """
+        Stop recording the edges of a channel, its history keeps the edges recorded so far.
+        Args:
+            channel (str): The name of the channel.
+        """
+        history, handle = self._histories.pop(channel)
+        self.remove_edge_callback(handle)
+        return history
+
+    def start_waveform(self, channel, waveform, delay=0.0, complement=None, tolerance=0.01, missed_edges=SKIP,
+                       spin=None):
+        """
+        Play a waveform on a configured channel, replacing whatever it played before.
+        Args:
+            channel (str): The name of the channel.
+            waveform (Waveform): The pattern to play, see square_wave, pwm, pulse_train and bit_sequence.
+            delay (float): Seconds until the waveform starts.
+            complement (str): Optional channel that is always driven to the inverse of `channel`.
+            tolerance (float): Edges later than this many seconds are counted as late.
+            missed_edges (str): CATCH_UP or SKIP, what to do with edges the scheduler was too late for.
+            spin (float): Seconds before each edge the scheduler yields the CPU instead of sleeping, by default
+                none for intervals of 1 ms or more.
+        Returns:
+            ToggleStats: The timing statistics of the channel's edges.
+        """
+        for name in (channel, complement):
+            if name is not None:
+                self.digital_pins.index(name)
+        return self.waveforms.add_channel(channel, waveform, delay, complement, tolerance, missed_edges, spin)
+
+    def stop_waveform(self, channel):
+        """
+        Stop the waveform playing on a channel, the channel keeps its last value.
+        Args:
+            channel (str): The name of the channel.
+        """
+        self.waveforms.remove_channel(channel)
+
+    def start_toggle(self, input_channel, output_channel, interval=1.0, tolerance=0.01, missed_edges=SKIP):
         """
         Start toggling a digital input channel at a specified interval.
+        Every pair runs on the shared waveform engine, so several toggles can run at once.
         Args:
             input_channel (str): The name of the input channel.
             output_channel (str): The name of the output channel.
-            interval (float): The interval between toggles in seconds.
-            tolerance (float): The allowed tolerance in seconds.
+            interval (float): The interval between toggles in seconds, sub-millisecond intervals are supported.
+            tolerance (float): Edges later than this many seconds are counted as late in toggle_stats.
+            missed_edges (str): CATCH_UP or SKIP, what to do with edges missed by a whole interval or more.
         """
         if self.digital_pins[input_channel]['direction'] != 'input':
             raise ValueError("Cannot toggle a non-input channel")
         if self.digital_pins[output_channel]['direction'] != 'output':
             raise ValueError("Cannot toggle a non-output channel")
-        self._stop_toggle.clear()
-        self._toggle_thread = threading.Thread(target=self._toggle_pin, args=(input_channel, output_channel, interval, tolerance))
-        self._toggle_thread.start()
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        if missed_edges not in MISSED_EDGE_POLICIES:
+            raise ValueError(f"missed_edges must be one of {MISSED_EDGE_POLICIES}")
+        # The first toggle is due one interval from now and inverts the current value
+        current_value = self.digital_pins[input_channel]['value']
+        waveform = Waveform([(not current_value, interval), (current_value, interval)])
+        self.toggle_stats = self.start_waveform(input_channel, waveform, interval, output_channel, tolerance,
+                                                missed_edges)
+        self._toggles[input_channel] = output_channel
 
-    def stop_toggle(self):
+    def stop_toggle(self, input_channel=None):
         """
         Stop toggling the digital input channel.
+        Args:
+            input_channel (str): The toggle to stop, all of them by default.
         """
-        if self._toggle_thread:
-            self._stop_toggle.set()
-            self._toggle_thread.join()
+        channels = list(self._toggles) if input_channel is None else [input_channel]
+        for channel in channels:
+            if self._toggles.pop(channel, None) is not None:
+                self.waveforms.remove_channel(channel)
+        if not self.waveforms.channels:
+            # Waits for the engine thread to exit
+            self.waveforms.stop()
 
-    def _toggle_pin(self, input_channel, output_channel, interval, tolerance):
+    def _drive_edge(self, channel, value, complement=None, jitter_ns=0):
         """
-        Internal method to toggle the digital input channel.
+        Internal method the waveform engine drives a channel and its complement with.
         Args:
-            input_channel (str): The name of the input channel.
-            output_channel (str): The name of the output channel.
-            interval (float): The interval between toggles in seconds.
-            tolerance (float): The allowed tolerance in seconds.
-        """
-        next_toggle_time = time.time() + interval
-        while not self._stop_toggle.is_set():
-            current_time = time.time()
-            if abs(current_time - next_toggle_time) <= tolerance:
-                current_value = self.digital_pins[input_channel]['value']
-                new_value = not current_value
-                self.digital_pins[input_channel]['value'] = new_value
-                self.digital_pins[output_channel]['value'] = not new_value
-                print(f"Toggling: {input_channel} = {new_value}, {output_channel} = {not new_value}")
-                next_toggle_time += interval
-            time.sleep(tolerance)  # Check in small intervals for more accurate toggling
+            channel (str): The name of the channel.
+            value (bool): The new value of the channel.
+            complement (str): Optional channel driven to the inverse value.
+            jitter_ns (int): How late the edge is against its deadline.
+        """
+        self.digital_pins.write(channel, value)
+        if complement is not None:
+            self.digital_pins.write(complement, not value)
+        # With debug output off no log record is built
+        if logger.isEnabledFor(logging.DEBUG):
+            fields = {channel: value, 'jitter_us': jitter_ns // 1000}
+            if complement is not None:
+                fields[complement] = not value
+            logger.debug("Toggled", extra={'fields': fields, 'sample': 'toggle'})
 
     def set_failure_pin(self, channel, value):
         """
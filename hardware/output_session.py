@@ -0,0 +1,211 @@
+from abc import ABC, abstractmethod
+import threading
+import time
+
+def port_of(channel):
+    """'Dev1/port0' for the line 'Dev1/port0/line3', None for a port or a named pin."""
+    port, _, line = channel.rpartition('/')
+    return port if port and line.startswith('line') else None
+
+class OutputSession(ABC):
+    """
+    Long-lived digital output. A task is configured once per port, or per named pin, and reused by every later write
+    until close(). Lines are written through their port's task: the session keeps the port's value and writes it back
+    with the lines changed, so the lines of one port take a single call and never need overlapping tasks.
+    The session assumes it is the only writer of its ports. Subclasses open, read, write and close the tasks:
+    NIDAQmxOutputSession in NIDAQMX.py on NI hardware, MockOutputSession on a MockDAQDevice.
+    """
+
+    def __init__(self):
+        # Port or pin name -> task
+        self._tasks = {}
+        # Port -> value last written through its task
+        self._port_values = {}
+        # Serializes writes, so read-modify-writes of a port do not overwrite each other
+        self._lock = threading.Lock()
+        self.closed = False
+        self.tasks_opened = 0
+        # Write calls made to the tasks
+        self.calls = 0
+
+    @abstractmethod
+    def _open_task(self, channel):
+        """Configure and start a task writing `channel`, a whole port or a named pin."""
+
+    @abstractmethod
+    def _read(self, task):
+        """The current value of a port task's lines, read once before its first read-modify-write."""
+
+    @abstractmethod
+    def _write(self, task, value):
+        """Write `value`, an integer with one bit per line for a port, in one call."""
+
+    @abstractmethod
+    def _close_task(self, task):
+        """Release a task, called once per task by close()."""
+
+    def _port_of(self, channel):
+        """The port a line is written through, None for channels that are written on their own."""
+        return port_of(channel)
+
+    def _task(self, channel):
+        # Called with the lock held
+        if self.closed:
+            raise RuntimeError("The session is closed")
+        task = self._tasks.get(channel)
+        if task is None:
+            task = self._tasks[channel] = self._open_task(channel)
+            self.tasks_opened += 1
+        return task
+
+    def write(self, channel, value):
+        """
+        Write a line, a named pin or a whole port, through the cached task of the channel or its port.
+        Args:
+            channel (str): The name of the channel.
+            value (bool or int): The value, an integer with one bit per line for a port.
+        """
+        self.write_many({channel: value})
+
+    def write_many(self, values):
+        """
+        Write several channels, all lines of one port in a single call.
+        Args:
+            values (dict): Channel name -> value.
+        Returns:
+            int: The number of write calls made.
+        """
+        # Port -> [(line number, value)]
+        lines = {}
+        channels = []
+        for channel, value in values.items():
+            port = self._port_of(channel)
+            if port:
+                lines.setdefault(port, []).append((int(channel.rpartition('/line')[2]), value))
+            else:
+                channels.append((channel, value))
+        with self._lock:
+            for channel, value in channels:
+                self._write(self._task(channel), value)
+                self._port_values[channel] = int(value)
+            for port, port_lines in lines.items():
+                task = self._task(port)
+                port_value = self._port_values.get(port)
+                if port_value is None:
+                    port_value = self._read(task)
+                for line, value in port_lines:
+                    port_value = port_value | (1 << line) if value else port_value & ~(1 << line)
+                self._write(task, port_value)
+                self._port_values[port] = port_value
+            calls = len(channels) + len(lines)
+            self.calls += calls
+        return calls
+
+    def close(self):
+        """Close every task, later writes raise RuntimeError."""
+        with self._lock:
+            self.closed = True
+            tasks, self._tasks = list(self._tasks.values()), {}
+        for task in tasks:
+            self._close_task(task)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class MockOutputSession(OutputSession):
+    """
+    Output session on a MockDAQDevice. `task_overhead` and `call_overhead` are slept on the device's clock when a
+    task is configured and on every write call, to model the driver's costs and compare write strategies without
+    hardware, instantly on a VirtualClock.
+    """
+
+    def __init__(self, device, task_overhead=0.0, call_overhead=0.0):
+        super().__init__()
+        self.device = device
+        self.task_overhead = task_overhead
+        self.call_overhead = call_overhead
+
+    def _port_of(self, channel):
+        # Lines configured as single channels rather than through configure_port are written on their own
+        port = port_of(channel)
+        if port is None or port in self.device.digital_pins:
+            return None
+        try:
+            self.device.digital_pins.port_width(port)
+        except KeyError:
+            return None
+        return port
+
+    def _open_task(self, channel):
+        pins = self.device.digital_pins
+        is_port = channel not in pins
+        # Unknown channels fail when the task is configured, like DAQmx
+        if is_port:
+            pins.port_width(channel)
+        if self.task_overhead:
+            self.device.clock.sleep(self.task_overhead)
+        return channel, is_port
+
+    def _read(self, task):
+        channel, is_port = task
+        pins = self.device.digital_pins
+        return pins.read_port(channel) if is_port else int(pins.read(channel))
+
+    def _write(self, task, value):
+        if self.call_overhead:
+            self.device.clock.sleep(self.call_overhead)
+        channel, is_port = task
+        if is_port:
+            self.device.digital_pins.write_port(channel, value, 'output')
+        else:
+            self.device.digital_pins.write(channel, value, 'output')
+
+    def _close_task(self, task):
+        pass
+
+def benchmark_writes(device, task_overhead, call_overhead, writes=1000, lines=8):
+    """
+    Pin updates per second on the device's clock for a task per write, a persistent session, and a session writing
+    all `lines` of a port per call. Returns {strategy: (updates per second, wall seconds)}.
+    """
+    clock = device.clock
+    port = 'bench/port0'
+    if f"{port}/line0" not in device.digital_pins:
+        device.configure_port(port, 'output')
+    channels = [f"{port}/line{i}" for i in range(lines)]
+    results = {}
+
+    def measure(name, updates, run):
+        start_ns, wall_start = clock.now_ns(), time.perf_counter()
+        run()
+        results[name] = (updates / ((clock.now_ns() - start_ns) / 1e9), time.perf_counter() - wall_start)
+
+    def task_per_write():
+        for i in range(writes):
+            with MockOutputSession(device, task_overhead, call_overhead) as session:
+                session.write(channels[i % lines], i % 2 == 0)
+
+    def persistent():
+        with MockOutputSession(device, task_overhead, call_overhead) as session:
+            for i in range(writes):
+                session.write(channels[i % lines], i % 2 == 0)
+
+    def batched():
+        with MockOutputSession(device, task_overhead, call_overhead) as session:
+            for i in range(writes // lines):
+                session.write_many({channel: i % 2 == 0 for channel in channels})
+
+    measure('task_per_write', writes, task_per_write)
+    measure('persistent', writes, persistent)
+    measure('batched', writes // lines * lines, batched)
+    return results
+
+if __name__ == "__main__":
+    from clocks import VirtualClock
+    from mock_daq import MockDAQDevice
+    # Rough costs of a USB DAQ: a few milliseconds to create, start and clear a task, tens of microseconds per write
+    for strategy, (rate, wall) in benchmark_writes(MockDAQDevice(VirtualClock()), 0.005, 0.00005).items():
+        print(f"{strategy}: {rate:,.0f} pin updates/s simulated, {wall * 1e3:.1f} ms wall")
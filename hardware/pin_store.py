@@ -0,0 +1,233 @@
+import threading
+from collections.abc import Mapping
+import numpy as np
+from clocks import MonotonicClock
+
+# Direction codes kept per pin
+UNCONFIGURED, INPUT, OUTPUT = 0, 1, 2
+DIRECTION_CODES = {'input': INPUT, 'output': OUTPUT}
+DIRECTION_NAMES = {UNCONFIGURED: None, INPUT: 'input', OUTPUT: 'output'}
+# Line counts of a port, read and written as one integer like a DAQmx CHAN_FOR_ALL_LINES channel
+PORT_WIDTHS = (8, 16, 32)
+# Port values are converted with bytes.translate and int(text, 2), a few C calls where NumPy would need dozens
+_VALUES_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_DIGITS_TO_VALUES = bytes.maketrans(b'01', b'\x00\x01')
+
+class UnknownChannelError(KeyError, ValueError):
+    """Raised for a channel that was never configured, a KeyError for mapping access and a ValueError for the device API."""
+
+class PinView:
+    """The {'direction': ..., 'value': ...} record of one pin, read and written through the store."""
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key):
+        if key == 'value':
+            return self._store._values[self._index] == 1
+        if key == 'direction':
+            return DIRECTION_NAMES[self._store._directions[self._index]]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'value':
+            self._store._set(self._index, 1 if value else 0)
+        elif key == 'direction':
+            with self._store._lock:
+                self._store._directions[self._index] = DIRECTION_CODES[value]
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+class PinStore(Mapping):
+    """
+    Values and direction codes of every pin in two preallocated byte arrays, viewed as NumPy arrays without copying.
+    A pin gets the next free index when it is configured and the lines of a port get consecutive ones,
+    so a single pin is one byte and a whole port is one slice. Unknown names raise UnknownChannelError.
+    As a mapping, store[name] is the pin's {'direction', 'value'} record. Edges are timestamped with `clock`.
+    """
+
+    def __init__(self, capacity=64, clock=None):
+        self._index = {}
+        # Port name -> (first line index, width)
+        self._ports = {}
+        # Held by writes and while pins are added and the arrays reallocated, so no write can land in an array that
+        # is being replaced. Copying a byte or a slice is atomic under the GIL, so reads do without it
+        self._lock = threading.Lock()
+        self._values = bytearray(capacity)
+        self._directions = bytearray(capacity)
+        # Index -> name
+        self._names = []
+        # 1 for pins whose changes are reported to edge_listener(index, value, timestamp_ns), see set_watched
+        self._watched = bytearray(capacity)
+        self.edge_listener = None
+        self.clock = clock or MonotonicClock()
+
+    @property
+    def values(self):
+        """Values of every configured pin as a bool array, in index order. The view is invalidated by growth."""
+        return np.frombuffer(self._values, dtype=np.bool_, count=len(self._index))
+
+    @property
+    def directions(self):
+        """Direction codes (UNCONFIGURED, INPUT, OUTPUT) of every configured pin, in index order."""
+        return np.frombuffer(self._directions, dtype=np.uint8, count=len(self._index))
+
+    def _allocate(self, count):
+        """Indexes for `count` new pins, the arrays are reallocated at twice the size when full."""
+        start = len(self._index)
+        if start + count > len(self._values):
+            capacity = max(2 * len(self._values), start + count)
+            self._values = self._values + bytearray(capacity - len(self._values))
+            self._directions = self._directions + bytearray(capacity - len(self._directions))
+            self._watched = self._watched + bytearray(capacity - len(self._watched))
+        return start
+
+    def configure(self, name, direction):
+        """Add a pin, or change the direction of an existing one. Returns its index."""
+        code = DIRECTION_CODES[direction]
+        with self._lock:
+            index = self._index.get(name)
+            if index is None:
+                index = self._allocate(1)
+                self._index[name] = index
+                self._names.append(name)
+            self._directions[index] = code
+            return index
+
+    def configure_port(self, port, direction, width=8):
+        """Add a port of `width` lines named '<port>/line<i>', or change its direction. Returns its first index."""
+        if width not in PORT_WIDTHS:
+            raise ValueError(f"Port width must be one of {PORT_WIDTHS}")
+        code = DIRECTION_CODES[direction]
+        with self._lock:
+            if port in self._ports:
+                start, existing_width = self._ports[port]
+                if existing_width != width:
+                    raise ValueError(f"Port {port} already has {existing_width} lines")
+            else:
+                lines = [f"{port}/line{i}" for i in range(width)]
+                if any(line in self._index for line in lines):
+                    raise ValueError(f"Lines of port {port} are already configured as single channels")
+                start = self._allocate(width)
+                for i, line in enumerate(lines):
+                    self._index[line] = start + i
+                self._names.extend(lines)
+                self._ports[port] = (start, width)
+            self._directions[start:start + width] = bytes([code]) * width
+            return start
+
+    def index(self, name):
+        try:
+            return self._index[name]
+        except KeyError:
+            raise UnknownChannelError(f"Unknown channel {name}") from None
+
+    def _port(self, port):
+        try:
+            return self._ports[port]
+        except KeyError:
+            raise UnknownChannelError(f"Unknown port {port}") from None
+
+    def direction(self, name):
+        return DIRECTION_NAMES[self._directions[self.index(name)]]
+
+    def name(self, index):
+        return self._names[index]
+
+    def set_watched(self, name, watched):
+        """Report the changes of a pin to edge_listener or stop doing so. Unwatched pins pay nothing for it."""
+        index = self.index(name)
+        with self._lock:
+            self._watched[index] = 1 if watched else 0
+
+    def _set(self, index, value):
+        """Store one pin's value (0 or 1)."""
+        if self._watched[index]:
+            self._set_watched(index, bytes((value,)))
+            return
+        with self._lock:
+            self._values[index] = value
+
+    def _set_lines(self, start, lines):
+        """Store `lines` (one byte per line) from index `start` on, see _set."""
+        if self._watched.find(1, start, start + len(lines)) != -1:
+            self._set_watched(start, lines)
+            return
+        with self._lock:
+            self._values[start:start + len(lines)] = lines
+
+    def _set_watched(self, start, lines):
+        # The old and new values are swapped under the lock so concurrent writers report every change exactly once
+        with self._lock:
+            old_lines = self._values[start:start + len(lines)]
+            self._values[start:start + len(lines)] = lines
+        timestamp_ns = self.clock.now_ns()
+        listener = self.edge_listener
+        if listener is None:
+            return
+        for offset, (old, new) in enumerate(zip(old_lines, lines)):
+            if old != new and self._watched[start + offset]:
+                listener(start + offset, new == 1, timestamp_ns)
+
+    def read(self, name, direction=None):
+        """Value of a pin, with `direction` given the pin has to be configured that way."""
+        index = self._index.get(name)
+        if index is None:
+            raise UnknownChannelError(f"Unknown channel {name}")
+        if direction is not None and self._directions[index] != DIRECTION_CODES[direction]:
+            raise ValueError(f"Cannot read from a non-{direction} channel")
+        return self._values[index] == 1
+
+    def write(self, name, value, direction=None):
+        """Set a pin, with `direction` given the pin has to be configured that way."""
+        index = self._index.get(name)
+        if index is None:
+            raise UnknownChannelError(f"Unknown channel {name}")
+        if direction is not None and self._directions[index] != DIRECTION_CODES[direction]:
+            raise ValueError(f"Cannot write to a non-{direction} channel")
+        self._set(index, 1 if value else 0)
+
+    def read_port(self, port, direction=None):
+        """All lines of a port as one integer, line 0 is the least significant bit."""
+        start, width = self._port(port)
+        if direction is not None:
+            self._check_port_direction(start, width, direction)
+        # One slice copies every line at once, line 0 ends up as the last digit of the binary number
+        lines = self._values[start:start + width]
+        return int(lines[::-1].translate(_VALUES_TO_DIGITS), 2)
+
+    def write_port(self, port, value, direction=None):
+        """Set all lines of a port from one integer, line 0 is the least significant bit."""
+        start, width = self._port(port)
+        if not 0 <= value < 1 << width:
+            raise ValueError(f"Value does not fit in the {width} lines of port {port}")
+        if direction is not None:
+            self._check_port_direction(start, width, direction)
+        self._set_lines(start, format(value, f'0{width}b').encode()[::-1].translate(_DIGITS_TO_VALUES))
+
+    def _check_port_direction(self, start, width, direction):
+        if self._directions.count(DIRECTION_CODES[direction], start, start + width) != width:
+            raise ValueError(f"Every line of the port has to be a {direction} channel")
+
+    def port_width(self, port):
+        return self._port(port)[1]
+
+    def __getitem__(self, name):
+        return PinView(self, self.index(name))
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
@@ -1,8 +1,14 @@
 import time
+import logging
+import numpy as np
 import matplotlib.pyplot as plt
 from mock_daq import MockDAQDevice
+from structured_logging import configure_logging
 
 def main():
+    # Show every toggle of the demo, the device logs them from its toggle thread
+    configure_logging(logging.DEBUG, sample_rates={})
+
     # Initialize the mock DAQ device
     daq_device = MockDAQDevice()
     
@@ -20,30 +26,35 @@ def main():
     # Set up the plot
     plt.ion()
     fig, ax = plt.subplots()
-    times = []
-    pin1_values = []
-    pin2_values = []
-
-    start_time = time.time()
-    while time.time() - start_time < 10:
-        current_time = time.time() - start_time
-        pin1_value = daq_device.read_digital('pin1')
-        pin2_value = daq_device.digital_pins['pin2']['value']
-        times.append(current_time)
-        pin1_values.append(pin1_value)
-        pin2_values.append(pin2_value)
-
-        print(f"Time: {current_time:.2f}s, pin1: {pin1_value}, pin2: {pin2_value}")
-
-        ax.clear()
-        ax.plot(times, pin1_values, label='pin1')
-        ax.plot(times, pin2_values, label='pin2', linestyle='--')
-        ax.set_ylim(-0.1, 1.1)
-        ax.set_xlabel('Time (s)')
-        ax.set_ylabel('Value')
-        ax.legend()
-        plt.draw()
-        plt.pause(0.01)  # Pause to update the plot
+
+    # Every change of the pins is recorded into a ring buffer as it happens, nothing polls the pins
+    start_ns = time.monotonic_ns()
+    initial_values = {'pin1': daq_device.read_digital('pin1'), 'pin2': daq_device.digital_pins['pin2']['value']}
+    histories = {channel: daq_device.record_edges(channel) for channel in initial_values}
+
+    drawn_edges = 0
+    while time.monotonic_ns() - start_ns < 10e9:
+        # Redraw only when an edge arrived, the pause keeps the window responsive
+        edge_count = sum(history.total for history in histories.values())
+        if edge_count != drawn_edges:
+            drawn_edges = edge_count
+            now = (time.monotonic_ns() - start_ns) / 1e9
+            ax.clear()
+            for channel, linestyle in (('pin1', '-'), ('pin2', '--')):
+                timestamps, values = histories[channel].arrays()
+                times = np.concatenate(([0.0], (timestamps - start_ns) / 1e9, [now]))
+                levels = np.concatenate(([initial_values[channel]], values, values[-1:] if len(values) else [initial_values[channel]]))
+                ax.step(times, levels, where='post', label=channel, linestyle=linestyle)
+            ax.set_ylim(-0.1, 1.1)
+            ax.set_xlabel('Time (s)')
+            ax.set_ylabel('Value')
+            ax.legend()
+            plt.draw()
+        plt.pause(0.05)  # Pause to update the plot
+
+    for channel in histories:
+        history = daq_device.stop_recording(channel)
+        print(f"{channel}: {len(history)} edges, {history.frequency()} Hz, duty cycle {history.duty_cycle()}")
 
     #Stop toggling the pin
     daq_device.stop_toggle()
@@ -0,0 +1,82 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+import sys
+from collections import defaultdict
+
+# One in this many records of each sampled event is kept, see SamplingFilter
+DEFAULT_SAMPLE_RATES = {'toggle': 10, 'read': 10}
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: time, level, logger, message and the record's `fields` as key=value pairs."""
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through one in `rate` records of each sampled event. Records are tagged with
+    `extra={'sample': event}`, untagged records and events without a rate always pass.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+        # itertools.count is advanced atomically, so logging threads need no lock
+        self._counters = defaultdict(itertools.count)
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'sample', None))
+        if not rate or rate <= 1:
+            return True
+        return next(self._counters[record.sample]) % rate == 0
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues the record as is, so the message is formatted on the listener thread instead of the caller's."""
+
+    def prepare(self, record):
+        return record
+
+class BackgroundListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() can be called again, e.g. by atexit after an explicit stop."""
+
+    def stop(self):
+        if self._thread:
+            super().stop()
+
+def configure_logging(level=logging.INFO, stream=None, sample_rates=DEFAULT_SAMPLE_RATES):
+    """
+    Route every log record through a queue to a background thread that formats and writes it.
+    Replaces the handlers of an earlier call and returns the QueueListener, stop() flushes it.
+    Args:
+        level (int or str): Root logger level, DEBUG enables the per-toggle and per-read events.
+        stream: Where the listener writes, defaults to stdout.
+        sample_rates (dict): Event name -> keep one in this many records.
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(StructuredFormatter())
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    # Sampled out records are dropped before they reach the queue
+    queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for previous in [h for h in root.handlers if isinstance(h, DeferredQueueHandler)]:
+        root.removeHandler(previous)
+        previous.listener.stop()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = BackgroundListener(log_queue, handler)
+    queue_handler.listener = listener
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,24 +1,42 @@
 import unittest
 import time
-from mock_daq import MockDAQDevice
+from mock_daq import MockDAQDevice, CATCH_UP, SKIP
+from waveforms import square_wave, pwm, pulse_train, bit_sequence, spin_window_ns, SPIN_NS
+from clocks import MonotonicClock, VirtualClock
+from acquisition import ContinuousAcquisition, MockDAQBackend, AcquisitionOverflowError
+from output_session import MockOutputSession, benchmark_writes
+import numpy as np
 import threading
+import asyncio
 
 class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and test management features from unit test
 
     def setUp(self):
         print("\nRunning setUp...")
-        self.daq_device = MockDAQDevice()
-        self.daq_device.configure_digital_channel('pin1', 'input')
-        self.daq_device.configure_digital_channel('pin2', 'output')
-        self.daq_device.configure_digital_channel('failure_pin', 'output')  # New failure indicator pin
-        self.daq_device.write_digital('failure_pin', False)  # Ensure the failure pin starts from FALSE State
-        self.daq_device.digital_pins['pin1']['value'] = False # Ensure the Initial States of the pin starts from FALSE State, in reality this shud come from the hardware
-        self.daq_device.digital_pins['pin2']['value'] = False # Ensure the Initial States of the pin starts from FALSE State 
+        # Time only moves when a test advances the clock, so timing tests are instant and exact
+        self.clock = VirtualClock()
+        self.daq_device = self.create_device(self.clock)
         self.pin_statuses = []  # List to track pin statuses
         print("\nSetup complete: Configured 'pin1' as input, 'pin2' as output, and 'failure_pin' as output.")
         self.threads = []
         self.addCleanup(self.cleanup)  # Register cleanup method
 
+    def create_device(self, clock):
+        """A device with the test pins, on the given clock."""
+        daq_device = MockDAQDevice(clock)
+        daq_device.configure_digital_channel('pin1', 'input')
+        daq_device.configure_digital_channel('pin2', 'output')
+        daq_device.configure_digital_channel('failure_pin', 'output')  # New failure indicator pin
+        daq_device.write_digital('failure_pin', False)  # Ensure the failure pin starts from FALSE State
+        daq_device.digital_pins['pin1']['value'] = False # Ensure the Initial States of the pin starts from FALSE State, in reality this shud come from the hardware
+        daq_device.digital_pins['pin2']['value'] = False # Ensure the Initial States of the pin starts from FALSE State 
+        return daq_device
+
+    def use_real_clock(self):
+        """Replace the device with one on real time, for tests of the scheduler thread itself."""
+        self.clock = MonotonicClock()
+        self.daq_device = self.create_device(self.clock)
+
     def cleanup(self):
         print("\nRunning cleanup...")
         self.daq_device.stop_toggle()
@@ -104,7 +122,7 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
         self.daq_device.start_toggle('pin1', 'pin2', 1.0, tolerance=0.01)
         self.addCleanup(self.daq_device.stop_toggle)  # Ensure toggling stops even if the test fails
 
-        time.sleep(2.1)  # Wait for a little more than 2 seconds to observe two toggles
+        self.clock.sleep(2.1)  # Wait for a little more than 2 seconds to observe two toggles
 
         # Check the state after the first toggle
         pin1_value_first = self.daq_device.read_digital('pin1')
@@ -112,7 +130,7 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
         print(f"State after first toggle - Pin1: {pin1_value_first}, Pin2: {pin2_value_first}")
         self.assertNotEqual(pin1_value_first, pin2_value_first)
 
-        time.sleep(1.1)  # Wait for a little more than 1 second to observe another toggle
+        self.clock.sleep(1.1)  # Wait for a little more than 1 second to observe another toggle
 
         # Check the state after the second toggle
         pin1_value_second = self.daq_device.read_digital('pin1')
@@ -133,11 +151,12 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
     def test_timing_mechanism(self):
         """Validate the timing mechanism with a tolerance."""
         print("Starting timing mechanism test with 1-second interval and 0.01-second tolerance...")
+        history = self.daq_device.record_edges('pin1')
         self.daq_device.start_toggle('pin1', 'pin2', 1.0, tolerance=0.01)
-        start_time = time.time()
+        start_time = self.clock.monotonic()
         self.addCleanup(self.daq_device.stop_toggle)  # Ensure toggling stops and all the threads are joined even if the test fails
-        time.sleep(2.1)  # Wait for a little more than 2 seconds to observe two toggles
-        end_time = time.time()
+        self.clock.sleep(2.1)  # Wait for a little more than 2 seconds to observe two toggles
+        end_time = self.clock.monotonic()
 
         # Calculate elapsed time
         elapsed_time = end_time - start_time
@@ -145,12 +164,454 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
 
         # Check that the elapsed time is close to the expected time (2 seconds) within tolerance
         self.assertAlmostEqual(elapsed_time, 2.1, delta=0.05)  # Allow 50ms tolerance
+        # On the virtual clock every toggle lands exactly on its deadline
+        self.assertEqual((history.timestamps - int(start_time * 1e9)).tolist(), [1_000_000_000, 2_000_000_000])
+        self.assertEqual(self.daq_device.toggle_stats.max_jitter_ns, 0)
         print("Timing mechanism test passed.")
 
         # Stop toggling
         self.daq_device.stop_toggle()
         self.print_latest_pin_status()
 
+    def test_sub_millisecond_toggle(self):
+        """Test that a 1 ms toggle keeps its deadlines and reports the jitter of every edge."""
+        print("Toggling pin1 and pin2 every millisecond for half a second...")
+        self.use_real_clock()
+        start_time = time.monotonic()
+        self.daq_device.start_toggle('pin1', 'pin2', 0.001)
+        time.sleep(0.5)
+        self.daq_device.stop_toggle()
+        elapsed_time = time.monotonic() - start_time
+
+        stats = self.daq_device.toggle_stats
+        print(f"Edges: {stats.edges}, missed: {stats.missed}, mean jitter: {stats.mean_jitter_ns / 1000:.0f} us")
+        # Every deadline is either toggled or recorded as missed, none of them drifts away
+        self.assertAlmostEqual(stats.edges + stats.missed, elapsed_time / 0.001, delta=elapsed_time / 0.001 * 0.1)
+        self.assertGreater(stats.edges, 0)
+        self.assertLess(stats.mean_jitter_ns, 1_000_000)
+        self.assertNotEqual(self.daq_device.read_digital('pin1'), self.daq_device.digital_pins['pin2']['value'])
+
+    def test_spin_window(self):
+        """Test that only sub-millisecond segments make the scheduler spin, and for a tenth of a segment."""
+        self.assertEqual(spin_window_ns(square_wave(10)), 0)
+        self.assertEqual(spin_window_ns(square_wave(500)), 0)
+        self.assertEqual(spin_window_ns(square_wave(1000)), 50_000)
+        self.assertEqual(spin_window_ns(pulse_train(0.00002, 0.01, 5)), 2_000)
+        self.assertEqual(spin_window_ns(square_wave(100, duty=0.8)), 0)
+        self.assertEqual(spin_window_ns(pulse_train(0.0009, 0.1, 5)), 90_000)
+        self.assertLessEqual(spin_window_ns(pwm(100, 0.0001)), SPIN_NS)
+
+        self.daq_device.start_waveform('pin2', square_wave(10), spin=0.00005)
+        self.daq_device.waveforms.set_waveform('pin2', square_wave(5000))
+        self.daq_device.start_waveform('pin1', square_wave(10))
+        self.daq_device.waveforms.set_waveform('pin1', square_wave(5000))
+        channels = self.daq_device.waveforms._channels
+        self.assertEqual((channels['pin1'].spin_ns, channels['pin2'].spin_ns), (0, 50_000))
+        # The window follows a waveform switched at the end of its period, unless it was given explicitly
+        self.clock.advance(0.15)
+        self.assertEqual((channels['pin1'].spin_ns, channels['pin2'].spin_ns), (10_000, 50_000))
+
+    def test_virtual_clock(self):
+        """Test that the virtual clock plays every edge on its deadline without a thread, as often as needed."""
+        print("Toggling every millisecond for 10 virtual seconds, then repeating the toggle test 1000 times...")
+        thread_count = threading.active_count()
+        history = self.daq_device.record_edges('pin1')
+        start_ns = self.clock.now_ns()
+        self.daq_device.start_toggle('pin1', 'pin2', 0.001)
+        self.clock.advance(10)
+        self.daq_device.stop_toggle()
+        self.assertEqual(threading.active_count(), thread_count)
+        self.assertEqual(self.daq_device.toggle_stats.edges, 10_000)
+        self.assertEqual(self.daq_device.toggle_stats.max_jitter_ns, 0)
+        self.assertTrue(np.array_equal(history.timestamps - start_ns, np.arange(1, 10_001) * 1_000_000))
+
+        for _ in range(1000):
+            pin1_value = self.daq_device.read_digital('pin1')
+            self.daq_device.start_toggle('pin1', 'pin2', 1.0)
+            self.clock.sleep(2.1)
+            self.daq_device.stop_toggle()
+            self.assertEqual(self.daq_device.read_digital('pin1'), pin1_value)
+            self.assertNotEqual(self.daq_device.digital_pins['pin2']['value'], pin1_value)
+        with self.assertRaises(ValueError):
+            self.clock.advance(-1)
+
+    def test_missed_edges(self):
+        """Test that edges missed during a stall are skipped and counted, or caught up on."""
+        for missed_edges in (SKIP, CATCH_UP):
+            print(f"Stalling a 10 ms toggle for 55 ms with the {missed_edges} policy...")
+            self.daq_device.digital_pins['pin1']['value'] = False
+            self.daq_device.start_toggle('pin1', 'pin2', 0.01, missed_edges=missed_edges)
+            # The scheduler wakes up 45 ms after the first deadline, when the edges due at 10 to 50 ms are all due
+            self.clock.advance(0.055, latency=0.055)
+            self.clock.advance(0.1)
+            self.daq_device.stop_toggle()
+            stats = self.daq_device.toggle_stats
+            if missed_edges == SKIP:
+                # Only the edge due at 50 ms is emitted, 5 ms late, and the later edges keep their phase
+                self.assertEqual((stats.edges, stats.missed, stats.late, stats.max_jitter_ns), (11, 4, 0, 5_000_000))
+            else:
+                # All five are emitted back to back, 45, 35, 25, 15 and 5 ms late
+                self.assertEqual((stats.edges, stats.missed, stats.late, stats.max_jitter_ns), (15, 0, 4, 45_000_000))
+            # 15 deadlines either way, so pin1 ends up True
+            self.assertTrue(self.daq_device.read_digital('pin1'))
+            self.assertFalse(self.daq_device.digital_pins['pin2']['value'])
+
+        with self.assertRaises(ValueError):
+            self.daq_device.start_toggle('pin1', 'pin2', 0.01, missed_edges='drop')
+
+    def test_concurrent_toggles(self):
+        """Test that a second start_toggle runs alongside the first and stop_toggle stops both."""
+        print("Toggling two pairs of pins at once...")
+        self.daq_device.configure_digital_channel('pin3', 'input')
+        self.daq_device.configure_digital_channel('pin4', 'output')
+        self.daq_device.start_toggle('pin1', 'pin2', 0.01)
+        self.daq_device.start_toggle('pin3', 'pin4', 0.02)
+        self.assertEqual(sorted(self.daq_device.waveforms.channels), ['pin1', 'pin3'])
+        self.clock.sleep(0.1)
+        self.assertEqual(self.daq_device.waveforms.stats('pin1').edges, 10)
+        self.assertEqual(self.daq_device.waveforms.stats('pin3').edges, 5)
+
+        self.daq_device.stop_toggle()
+        self.assertEqual(self.daq_device.waveforms.channels, [])
+        pin1_value = self.daq_device.read_digital('pin1')
+        pin3_value = self.daq_device.read_digital('pin3')
+        self.clock.sleep(0.05)
+        self.assertEqual(self.daq_device.read_digital('pin1'), pin1_value)
+        self.assertEqual(self.daq_device.read_digital('pin3'), pin3_value)
+        self.assertNotEqual(pin3_value, self.daq_device.digital_pins['pin4']['value'])
+
+    def test_waveform_patterns(self):
+        """Test square, PWM, pulse train and bit sequence patterns played side by side."""
+        print("Playing a pulse train, a bit sequence, a square wave and a PWM signal...")
+        for channel in ('pulses', 'bits', 'square', 'pwm'):
+            self.daq_device.configure_digital_channel(channel, 'output')
+        pulse_stats = self.daq_device.start_waveform('pulses', pulse_train(0.002, 0.005, count=4))
+        bit_stats = self.daq_device.start_waveform('bits', bit_sequence([1, 1, 0, 1, 0, 0], 0.002, repeat=1))
+        square_stats = self.daq_device.start_waveform('square', square_wave(100, duty=0.25))
+        self.daq_device.start_waveform('pwm', pwm(100, 1.0))
+        self.clock.sleep(0.05)
+
+        # Finite patterns end on their last value and leave the engine
+        self.assertEqual((pulse_stats.edges, pulse_stats.missed), (8, 0))
+        self.assertEqual((bit_stats.edges, bit_stats.missed), (4, 0))
+        self.assertFalse(self.daq_device.digital_pins['pulses']['value'])
+        self.assertFalse(self.daq_device.digital_pins['bits']['value'])
+        self.assertEqual(sorted(self.daq_device.waveforms.channels), ['pwm', 'square'])
+        self.assertTrue(self.daq_device.digital_pins['pwm']['value'])
+        # Edges at 0, 2.5, 10, 12.5 ... 50 ms
+        self.assertEqual(square_stats.edges, 11)
+
+        self.daq_device.stop_waveform('square')
+        self.assertEqual(self.daq_device.waveforms.channels, ['pwm'])
+        with self.assertRaises(ValueError):
+            self.daq_device.start_waveform('unknown_pin', pwm(100, 0.5))
+        with self.assertRaises(ValueError):
+            square_wave(100, duty=1.0)
+        self.daq_device.waveforms.stop()
+
+    def test_many_channels(self):
+        """Test that one thread drives hundreds of channels."""
+        print("Playing 100 Hz square waves on 200 pins...")
+        self.use_real_clock()
+        channels = [f"line{i}" for i in range(200)]
+        for channel in channels:
+            self.daq_device.configure_digital_channel(channel, 'output')
+        thread_count = threading.active_count()
+        stats = [self.daq_device.start_waveform(channel, square_wave(100)) for channel in channels]
+        self.assertEqual(threading.active_count(), thread_count + 1)
+        time.sleep(0.2)
+        self.daq_device.waveforms.stop()
+
+        # 40 edges per pin in 0.2 s, each of them toggled or recorded as missed
+        for channel_stats in stats:
+            self.assertGreaterEqual(channel_stats.edges + channel_stats.missed, 35)
+        self.assertEqual(threading.active_count(), thread_count)
+
+    def test_port_access(self):
+        """Test that 8, 16 and 32 line ports are read and written as one integer and line by line."""
+        print("Writing and reading whole ports...")
+        for width in (8, 16, 32):
+            self.daq_device.configure_port(f'Dev1/port{width}', 'output', width)
+            value = 0xA5A5A5A5 & ((1 << width) - 1)
+            self.daq_device.write_port(f'Dev1/port{width}', value)
+            self.assertTrue(self.daq_device.digital_pins[f'Dev1/port{width}/line0']['value'])
+            self.assertFalse(self.daq_device.digital_pins[f'Dev1/port{width}/line1']['value'])
+            self.assertEqual(self.daq_device.digital_pins.read_port(f'Dev1/port{width}'), value)
+
+        self.daq_device.configure_port('Dev1/port0', 'input')
+        self.daq_device.digital_pins['Dev1/port0/line7']['value'] = True
+        self.daq_device.digital_pins['Dev1/port0/line1']['value'] = True
+        self.assertEqual(self.daq_device.read_port('Dev1/port0'), 0x82)
+        self.assertTrue(self.daq_device.read_digital('Dev1/port0/line7'))
+
+        with self.assertRaises(ValueError):
+            self.daq_device.write_port('Dev1/port0', 1)
+        with self.assertRaises(ValueError):
+            self.daq_device.read_port('Dev1/port8')
+        with self.assertRaises(ValueError):
+            self.daq_device.write_port('Dev1/port8', 256)
+        with self.assertRaises(ValueError):
+            self.daq_device.configure_port('Dev1/port3', 'output', width=12)
+
+    def test_unknown_channels(self):
+        """Test that unknown channels raise instead of being created on access."""
+        print("Accessing channels that were never configured...")
+        pin_count = len(self.daq_device.digital_pins)
+        with self.assertRaises(ValueError):
+            self.daq_device.read_digital('unknown_pin')
+        with self.assertRaises(ValueError):
+            self.daq_device.write_digital('unknown_pin', True)
+        with self.assertRaises(KeyError):
+            self.daq_device.digital_pins['unknown_pin']['value']
+        self.assertNotIn('unknown_pin', self.daq_device.digital_pins)
+        self.assertEqual(len(self.daq_device.digital_pins), pin_count)
+
+    def test_concurrent_port_writes(self):
+        """Test that a port read never sees half of a concurrent port write."""
+        print("Reading a 32 line port while another thread rewrites it...")
+        self.daq_device.configure_port('Dev1/port0', 'output', width=32)
+        stop = threading.Event()
+        def writer():
+            while not stop.is_set():
+                for value in (0, 0xFFFFFFFF):
+                    self.daq_device.write_port('Dev1/port0', value)
+        writer_thread = threading.Thread(target=writer)
+        self.threads.append(writer_thread)
+        writer_thread.start()
+        try:
+            values = {self.daq_device.digital_pins.read_port('Dev1/port0') for _ in range(5000)}
+        finally:
+            stop.set()
+            writer_thread.join()
+        self.assertLessEqual(values, {0, 0xFFFFFFFF})
+
+    def test_writes_while_growing(self):
+        """Test that no write is lost while configuring new pins reallocates the store."""
+        print("Writing pins from several threads while 2000 pins are added...")
+        channels = [f"writer{i}" for i in range(4)]
+        for channel in channels:
+            self.daq_device.configure_digital_channel(channel, 'output')
+        stop = threading.Event()
+        last_values = {}
+        def writer(channel):
+            value = False
+            while not stop.is_set():
+                value = not value
+                self.daq_device.write_digital(channel, value)
+            last_values[channel] = value
+        writer_threads = [threading.Thread(target=writer, args=(channel,)) for channel in channels]
+        self.threads.extend(writer_threads)
+        for thread in writer_threads:
+            thread.start()
+        try:
+            for i in range(2000):
+                self.daq_device.configure_digital_channel(f"grown{i}", 'input')
+        finally:
+            stop.set()
+            for thread in writer_threads:
+                thread.join()
+        for channel in channels:
+            self.assertEqual(self.daq_device.digital_pins[channel]['value'], last_values[channel])
+
+    def test_edge_callbacks(self):
+        """Test that rising and falling edge callbacks follow the toggling pins and can be removed."""
+        print("Counting the edges of pin1 and pin2 with callbacks...")
+        edges = []
+        rising_handle = self.daq_device.on_edge('pin1', lambda channel, value, timestamp_ns: edges.append((channel, value)),
+                                                'rising')
+        any_handle = self.daq_device.on_edge('pin2', lambda channel, value, timestamp_ns: edges.append((channel, value)))
+        self.daq_device.start_toggle('pin1', 'pin2', 0.005)
+        self.clock.sleep(0.1)
+        self.daq_device.stop_toggle()
+        self.daq_device.remove_edge_callback(rising_handle)
+        self.daq_device.remove_edge_callback(any_handle)
+
+        pin1_edges = [value for channel, value in edges if channel == 'pin1']
+        pin2_edges = [value for channel, value in edges if channel == 'pin2']
+        print(f"pin1 rising edges: {len(pin1_edges)}, pin2 edges: {len(pin2_edges)}")
+        self.assertEqual(len(pin1_edges), 10)
+        self.assertTrue(all(pin1_edges))
+        # pin2 follows every change of pin1 but the first toggle: both pins start out False
+        self.assertEqual(len(pin2_edges), 19)
+        self.assertTrue(all(before != after for before, after in zip(pin2_edges, pin2_edges[1:])))
+        self.assertNotEqual(self.daq_device.read_digital('pin1'), self.daq_device.digital_pins['pin2']['value'])
+
+        # Removed callbacks are not called and unwatched pins are written without edge detection
+        edges.clear()
+        self.daq_device.digital_pins['pin1']['value'] = not self.daq_device.read_digital('pin1')
+        self.assertEqual(edges, [])
+
+    def test_wait_for_edge(self):
+        """Test that wait_for_edge wakes up on a matching edge and times out otherwise."""
+        print("Waiting for edges written by another thread...")
+        def write_later(value):
+            time.sleep(0.02)
+            self.daq_device.write_digital('pin2', value)
+        for value, edge in ((True, 'rising'), (False, 'any')):
+            writer_thread = threading.Thread(target=write_later, args=(value,))
+            self.threads.append(writer_thread)
+            writer_thread.start()
+            self.assertTrue(self.daq_device.wait_for_edge('pin2', edge, timeout=1.0))
+            self.assertEqual(self.daq_device.digital_pins['pin2']['value'], value)
+
+        # Writing the value the pin already has is no edge, and a falling edge never matches 'rising'
+        self.daq_device.write_digital('pin2', False)
+        self.assertFalse(self.daq_device.wait_for_edge('pin2', 'any', timeout=0.02))
+        writer_thread = threading.Thread(target=write_later, args=(True,))
+        self.threads.append(writer_thread)
+        writer_thread.start()
+        self.assertFalse(self.daq_device.wait_for_edge('pin2', 'falling', timeout=0.1))
+        with self.assertRaises(ValueError):
+            self.daq_device.wait_for_edge('pin2', 'sideways', timeout=0.01)
+
+    def test_wait_for_edge_async(self):
+        """Test that the awaitable wait_for_edge resolves on an edge and raises on timeout."""
+        print("Awaiting edges of a toggling pin...")
+        self.use_real_clock()
+        async def wait_for_edges():
+            self.daq_device.start_toggle('pin1', 'pin2', 0.01)
+            rising = await self.daq_device.wait_for_edge_async('pin1', 'rising', timeout=1.0)
+            falling = await self.daq_device.wait_for_edge_async('pin2', 'falling', timeout=1.0)
+            self.daq_device.stop_toggle()
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.daq_device.wait_for_edge_async('pin1', timeout=0.02)
+            return rising, falling
+        self.assertEqual(asyncio.run(wait_for_edges()), (True, False))
+
+    def test_edge_history(self):
+        """Test that recorded edges give the period, frequency and duty cycle of a waveform."""
+        print("Recording a 50 Hz square wave with a 25% duty cycle...")
+        self.daq_device.configure_digital_channel('square', 'output')
+        history = self.daq_device.record_edges('square')
+        self.daq_device.start_waveform('square', square_wave(50, duty=0.25))
+        self.clock.sleep(0.3)
+        self.daq_device.stop_waveform('square')
+        self.daq_device.stop_recording('square')
+
+        timestamps, values = history.arrays()
+        jitter = history.jitter(nominal_period_ns=20_000_000)
+        print(f"Edges: {len(history)}, frequency: {history.frequency():.2f} Hz, duty cycle: {history.duty_cycle():.3f}, "
+              f"jitter: {jitter}")
+        self.assertEqual(len(history), 31)
+        self.assertTrue(np.all(np.diff(timestamps) > 0))
+        self.assertTrue(np.all(values[1:] != values[:-1]))
+        self.assertAlmostEqual(history.frequency(), 50)
+        self.assertAlmostEqual(history.duty_cycle(), 0.25)
+        self.assertEqual(jitter['max_deviation_ns'], 0)
+
+    def test_edge_history_ring_buffer(self):
+        """Test that the history keeps the newest edges in fixed memory and exports them without copying."""
+        print("Recording 100 edges into a history of 8...")
+        history = self.daq_device.record_edges('pin2', capacity=8)
+        buffer_size = history._timestamps.nbytes + history._values.nbytes
+        for i in range(100):
+            self.daq_device.write_digital('pin2', i % 2 == 0)
+
+        timestamps, values = history.arrays()
+        self.assertEqual((len(history), history.dropped), (8, 92))
+        self.assertEqual(values.tolist(), [True, False] * 4)
+        self.assertTrue(np.shares_memory(timestamps, history._timestamps))
+        self.assertTrue(np.all(np.diff(timestamps) >= 0))
+        self.assertEqual(history._timestamps.nbytes + history._values.nbytes, buffer_size)
+        self.assertIs(self.daq_device.record_edges('pin2'), history)
+        self.daq_device.stop_recording('pin2')
+        self.daq_device.write_digital('pin2', True)
+        self.assertEqual(history.total, 100)
+
+    def test_continuous_acquisition(self):
+        """Test that a line and a port are sampled on the sample clock into reused preallocated buffers."""
+        print("Sampling a 100 Hz square wave and an 8 line port at 1 kHz...")
+        self.daq_device.configure_digital_channel('square', 'output')
+        self.daq_device.start_waveform('square', square_wave(100))
+        blocks = []
+        with ContinuousAcquisition(MockDAQBackend(self.daq_device), 'square', 1000, 100, buffer_count=2) as acquisition:
+            acquisition.run(lambda block: blocks.append((block, block.copy())), count=3)
+        # High for the first 5 ms of every 10 ms, the edge at 0 ms is sampled at 0 ms
+        for block, samples in blocks:
+            self.assertEqual(samples.dtype, np.uint32)
+            self.assertEqual(samples.tolist(), ([1] * 5 + [0] * 5) * 10)
+        self.assertIs(blocks[0][0], blocks[2][0])
+        self.assertIsNot(blocks[0][0], blocks[1][0])
+        self.assertEqual(acquisition.samples_read, 300)
+
+        self.daq_device.configure_port('Dev1/port0', 'output')
+        self.daq_device.write_port('Dev1/port0', 0x80)
+        self.daq_device.start_waveform('Dev1/port0/line0', square_wave(100))
+        self.daq_device.start_waveform('Dev1/port0/line1', square_wave(50, start_high=False))
+        with ContinuousAcquisition(MockDAQBackend(self.daq_device), 'Dev1/port0', 1000, 20) as acquisition:
+            samples = np.concatenate([block.copy() for block in acquisition.blocks(2)])
+        line0 = [1] * 5 + [0] * 5
+        line1 = [0] * 10 + [1] * 10
+        expected = [0x80 | bit0 | bit1 << 1 for bit0, bit1 in zip(line0 * 4, line1 * 2)]
+        self.assertEqual(samples.tolist(), expected)
+        with self.assertRaises(RuntimeError):
+            acquisition.read()
+        with self.assertRaises(ValueError):
+            ContinuousAcquisition(MockDAQBackend(self.daq_device), 'unknown_port', 1000, 20).start()
+        # Starting a backend again samples the port afresh instead of adding its lines a second time
+        backend = MockDAQBackend(self.daq_device)
+        backend.start('Dev1/port0', 1000, 100)
+        backend.start('Dev1/port0', 1000, 100)
+        buffer = np.zeros(20, dtype=np.uint32)
+        backend.read_into(buffer, 1.0)
+        backend.stop()
+        self.assertEqual(set(buffer.tolist()), {0x80, 0x81, 0x82, 0x83})
+
+    def test_acquisition_overflow_and_timeout(self):
+        """Test that a reader too slow for the edge history and a read longer than its timeout raise."""
+        print("Overflowing a 4 edge history and timing out a read...")
+        self.daq_device.configure_digital_channel('square', 'output')
+        self.daq_device.start_waveform('square', square_wave(1000))
+        with ContinuousAcquisition(MockDAQBackend(self.daq_device, capacity=4), 'square', 10_000, 100) as acquisition:
+            with self.assertRaises(AcquisitionOverflowError):
+                acquisition.read()
+        with ContinuousAcquisition(MockDAQBackend(self.daq_device), 'square', 10, 100) as acquisition:
+            start_time = self.clock.monotonic()
+            with self.assertRaises(TimeoutError):
+                acquisition.read(timeout=1.0)
+            self.assertEqual(self.clock.monotonic() - start_time, 1.0)
+
+    def test_output_session(self):
+        """Test that a session configures each task once, writes the lines of a port in one call and closes."""
+        print("Writing through a persistent output session...")
+        self.daq_device.configure_port('Dev1/port0', 'output')
+        session = MockOutputSession(self.daq_device, task_overhead=0.005, call_overhead=0.00005)
+        start_time = self.clock.monotonic()
+        for i in range(100):
+            session.write('failure_pin', i % 2 == 0)
+        self.assertEqual((session.tasks_opened, session.calls), (1, 100))
+        self.assertAlmostEqual(self.clock.monotonic() - start_time, 0.005 + 100 * 0.00005)
+        self.assertFalse(self.daq_device.digital_pins['failure_pin']['value'])
+
+        # The two lines go out in one call through the port's task, pin2 through its own
+        self.daq_device.write_port('Dev1/port0', 0x80)
+        calls = session.write_many({'Dev1/port0/line0': True, 'Dev1/port0/line3': True, 'pin2': True})
+        self.assertEqual(calls, 2)
+        self.assertEqual(self.daq_device.digital_pins.read_port('Dev1/port0'), 0b10001001)
+        self.assertTrue(self.daq_device.digital_pins['pin2']['value'])
+        # Any other set of lines, and the whole port, reuse the same task
+        session.write_many({'Dev1/port0/line3': False, 'Dev1/port0/line1': True})
+        self.assertEqual(self.daq_device.digital_pins.read_port('Dev1/port0'), 0b10000011)
+        session.write('Dev1/port0', 0xA5)
+        session.write('Dev1/port0/line1', True)
+        self.assertEqual(self.daq_device.digital_pins.read_port('Dev1/port0'), 0xA7)
+        self.assertEqual(session.tasks_opened, 3)
+
+        with self.assertRaises(ValueError):
+            session.write('pin1', True)
+        with self.assertRaises(ValueError):
+            session.write('unknown_pin', True)
+        with session:
+            pass
+        with self.assertRaises(RuntimeError):
+            session.write('failure_pin', True)
+
+        # The same pin updates through a task per write, a persistent session and batched port writes
+        results = benchmark_writes(self.daq_device, 0.005, 0.00005, writes=400)
+        print({strategy: f"{rate:,.0f} updates/s" for strategy, (rate, _) in results.items()})
+        self.assertGreater(results['persistent'][0], 10 * results['task_per_write'][0])
+        self.assertGreater(results['batched'][0], 3 * results['persistent'][0])
+
     def test_invalid_operations(self):
         """Test invalid write and read operations."""
         print("Testing invalid operations...")
@@ -186,14 +647,14 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
         
         def mock_external_signal_generator(device, channel, interval=1.0, duration=5.0):
             """Mock function to simulate an external signal generator."""
-            start_time = time.time()
-            while time.time() - start_time < duration:
+            start_time = self.clock.monotonic()
+            while self.clock.monotonic() - start_time < duration:
                 current_value = device.read_digital(channel)
                 new_value = not current_value  # Toggle the current value
                 device.digital_pins[channel]['value'] = new_value
                 state_changes_pin1.append(new_value)  # Capture state changes
                 print(f"External signal generator toggled {channel} to {new_value}")
-                time.sleep(interval)
+                self.clock.sleep(interval)
 
         # Read initial state of pin1
         initial_state = self.daq_device.read_digital('pin1')
@@ -207,12 +668,11 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
         self.threads.append(external_signal_thread)
         external_signal_thread.start()
         #print(f"Threads list after append: {self.threads}")
-        time.sleep(6)  # Wait enough time to observe multiple toggles
+        external_signal_thread.join()  # The generator thread moves the clock, its 5 seconds pass in no time
 
         # Verify the final state of the pin
         pin1_final = self.daq_device.read_digital('pin1')
         print(f"Final state of Pin1 after external signal simulation: {pin1_final}")
-        external_signal_thread.join()
         print("External signal generator simulation test for pin1 passed.")
         self.print_latest_pin_status()
 
@@ -235,14 +695,14 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
         
         def mock_external_signal_generator(device, channel, interval=1.0, duration=5.0):
             """Mock function to simulate an external signal generator."""
-            start_time = time.time()
-            while time.time() - start_time < duration:
+            start_time = self.clock.monotonic()
+            while self.clock.monotonic() - start_time < duration:
                 current_value = device.digital_pins[channel]['value']
                 new_value = not current_value  # Toggle the current value
                 device.digital_pins[channel]['value'] = new_value
                 state_changes_pin2.append(new_value)  # Capture state changes
                 print(f"External signal generator toggled {channel} to {new_value}")
-                time.sleep(interval)
+                self.clock.sleep(interval)
 
         # Read initial state of pin1
         initial_state = self.daq_device.digital_pins['pin2']['value']
@@ -256,12 +716,11 @@ class TestMockDAQDevice(unittest.TestCase):  #To Use the assertion methods and t
         self.threads.append(external_signal_thread)
         external_signal_thread.start()
         #print(f"Threads list after append: {self.threads}")
-        time.sleep(6)  # Wait enough time to observe multiple toggles
+        external_signal_thread.join()  # The generator thread moves the clock, its 5 seconds pass in no time
 
         # Verify the final state of the pin
         pin2_final = self.daq_device.digital_pins['pin2']['value']
         print(f"Final state of Pin2 after external signal simulation: {pin2_final}")
-        external_signal_thread.join()
         print("External signal generator simulation test for pin2 passed.")
         self.print_latest_pin_status()
 
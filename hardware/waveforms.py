@@ -0,0 +1,301 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from clocks import MonotonicClock
+
+# What the scheduler does with edges that are already superseded by the next edge of their channel when it gets to
+# them: CATCH_UP emits every one of them back to back, SKIP drops them (counted in ToggleStats.missed) and keeps
+# the phase
+CATCH_UP = 'catch_up'
+SKIP = 'skip'
+MISSED_EDGE_POLICIES = (CATCH_UP, SKIP)
+# The scheduler can stop sleeping shortly before a deadline and yield the CPU until it is due, which costs CPU time
+# but avoids the OS's wake-up latency. Waveforms with segments of SPIN_BELOW_NS or longer do not need it, shorter
+# ones spin for a tenth of their shortest segment, at most SPIN_NS.
+SPIN_NS = 100_000
+SPIN_BELOW_NS = 1_000_000
+
+def spin_window_ns(waveform):
+    """Nanoseconds the scheduler yields the CPU before each deadline of `waveform` by default."""
+    shortest_ns = min(waveform.durations_ns)
+    return 0 if shortest_ns >= SPIN_BELOW_NS else min(SPIN_NS, shortest_ns // 10)
+
+class ToggleStats:
+    """Timing of the edges produced on one channel, jitter is the delay of an edge past its deadline."""
+
+    def __init__(self, recent=1000):
+        self.edges = 0
+        # Edges dropped under the SKIP policy
+        self.missed = 0
+        # Edges later than the channel's tolerance
+        self.late = 0
+        self.max_jitter_ns = 0
+        self.total_jitter_ns = 0
+        # Jitter of the most recent edges, oldest first
+        self.recent_jitter_ns = deque(maxlen=recent)
+
+    def record(self, jitter_ns, tolerance_ns):
+        self.edges += 1
+        if jitter_ns > tolerance_ns:
+            self.late += 1
+        self.max_jitter_ns = max(self.max_jitter_ns, jitter_ns)
+        self.total_jitter_ns += jitter_ns
+        self.recent_jitter_ns.append(jitter_ns)
+
+    @property
+    def mean_jitter_ns(self):
+        return self.total_jitter_ns / self.edges if self.edges else 0.0
+
+class Waveform:
+    """
+    A pattern of (value, duration) segments, played `repeat` times or forever when `repeat` is None.
+    Args:
+        segments (list): (value, duration in seconds) pairs, adjacent segments with the same value are merged.
+        repeat (int): How many times the pattern is played, the last value is then held.
+    """
+
+    def __init__(self, segments, repeat=None):
+        merged = []
+        for value, duration in segments:
+            if duration <= 0:
+                raise ValueError("Segment durations must be positive")
+            if merged and merged[-1][0] == bool(value):
+                merged[-1][1] += duration
+            else:
+                merged.append([bool(value), duration])
+        if not merged:
+            raise ValueError("A waveform needs at least one segment")
+        if repeat is not None and repeat < 1:
+            raise ValueError("repeat must be at least 1")
+        self.values = [value for value, _ in merged]
+        self.durations_ns = [max(int(duration * 1e9), 1) for _, duration in merged]
+        self.repeat = repeat
+
+    @property
+    def period(self):
+        return sum(self.durations_ns) / 1e9
+
+def square_wave(frequency, duty=0.5, start_high=True):
+    """Square wave of `frequency` Hz, high for `duty` of every period."""
+    if not 0 < duty < 1:
+        raise ValueError("Duty cycle must be between 0 and 1, exclusive")
+    period = 1.0 / frequency
+    high, low = (True, duty * period), (False, (1 - duty) * period)
+    return Waveform([high, low] if start_high else [low, high])
+
+def pwm(frequency, duty):
+    """PWM signal of `frequency` Hz, a duty cycle of 0 or 1 holds the line low or high."""
+    if not 0 <= duty <= 1:
+        raise ValueError("Duty cycle must be between 0 and 1")
+    period = 1.0 / frequency
+    if duty in (0, 1):
+        return Waveform([(duty == 1, period)])
+    return square_wave(frequency, duty)
+
+def pulse_train(width, period, count):
+    """`count` high pulses of `width` seconds, one every `period` seconds, the line is then held low."""
+    if not 0 < width < period:
+        raise ValueError("Pulse width must be positive and shorter than the period")
+    return Waveform([(True, width), (False, period - width)], repeat=count)
+
+def bit_sequence(bits, bit_time, repeat=None):
+    """Plays `bits` (any truthy/falsy values) with `bit_time` seconds per bit."""
+    return Waveform([(bit, bit_time) for bit in bits], repeat=repeat)
+
+class _Channel:
+    def __init__(self, name, waveform, deadline_ns, complement, tolerance_ns, missed_edges, spin_ns):
+        self.name = name
+        self.waveform = waveform
+        # Fixed spin window, None follows the waveform, see spin_window_ns
+        self.fixed_spin_ns = spin_ns
+        self.spin_ns = spin_window_ns(waveform) if spin_ns is None else spin_ns
+        # Waveform that replaces this one at the start of its next period, see WaveformEngine.set_waveform
+        self.pending_waveform = None
+        self.complement = complement
+        self.tolerance_ns = tolerance_ns
+        self.missed_edges = missed_edges
+        self.deadline_ns = deadline_ns
+        self.segment = 0
+        self.cycle = 0
+        self.active = True
+        self.stats = ToggleStats()
+
+    def advance(self):
+        """Move to the next segment, returns False once a finite waveform has played its last one."""
+        self.deadline_ns += self.waveform.durations_ns[self.segment]
+        self.segment += 1
+        if self.segment == len(self.waveform.values):
+            self.segment = 0
+            self.cycle += 1
+            if self.pending_waveform:
+                self.waveform, self.pending_waveform = self.pending_waveform, None
+                self.cycle = 0
+                if self.fixed_spin_ns is None:
+                    self.spin_ns = spin_window_ns(self.waveform)
+            if self.waveform.repeat is not None and self.cycle >= self.waveform.repeat:
+                return False
+        return True
+
+class WaveformEngine:
+    """
+    Drives any number of channels of a MockDAQDevice from a single thread. Upcoming edges are kept in a heap
+    ordered by deadline, so the cost of an edge grows with the log of the channel count and an idle channel
+    costs nothing. The thread sleeps until the earliest deadline and exits when no channel is left.
+    On a VirtualClock no thread is started, the clock's advance() plays the due edges instead.
+    """
+
+    def __init__(self, device, clock=None):
+        self.device = device
+        self.clock = clock or MonotonicClock()
+        self._channels = {}
+        # (deadline_ns, sequence, channel), channels that were removed are dropped when they reach the top
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def add_channel(self, channel, waveform, delay=0.0, complement=None, tolerance=0.01, missed_edges=SKIP,
+                    spin=None):
+        """
+        Play `waveform` on `channel`, replacing whatever it played before.
+        Args:
+            channel (str): The name of the channel.
+            waveform (Waveform): The pattern to play.
+            delay (float): Seconds until the first segment starts, the channel keeps its value until then.
+            complement (str): Optional channel that is always driven to the inverse of `channel`.
+            tolerance (float): Edges later than this many seconds are counted as late.
+            missed_edges (str): CATCH_UP or SKIP.
+            spin (float): Seconds before each deadline the thread yields the CPU in a loop instead of sleeping,
+                by default none for segments of 1 ms or more, see spin_window_ns.
+        Returns:
+            ToggleStats: The timing statistics of the channel.
+        """
+        if missed_edges not in MISSED_EDGE_POLICIES:
+            raise ValueError(f"missed_edges must be one of {MISSED_EDGE_POLICIES}")
+        with self._condition:
+            self._remove(channel)
+            state = _Channel(channel, waveform, self.clock.now_ns() + int(delay * 1e9), complement,
+                             int(tolerance * 1e9), missed_edges, None if spin is None else int(spin * 1e9))
+            self._channels[channel] = state
+            heapq.heappush(self._heap, (state.deadline_ns, next(self._sequence), state))
+            if self.clock.virtual:
+                self.clock.attach(self)
+            elif self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="WaveformEngine", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return state.stats
+
+    def set_waveform(self, channel, waveform):
+        """Switch `channel` to `waveform` at the end of the current period, e.g. to change a PWM duty cycle."""
+        with self._condition:
+            self._channels[channel].pending_waveform = waveform
+
+    def remove_channel(self, channel):
+        """Stop playing on `channel`, which keeps its last value. Returns False if nothing was playing."""
+        with self._condition:
+            removed = self._remove(channel)
+            self._condition.notify()
+            return removed
+
+    def _remove(self, channel):
+        state = self._channels.pop(channel, None)
+        if state:
+            state.active = False
+        return state is not None
+
+    def stats(self, channel):
+        return self._channels[channel].stats
+
+    @property
+    def channels(self):
+        with self._condition:
+            return list(self._channels)
+
+    def __contains__(self, channel):
+        return channel in self._channels
+
+    def stop(self):
+        """Remove every channel and wait for the thread to exit."""
+        with self._condition:
+            for channel in list(self._channels):
+                self._remove(channel)
+            self._heap.clear()
+            self._condition.notify()
+            thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join()
+
+    def next_deadline_ns(self):
+        """The earliest upcoming deadline, None when nothing is playing. Used by VirtualClock.advance."""
+        with self._condition:
+            self._drop_removed()
+            return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now_ns):
+        """Play every edge due by `now_ns`, the VirtualClock counterpart of the thread's wake-ups."""
+        with self._condition:
+            edges = self._collect_due(now_ns)
+        self._drive(edges)
+
+    def _drop_removed(self):
+        # Channels removed since they were scheduled are dropped here
+        while self._heap and not self._heap[0][2].active:
+            heapq.heappop(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._drop_removed()
+                if not self._heap:
+                    if not self._channels:
+                        self._thread = None
+                        return
+                    self._condition.wait()
+                    continue
+                now_ns = self.clock.now_ns()
+                deadline_ns, _, state = self._heap[0]
+                remaining_ns = deadline_ns - now_ns
+                if remaining_ns > state.spin_ns:
+                    # Sleep until the deadline, or shortly before it for short segments. Adding a channel wakes
+                    # the thread to reschedule.
+                    self._condition.wait((remaining_ns - state.spin_ns) / 1e9)
+                    continue
+                edges = self._collect_due(now_ns) if remaining_ns <= 0 else None
+            if edges is None:
+                # The OS wakes sleepers up tens of microseconds late, the last stretch yields the CPU in a loop
+                time.sleep(0)
+                continue
+            self._drive(edges)
+
+    def _drive(self, edges):
+        # Pins are driven without the lock, so callbacks of the device may add or remove channels
+        for state, value, jitter_ns in edges:
+            self.device._drive_edge(state.name, value, state.complement, jitter_ns)
+            state.stats.record(jitter_ns, state.tolerance_ns)
+
+    def _collect_due(self, now_ns):
+        """Pop every edge due by `now_ns` in deadline order, returns (channel, value, jitter_ns) triples."""
+        edges = []
+        while self._heap and self._heap[0][0] <= now_ns:
+            deadline_ns, _, state = heapq.heappop(self._heap)
+            if not state.active:
+                continue
+            value = state.waveform.values[state.segment]
+            playing = state.advance()
+            if state.missed_edges == SKIP:
+                # An edge whose successor is already due as well would only be visible for an instant
+                while playing and state.deadline_ns <= now_ns:
+                    state.stats.missed += 1
+                    deadline_ns = state.deadline_ns
+                    value = state.waveform.values[state.segment]
+                    playing = state.advance()
+            edges.append((state, value, now_ns - deadline_ns))
+            if playing:
+                heapq.heappush(self._heap, (state.deadline_ns, next(self._sequence), state))
+            else:
+                # A finite waveform holds its last value
+                self._remove(state.name)
+        return edges
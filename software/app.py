@@ -1,48 +1,266 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 import numpy as np
-from PIL import Image
+import os
+import signal
+import threading
+import time
 import uuid
+from components import image_codec
 from components.camera import CameraMock
 from components.ai import AISystemMock
 from components.database import Database
+from components.frame_store import FrameStore
+from components.metrics import MetricsRegistry
+from components.prediction_cache import PredictionCache
+from components.structured_logging import configure_logging
+
+# Log records are formatted and written by a background thread, INSPECTION_LOG_LEVEL=DEBUG adds per-frame detail
+configure_logging(os.environ.get("INSPECTION_LOG_LEVEL", "INFO"))
 
 app = Flask(__name__)
-CORS(app)
+# The browser front-end needs to read the headers describing binary images
+CORS(app, expose_headers=[image_codec.SHAPE_HEADER, image_codec.DTYPE_HEADER, 'X-Image-UUID'])
+
+# Timings, queue depths and in-flight counts exposed by /metrics. Under gunicorn every worker process keeps its own,
+# the worker label (its pid) tells the series of the workers apart so they can be summed when scraped.
+metrics = MetricsRegistry(worker=os.getpid())
+
+# Initialize the camera and AI system. Under gunicorn (gunicorn.conf.py) every worker process imports this module
+# and so gets its own components and its own SQLite connection.
+camera = CameraMock(metrics=metrics)
+ai_system = AISystemMock(metrics=metrics)
+# Results are buffered and written in batches, /shutdown flushes whatever is left
+database = Database(os.environ.get("INSPECTION_DB", "test_results.db"), batch_size=100, flush_interval=1.0,
+                    metrics=metrics)
+# Captured frames are kept server side so they can be predicted by image_UUID without sending them back
+frame_store = FrameStore(max_frames=1000, ttl=60.0)
+metrics.gauge('frame_store_frames', 'Captured frames held for prediction by image_UUID', lambda: len(frame_store))
+# Verdicts of frames posted to /predict_defect, a frame that is sent again is answered without predicting it.
+# INSPECTION_PREDICTION_CACHE sets the number of cached verdicts, 0 disables the cache.
+prediction_cache_size = int(os.environ.get("INSPECTION_PREDICTION_CACHE", 10000))
+prediction_cache = PredictionCache(prediction_cache_size) if prediction_cache_size > 0 else None
+if prediction_cache is not None:
+    metrics.gauge('prediction_cache_hits', 'Predictions answered from the cache', lambda: prediction_cache.hits)
+    metrics.gauge('prediction_cache_misses', 'Predictions missing from the cache', lambda: prediction_cache.misses)
+    metrics.gauge('prediction_cache_entries', 'Verdicts held by the prediction cache', lambda: len(prediction_cache))
+
+# Image and JSON (de)serialization per transport format
+decode_histograms = {
+    fmt: metrics.histogram('request_decode_seconds', 'Duration of decoding the request image in seconds', format=fmt)
+    for fmt in ('json', 'raw', 'png')
+}
+encode_histograms = {
+    fmt: metrics.histogram('response_encode_seconds', 'Duration of encoding the response body in seconds', format=fmt)
+    for fmt in ('json', 'raw', 'png')
+}
+DECODE_FORMATS = {image_codec.OCTET_STREAM: 'raw', image_codec.PNG: 'png'}
+
+in_flight_lock = threading.Lock()
+in_flight = 0
+metrics.gauge('http_requests_in_flight', 'Requests being handled by this process', lambda: in_flight)
+
+@app.before_request
+def start_request():
+    global in_flight
+    with in_flight_lock:
+        in_flight += 1
+    g.request_start = time.perf_counter()
+
+@app.teardown_request
+def finish_request(error=None):
+    global in_flight
+    with in_flight_lock:
+        in_flight -= 1
+    if request.endpoint and request.endpoint != 'metrics_route':
+        metrics.histogram('http_request_seconds', 'Duration of handling a request in seconds',
+                          route=request.endpoint).observe(time.perf_counter() - g.request_start)
+
+def encode_json(**fields):
+    """jsonify, timed as the JSON response encoding."""
+    with encode_histograms['json'].time():
+        return jsonify(**fields)
 
-# Initialize the camera and AI system
-camera = CameraMock()
-ai_system = AISystemMock()
-database = Database("test_results.db")
+def decode_request_image():
+    """Read the frame from the request body in whichever format the client sent it."""
+    with decode_histograms[DECODE_FORMATS.get(request.mimetype, 'json')].time():
+        return _decode_request_image()
+
+def _decode_request_image():
+    if request.mimetype == image_codec.OCTET_STREAM:
+        return image_codec.from_raw(
+            request.get_data(),
+            request.headers.get(image_codec.SHAPE_HEADER),
+            request.headers.get(image_codec.DTYPE_HEADER, 'uint8'),
+        )
+    if request.mimetype == image_codec.PNG:
+        return image_codec.from_png(request.get_data())
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("The request body must be a JSON object")
+    if 'raw_image' not in data and 'raw_image_b64' not in data and 'image_UUID' in data:
+        if not isinstance(data['image_UUID'], str):
+            raise ValueError("image_UUID must be a string")
+        # Frame captured earlier by this server, None if it was evicted or never existed
+        return frame_store.get(data['image_UUID'])
+    if 'raw_image_b64' in data:
+        return image_codec.from_base64(data)
+    if 'raw_image' not in data:
+        raise ValueError("raw_image, raw_image_b64 or image_UUID is required")
+    # Legacy nested list format used by the front-end
+    return image_codec.from_list(data['raw_image'])
+
+def log_prediction(defect_present, latency_ms, image_uuid=None, prediction_uuid=None, low_lighting=None):
+    """Buffer a prediction for the results table, the API has no integer image IDs so that column stays empty."""
+    database.log_result(None, defect_present, image_uuid=image_uuid, prediction_uuid=prediction_uuid,
+                        low_lighting=low_lighting, latency_ms=latency_ms)
+
+def requested_resolution(data):
+    """Optional (height, width) frame size of a capture request, None keeps the camera's own."""
+    resolution = data.get('resolution')
+    if resolution is None:
+        return None
+    if not (isinstance(resolution, list) and len(resolution) == 2 and all(isinstance(dim, int) for dim in resolution)):
+        raise ValueError("resolution must be [height, width]")
+    return tuple(resolution)
 
 @app.route('/capture_image', methods=['POST'])
 def capture_image():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     with_defect = data.get('with_defect', False)
     low_lighting = data.get('low_lighting', False)
     
-    image = camera.capture(with_defect, low_lighting)
+    try:
+        image = camera.capture(with_defect, low_lighting, requested_resolution(data))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     image_array = np.array(image)
     image_uuid = uuid.uuid4()
+    frame_store.put(str(image_uuid), image_array)
 
-    # Convert image data to list for JSON serialization
-    raw_image = image_array.tolist()
+    # Binary formats are picked through the Accept header, JSON stays the default
+    content_type = request.accept_mimetypes.best_match(
+        [image_codec.JSON, image_codec.OCTET_STREAM, image_codec.PNG], default=image_codec.JSON)
+    if content_type == image_codec.OCTET_STREAM:
+        with encode_histograms['raw'].time():
+            body, headers = image_codec.to_raw(image_array)
+        headers['X-Image-UUID'] = str(image_uuid)
+        return Response(body, mimetype=content_type, headers=headers)
+    if content_type == image_codec.PNG:
+        with encode_histograms['png'].time():
+            body = image_codec.to_png(image_array)
+        return Response(body, mimetype=content_type, headers={'X-Image-UUID': str(image_uuid)})
+    if data.get('encoding') == 'base64':
+        with encode_histograms['json'].time():
+            return jsonify(image_UUID=str(image_uuid), **image_codec.to_base64(image_array))
 
-    return jsonify(raw_image=raw_image, image_UUID=str(image_uuid))
+    # Convert image data to list for JSON serialization
+    with encode_histograms['json'].time():
+        return jsonify(raw_image=image_array.tolist(), image_UUID=str(image_uuid))
 
 @app.route('/predict_defect', methods=['POST'])
 def predict_defect():
-    data = request.json
-    raw_image = data['raw_image']
-    image = Image.fromarray(np.array(raw_image, dtype=np.uint8))
+    try:
+        image_array = decode_request_image()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if image_array is None:
+        return jsonify(error="Unknown or expired image_UUID"), 404
     
-    defect_present = ai_system.predict(image).item()
+    predict_start = time.perf_counter()
+    if prediction_cache is not None:
+        key = prediction_cache.key(image_array, ai_system.config_key)
+        defect_present = prediction_cache.get_or_compute(key, lambda: bool(ai_system.predict(image_array)))
+    else:
+        defect_present = bool(ai_system.predict(image_array))
+    latency_ms = (time.perf_counter() - predict_start) * 1000
     prediction_uuid = uuid.uuid4()
 
-    return jsonify(has_defect=defect_present, prediction_UUID=str(prediction_uuid))
+    # Binary bodies carry the image UUID as a header, JSON bodies as a field
+    data = request.get_json(silent=True) or {}
+    log_prediction(defect_present, latency_ms, data.get('image_UUID', request.headers.get('X-Image-UUID')),
+                   str(prediction_uuid), data.get('low_lighting'))
+
+    return encode_json(has_defect=defect_present, prediction_UUID=str(prediction_uuid))
+
+@app.route('/capture_and_predict', methods=['POST'])
+def capture_and_predict():
+    data = request.get_json(silent=True) or {}
+    with_defect = data.get('with_defect', False)
+    low_lighting = data.get('low_lighting', False)
+
+    try:
+        image_array = np.array(camera.capture(with_defect, low_lighting, requested_resolution(data)))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    image_uuid = uuid.uuid4()
+    frame_store.put(str(image_uuid), image_array)
+
+    # The frame never leaves the server, only the verdict is returned
+    predict_start = time.perf_counter()
+    defect_present = bool(ai_system.predict(image_array))
+    latency_ms = (time.perf_counter() - predict_start) * 1000
+    prediction_uuid = uuid.uuid4()
+    log_prediction(defect_present, latency_ms, str(image_uuid), str(prediction_uuid), low_lighting)
+
+    return encode_json(has_defect=defect_present, image_UUID=str(image_uuid), prediction_UUID=str(prediction_uuid))
+
+@app.route('/predict_defect_batch', methods=['POST'])
+def predict_defect_batch():
+    with decode_histograms['json'].time():
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or 'raw_images' not in data:
+            return jsonify(error="raw_images is required"), 400
+        # Frames of a batch share one size, stack them into a single (N, H, W) array
+        try:
+            images = image_codec.from_batch(data['raw_images'])
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+    predict_start = time.perf_counter()
+    results = ai_system.predict_batch(images)
+    # Latency is amortized over the frames of the batch
+    latency_ms = (time.perf_counter() - predict_start) * 1000 / max(len(results), 1)
+
+    predictions = []
+    for defect_present, bounding_box in results:
+        prediction_uuid = str(uuid.uuid4())
+        log_prediction(defect_present, latency_ms, prediction_uuid=prediction_uuid)
+        predictions.append(dict(
+            has_defect=defect_present,
+            bounding_box=list(bounding_box) if bounding_box else None,
+            prediction_UUID=prediction_uuid,
+        ))
+
+    return encode_json(predictions=predictions)
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    # Aggregates over the last `last` seconds (one hour by default) in `window` second buckets
+    try:
+        window = float(request.args.get('window', 60))
+        last = float(request.args.get('last', 3600))
+    except ValueError:
+        return jsonify(error="window and last must be numbers of seconds"), 400
+    if window <= 0:
+        return jsonify(error="window must be positive"), 400
+
+    return jsonify(database.stats(window=window, since=time.time() - last))
+
+@app.route('/metrics', methods=['GET'], endpoint='metrics_route')
+def metrics_route():
+    # Prometheus text exposition format, per worker process under gunicorn
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/shutdown', methods=['POST'])
 def shutdown():
+    if request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        # Ask the gunicorn master for a graceful stop: every worker finishes its in-flight requests
+        # and flushes its own results in the worker_exit hook
+        os.kill(os.getppid(), signal.SIGTERM)
+        return 'Server shutting down...'
+
     database.close()
 
     return 'Server shutting down...'
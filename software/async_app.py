@@ -0,0 +1,325 @@
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import asyncio
+import multiprocessing
+import numpy as np
+import os
+import signal
+import sys
+import time
+import uuid
+from components import image_codec
+from components.camera import CameraMock
+from components.ai import AISystemMock
+from components.database import Database
+from components.frame_store import FrameStore
+from components.metrics import MetricsRegistry
+from components.structured_logging import configure_logging
+
+# Asyncio variant of app.py: requests are parsed on the event loop, predictions run in a process pool and
+# camera and database I/O on a single background thread, so one process serves many slow connections.
+# Run with `python async_app.py` or `hypercorn async_app:app`.
+
+# Log records are formatted and written by a background thread, INSPECTION_LOG_LEVEL=DEBUG adds per-frame detail
+configure_logging(os.environ.get("INSPECTION_LOG_LEVEL", "INFO"))
+
+app = Quart(__name__)
+app = cors(app, expose_headers=[image_codec.SHAPE_HEADER, image_codec.DTYPE_HEADER, 'X-Image-UUID'])
+app.config.update(
+    DATABASE=os.environ.get("INSPECTION_DB", "test_results.db"),
+    # Predictor processes, defaults to the number of CPU cores
+    PREDICT_WORKERS=int(os.environ.get("INSPECTION_WORKERS", 0)) or None,
+    # Predictions queued or running at once, further requests get a 503 instead of waiting
+    MAX_IN_FLIGHT=int(os.environ.get("INSPECTION_MAX_IN_FLIGHT", 64)),
+    # Seconds a request waits for its prediction before it gets a 504
+    PREDICT_TIMEOUT=float(os.environ.get("INSPECTION_PREDICT_TIMEOUT", 5.0)),
+)
+
+# Every server process (hypercorn --workers) keeps its own metrics, labelled with its pid
+metrics = MetricsRegistry(worker=os.getpid())
+predict_histogram = metrics.histogram('ai_predict_seconds', 'Duration of a prediction in the predictor process in seconds')
+# Only touched on the event loop thread
+predictions_in_flight = 0
+io_pending = 0
+metrics.gauge('predictions_in_flight', 'Predictions queued or running in the process pool', lambda: predictions_in_flight)
+metrics.gauge('io_pending', 'Camera captures and database writes queued on the I/O thread', lambda: io_pending)
+
+# Built per serving process in startup()
+camera = None
+database = None
+frame_store = None
+predict_pool = None
+# One thread keeps the camera's random generator and the SQLite connection single threaded
+io_executor = None
+in_flight = None
+shutdown_event = None
+# Set by serve(), whose shutdown trigger waits for shutdown_event
+serving_with_trigger = False
+
+_ai_system = None
+
+def _init_predictor():
+    global _ai_system
+    _ai_system = AISystemMock()
+
+def _predict(image_array):
+    """Runs in a predictor process, returns the verdict and the prediction latency."""
+    predict_start = time.perf_counter()
+    defect_present = bool(_ai_system.predict(image_array))
+    return defect_present, (time.perf_counter() - predict_start) * 1000
+
+def _predict_batch(images):
+    predict_start = time.perf_counter()
+    results = _ai_system.predict_batch(images)
+    return results, (time.perf_counter() - predict_start) * 1000 / max(len(results), 1)
+
+@app.before_serving
+async def startup():
+    global camera, database, frame_store, predict_pool, io_executor, in_flight, shutdown_event
+    camera = CameraMock(metrics=metrics)
+    database = Database(app.config['DATABASE'], batch_size=100, flush_interval=1.0, metrics=metrics)
+    frame_store = FrameStore(max_frames=1000, ttl=60.0)
+    metrics.gauge('frame_store_frames', 'Captured frames held for prediction by image_UUID', lambda: len(frame_store))
+    predict_pool = ProcessPoolExecutor(max_workers=app.config['PREDICT_WORKERS'], initializer=_init_predictor)
+    io_executor = ThreadPoolExecutor(max_workers=1)
+    in_flight = asyncio.Semaphore(app.config['MAX_IN_FLIGHT'])
+    shutdown_event = asyncio.Event()
+
+@app.after_serving
+async def drain():
+    """Wait for queued predictions and database writes, then flush the buffered results."""
+    predict_pool.shutdown(wait=True)
+    io_executor.shutdown(wait=True)
+    database.close()
+
+class Overloaded(Exception):
+    pass
+
+@app.errorhandler(Overloaded)
+async def overloaded(error):
+    return jsonify(error="Too many predictions in flight, retry later"), 503
+
+@app.errorhandler(asyncio.TimeoutError)
+async def timed_out(error):
+    return jsonify(error="Prediction timed out"), 504
+
+def submit_io(function, *args, **kwargs):
+    """Queue `function` on the I/O thread, returns an asyncio future."""
+    global io_pending
+    io_pending += 1
+    future = asyncio.get_running_loop().run_in_executor(io_executor, partial(function, *args, **kwargs))
+    future.add_done_callback(_io_done)
+    return future
+
+def _io_done(future):
+    global io_pending
+    io_pending -= 1
+
+async def run_io(function, *args, **kwargs):
+    return await submit_io(function, *args, **kwargs)
+
+async def run_prediction(function, *args):
+    """Run `function` in the predictor pool, bounded by MAX_IN_FLIGHT and PREDICT_TIMEOUT."""
+    if in_flight.locked():
+        raise Overloaded()
+    global predictions_in_flight
+    await in_flight.acquire()
+    predictions_in_flight += 1
+    future = asyncio.wrap_future(predict_pool.submit(function, *args))
+    # A timed out prediction keeps its slot until the process finishes it, so the pool backlog stays bounded
+    future.add_done_callback(_prediction_done)
+    return await asyncio.wait_for(asyncio.shield(future), app.config['PREDICT_TIMEOUT'])
+
+def _prediction_done(future):
+    global predictions_in_flight
+    predictions_in_flight -= 1
+    in_flight.release()
+    if not future.cancelled() and future.exception() is None:
+        predict_histogram.observe(future.result()[1] / 1000)
+
+def log_prediction(defect_present, latency_ms, image_uuid=None, prediction_uuid=None, low_lighting=None):
+    """Queue the result on the I/O thread without waiting for it, after_serving drains the queue."""
+    submit_io(database.log_result, None, defect_present, image_uuid=image_uuid,
+              prediction_uuid=prediction_uuid, low_lighting=low_lighting, latency_ms=latency_ms)
+
+async def decode_request_image():
+    """Read the frame from the request body in whichever format the client sent it."""
+    if request.mimetype == image_codec.OCTET_STREAM:
+        return image_codec.from_raw(
+            await request.get_data(),
+            request.headers.get(image_codec.SHAPE_HEADER),
+            request.headers.get(image_codec.DTYPE_HEADER, 'uint8'),
+        )
+    if request.mimetype == image_codec.PNG:
+        return image_codec.from_png(await request.get_data())
+
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("The request body must be a JSON object")
+    if 'raw_image' not in data and 'raw_image_b64' not in data and 'image_UUID' in data:
+        if not isinstance(data['image_UUID'], str):
+            raise ValueError("image_UUID must be a string")
+        return frame_store.get(data['image_UUID'])
+    if 'raw_image_b64' in data:
+        return image_codec.from_base64(data)
+    if 'raw_image' not in data:
+        raise ValueError("raw_image, raw_image_b64 or image_UUID is required")
+    return image_codec.from_list(data['raw_image'])
+
+def requested_resolution(data):
+    """Optional (height, width) frame size of a capture request, None keeps the camera's own."""
+    resolution = data.get('resolution')
+    if resolution is None:
+        return None
+    if not (isinstance(resolution, list) and len(resolution) == 2 and all(isinstance(dim, int) for dim in resolution)):
+        raise ValueError("resolution must be [height, width]")
+    return tuple(resolution)
+
+async def capture(data):
+    image = await run_io(camera.capture, data.get('with_defect', False), data.get('low_lighting', False),
+                         requested_resolution(data))
+    image_array = np.array(image)
+    image_uuid = str(uuid.uuid4())
+    frame_store.put(image_uuid, image_array)
+    return image_array, image_uuid
+
+@app.route('/capture_image', methods=['POST'])
+async def capture_image():
+    data = await request.get_json(silent=True) or {}
+    try:
+        image_array, image_uuid = await capture(data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    content_type = request.accept_mimetypes.best_match(
+        [image_codec.JSON, image_codec.OCTET_STREAM, image_codec.PNG], default=image_codec.JSON)
+    if content_type == image_codec.OCTET_STREAM:
+        body, headers = image_codec.to_raw(image_array)
+        headers['X-Image-UUID'] = image_uuid
+        return Response(body, mimetype=content_type, headers=headers)
+    if content_type == image_codec.PNG:
+        return Response(image_codec.to_png(image_array), mimetype=content_type, headers={'X-Image-UUID': image_uuid})
+    if data.get('encoding') == 'base64':
+        return jsonify(image_UUID=image_uuid, **image_codec.to_base64(image_array))
+
+    return jsonify(raw_image=image_array.tolist(), image_UUID=image_uuid)
+
+@app.route('/predict_defect', methods=['POST'])
+async def predict_defect():
+    try:
+        image_array = await decode_request_image()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if image_array is None:
+        return jsonify(error="Unknown or expired image_UUID"), 404
+
+    defect_present, latency_ms = await run_prediction(_predict, image_array)
+    prediction_uuid = str(uuid.uuid4())
+
+    data = await request.get_json(silent=True) or {}
+    log_prediction(defect_present, latency_ms, data.get('image_UUID', request.headers.get('X-Image-UUID')),
+                   prediction_uuid, data.get('low_lighting'))
+
+    return jsonify(has_defect=defect_present, prediction_UUID=prediction_uuid)
+
+@app.route('/capture_and_predict', methods=['POST'])
+async def capture_and_predict():
+    data = await request.get_json(silent=True) or {}
+    try:
+        image_array, image_uuid = await capture(data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    defect_present, latency_ms = await run_prediction(_predict, image_array)
+    prediction_uuid = str(uuid.uuid4())
+    log_prediction(defect_present, latency_ms, image_uuid, prediction_uuid, data.get('low_lighting', False))
+
+    return jsonify(has_defect=defect_present, image_UUID=image_uuid, prediction_UUID=prediction_uuid)
+
+@app.route('/predict_defect_batch', methods=['POST'])
+async def predict_defect_batch():
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict) or 'raw_images' not in data:
+        return jsonify(error="raw_images is required"), 400
+    try:
+        images = image_codec.from_batch(data['raw_images'])
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    results, latency_ms = await run_prediction(_predict_batch, images)
+
+    predictions = []
+    for defect_present, bounding_box in results:
+        prediction_uuid = str(uuid.uuid4())
+        log_prediction(defect_present, latency_ms, prediction_uuid=prediction_uuid)
+        predictions.append(dict(
+            has_defect=defect_present,
+            bounding_box=list(bounding_box) if bounding_box else None,
+            prediction_UUID=prediction_uuid,
+        ))
+
+    return jsonify(predictions=predictions)
+
+@app.route('/stats', methods=['GET'])
+async def stats():
+    try:
+        window = float(request.args.get('window', 60))
+        last = float(request.args.get('last', 3600))
+    except ValueError:
+        return jsonify(error="window and last must be numbers of seconds"), 400
+    if window <= 0:
+        return jsonify(error="window must be positive"), 400
+
+    # Queued behind the pending writes on the I/O thread, so they are included
+    return jsonify(await run_io(database.stats, window=window, since=time.time() - last))
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_route():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/shutdown', methods=['POST'])
+async def shutdown():
+    if serving_with_trigger:
+        # serve() stops accepting connections, in-flight requests finish and after_serving drains the executors
+        shutdown_event.set()
+    elif _hypercorn_pid() is not None:
+        # Under `hypercorn async_app:app` the hypercorn process stops its workers gracefully on SIGTERM, and
+        # after_serving drains the executors of each
+        os.kill(_hypercorn_pid(), signal.SIGTERM)
+    else:
+        return jsonify(error="Shutdown needs python async_app.py or hypercorn async_app:app"), 501
+
+    return 'Server shutting down...'
+
+def _hypercorn_pid():
+    """The pid of the hypercorn command serving this process, None when it was started otherwise."""
+    main_spec = getattr(sys.modules.get('__main__'), '__spec__', None)
+    if (main_spec and main_spec.name == 'hypercorn.__main__') or os.path.basename(sys.argv[0]) == 'hypercorn':
+        # --workers 0 serves from the hypercorn process itself
+        return os.getpid()
+    parent = multiprocessing.parent_process()
+    if parent is not None and 'hypercorn.asyncio.run' in sys.modules:
+        # A worker spawned by the hypercorn process
+        return parent.pid
+    return None
+
+async def serve(bind="0.0.0.0:8000"):
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+    config = Config()
+    config.bind = [bind]
+    config.graceful_timeout = 30
+    global serving_with_trigger
+    serving_with_trigger = True
+    await hypercorn_serve(app, config, shutdown_trigger=_wait_for_shutdown)
+
+async def _wait_for_shutdown():
+    # The event is created by startup(), which hypercorn runs before the trigger is awaited
+    while shutdown_event is None:
+        await asyncio.sleep(0.1)
+    await shutdown_event.wait()
+
+if __name__ == '__main__':
+    asyncio.run(serve(os.environ.get("INSPECTION_BIND", "0.0.0.0:8000")))
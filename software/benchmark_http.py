@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import numpy as np
+from components import image_codec
+
+# Servers the harness can start locally, each is passed its port and database through the environment
+SERVERS = {
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+    'async': [sys.executable, 'async_app.py'],
+}
+SCENARIOS = ('capture', 'predict', 'capture_and_predict')
+
+# Metrics compared against the baseline, and whether a higher value is the better one
+REGRESSION_METRICS = {'rps': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False}
+
+class Client:
+    """One keep-alive connection, sending the raw binary transport so the frame size is what is measured."""
+
+    def __init__(self, host, port):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+
+    def post(self, path, body, headers):
+        self.conn.request('POST', path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"{path} returned {response.status}: {data[:200]!r}")
+        return response, data
+
+    def capture(self, resolution):
+        body = json.dumps({'with_defect': True, 'resolution': list(resolution)})
+        return self.post('/capture_image', body, {'Content-Type': image_codec.JSON, 'Accept': image_codec.OCTET_STREAM})
+
+    def predict(self, raw_image, shape_header):
+        return self.post('/predict_defect', raw_image, {'Content-Type': image_codec.OCTET_STREAM,
+                                                        image_codec.SHAPE_HEADER: shape_header})
+
+    def close(self):
+        self.conn.close()
+
+def run_scenario(host, port, scenario, resolution, concurrency, duration):
+    """Drive one scenario from `concurrency` connections for `duration` seconds, returns its result row."""
+    # Frame posted by the predict scenario, captured once up front
+    client = Client(host, port)
+    response, raw_image = client.capture(resolution)
+    shape_header = response.getheader(image_codec.SHAPE_HEADER)
+    client.close()
+
+    def flow(client):
+        if scenario == 'capture':
+            client.capture(resolution)
+        elif scenario == 'predict':
+            client.predict(raw_image, shape_header)
+        else:
+            # The frame travels back and forth, so the flow works behind any number of server workers
+            response, captured = client.capture(resolution)
+            client.predict(captured, response.getheader(image_codec.SHAPE_HEADER))
+
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start_barrier = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def worker(index):
+        client = Client(host, port)
+        start_barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            request_start = time.perf_counter()
+            try:
+                flow(client)
+            except (RuntimeError, OSError, http.client.HTTPException):
+                errors[index] += 1
+                client.close()
+                client = Client(host, port)
+                continue
+            latencies[index].append(time.perf_counter() - request_start)
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + duration
+    start_barrier.wait()
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    latencies = np.array([latency for worker_latencies in latencies for latency in worker_latencies]) * 1000
+    row = dict(scenario=scenario, resolution=list(resolution), concurrency=concurrency, requests=len(latencies),
+               errors=sum(errors), rps=len(latencies) / elapsed)
+    for percentile in (50, 95, 99):
+        # Nearest-rank percentiles, the same definition as the /stats route
+        row[f'p{percentile}_ms'] = (float(np.percentile(latencies, percentile, method='inverted_cdf'))
+                                    if len(latencies) else None)
+    return row
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(server, port, db_name, workers):
+    """Start the app in the background and wait until it answers."""
+    # The predict scenario posts the same frame on every request, with the prediction cache on it would only
+    # measure cache hits
+    env = dict(os.environ, INSPECTION_BIND=f'127.0.0.1:{port}', INSPECTION_DB=db_name, INSPECTION_PREDICTION_CACHE='0')
+    if workers:
+        env['INSPECTION_WORKERS'] = str(workers)
+    process = subprocess.Popen(SERVERS[server], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} server exited with code {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{server} server did not start within 30 seconds")
+
+def stop_server(process, host, port):
+    """Shut the server down through its /shutdown route so buffered results are flushed."""
+    try:
+        Client(host, port).post('/shutdown', b'', {})
+        process.wait(timeout=60)
+    except (RuntimeError, OSError, http.client.HTTPException, subprocess.TimeoutExpired):
+        process.kill()
+
+def find_regressions(results, baseline, threshold):
+    """Rows of `results` worse than the matching `baseline` row by more than `threshold` (a fraction)."""
+    key = lambda row: (row['scenario'], tuple(row['resolution']), row['concurrency'])
+    baseline_rows = {key(row): row for row in baseline['results']}
+    regressions = []
+    for row in results['results']:
+        previous = baseline_rows.get(key(row))
+        if not previous:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            if row[metric] is None or not previous[metric]:
+                continue
+            change = (row[metric] - previous[metric]) / previous[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(dict(scenario=row['scenario'], resolution=row['resolution'],
+                                        concurrency=row['concurrency'], metric=metric,
+                                        baseline=previous[metric], current=row[metric], change=change))
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def parse_resolution(value):
+    height, width = value.lower().split('x')
+    return int(height), int(width)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the inspection API and report throughput and latency.")
+    parser.add_argument('--server', choices=sorted(SERVERS), default='gunicorn', help="server to start locally")
+    parser.add_argument('--url', help="benchmark an already running server instead, e.g. http://127.0.0.1:8000")
+    parser.add_argument('--workers', type=int, help="server worker processes, defaults to the number of cores")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma separated, from " + ','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help="comma separated connection counts")
+    parser.add_argument('--resolutions', default='100x100,480x640', help="comma separated HEIGHTxWIDTH frame sizes")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="fail when rps drops or a percentile grows by more than this fraction of the baseline")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenarios.split(',')
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}")
+
+    process = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.url:
+            host, port = args.url.split('://')[-1].rstrip('/').split(':')
+            port = int(port)
+        else:
+            host, port = '127.0.0.1', free_port()
+            process = start_server(args.server, port, os.path.join(tmp_dir, 'benchmark.db'), args.workers)
+
+        rows = []
+        try:
+            for resolution in (parse_resolution(value) for value in args.resolutions.split(',')):
+                for scenario in scenarios:
+                    for concurrency in (int(value) for value in args.concurrency.split(',')):
+                        row = run_scenario(host, port, scenario, resolution, concurrency, args.duration)
+                        rows.append(row)
+                        print(f"{scenario:<20} {resolution[0]:>5}x{resolution[1]:<5} c={concurrency:<4} "
+                              f"{row['rps']:>9.1f} req/s  p50 {row['p50_ms'] or 0:>8.2f} ms  "
+                              f"p95 {row['p95_ms'] or 0:>8.2f} ms  p99 {row['p99_ms'] or 0:>8.2f} ms  "
+                              f"{row['errors']} errors")
+        finally:
+            if process:
+                stop_server(process, host, port)
+
+    results = dict(commit=git_commit(), created_at=time.time(), server=args.url or args.server,
+                   workers=None if args.url else args.workers or os.cpu_count(), duration=args.duration, results=rows)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression['scenario']} {regression['resolution'][0]}x{regression['resolution'][1]} "
+                  f"c={regression['concurrency']} {regression['metric']}: {regression['baseline']:.2f} -> "
+                  f"{regression['current']:.2f} ({regression['change']:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regression beyond {args.max_regression:.0%} of the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import numpy as np
+from werkzeug.test import EnvironBuilder
+
+# The same frame is posted on every request, the prediction cache would answer all but the first
+os.environ['INSPECTION_PREDICTION_CACHE'] = '0'
+from app import app, database
+from components import image_codec
+
+def legacy_request(image_array):
+    return dict(json={'raw_image': image_array.tolist()})
+
+def base64_request(image_array):
+    return dict(json=image_codec.to_base64(image_array))
+
+def raw_request(image_array):
+    body, headers = image_codec.to_raw(image_array)
+    return dict(data=body, content_type=image_codec.OCTET_STREAM, headers=headers)
+
+def png_request(image_array):
+    return dict(data=image_codec.to_png(image_array), content_type=image_codec.PNG)
+
+# Format name -> how /predict_defect is called and how /capture_image is asked for it
+FORMATS = {
+    'list': (legacy_request, dict(json={})),
+    'base64': (base64_request, dict(json={'encoding': 'base64'})),
+    'raw': (raw_request, dict(json={}, headers={'Accept': image_codec.OCTET_STREAM})),
+    'png': (png_request, dict(json={}, headers={'Accept': image_codec.PNG})),
+}
+
+def request_size(kwargs):
+    """Size in bytes of the request body the client has to encode and send."""
+    return len(EnvironBuilder(method='POST', **kwargs).get_request().get_data())
+
+def time_requests(client, path, kwargs, repeat):
+    """Mean round trip latency in milliseconds, including the client side encoding."""
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        response = client.post(path, **kwargs())
+        assert response.status_code == 200, response.get_data()
+    return (time.perf_counter() - start_time) / repeat * 1000
+
+def main(size=1000, repeat=20):
+    client = app.test_client()
+    # Noise frame with a defect so the predictor does its usual amount of work
+    image_array = (np.abs(np.random.randn(size, size)) * 10).astype(np.uint8)
+    image_array[size // 2 - 5:size // 2 + 5, size // 2 - 5:size // 2 + 5] = 255
+
+    print(f"/predict_defect, {size}x{size} frame:")
+    print(f"  {'format':<8} {'request':>12} {'latency':>12}")
+    for name, (build_request, _) in FORMATS.items():
+        size_bytes = request_size(build_request(image_array))
+        latency_ms = time_requests(client, '/predict_defect', lambda: build_request(image_array), repeat)
+        print(f"  {name:<8} {size_bytes:>10} B {latency_ms:>9.3f} ms")
+
+    print("/capture_image, 100x100 frame:")
+    print(f"  {'format':<8} {'response':>12} {'latency':>12}")
+    for name, (_, capture_kwargs) in FORMATS.items():
+        size_bytes = len(client.post('/capture_image', **capture_kwargs).get_data())
+        latency_ms = time_requests(client, '/capture_image', lambda: capture_kwargs, repeat)
+        print(f"  {name:<8} {size_bytes:>10} B {latency_ms:>9.3f} ms")
+
+    database.close()
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
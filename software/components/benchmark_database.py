@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+from database import Database
+
+# Commit-per-row inserts are fsync bound, larger runs are timed over this many rows and reported as a rate
+LEGACY_SAMPLE_ROWS = 10_000
+
+def legacy_insert(db_path, rows):
+    """The original logging path: default rollback journal, one INSERT and commit per result."""
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY AUTOINCREMENT, image_id INTEGER, defect_detected BOOLEAN)')
+    conn.commit()
+    start_time = time.perf_counter()
+    for image_id in range(rows):
+        conn.execute('INSERT INTO results (image_id, defect_detected) VALUES (?, ?)', (image_id, image_id % 2 == 0))
+        conn.commit()
+    elapsed = time.perf_counter() - start_time
+    conn.close()
+    return rows / elapsed
+
+def buffered_insert(db_path, rows, batch_size):
+    """Buffered logging through Database: WAL journal and one executemany transaction per batch."""
+    database = Database(db_path, batch_size=batch_size)
+    start_time = time.perf_counter()
+    for image_id in range(rows):
+        database.log_result(image_id, image_id % 2 == 0)
+    database.close()
+    return rows / (time.perf_counter() - start_time)
+
+def time_stats(db_path):
+    """Milliseconds taken by the /stats aggregates over the last hour of results."""
+    database = Database(db_path)
+    start_time = time.perf_counter()
+    database.stats(window=60, since=time.time() - 3600)
+    elapsed = time.perf_counter() - start_time
+    database.close()
+    return elapsed * 1000
+
+def main(row_counts=(10_000, 1_000_000), batch_size=1000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in row_counts:
+            legacy_rows = min(rows, LEGACY_SAMPLE_ROWS)
+            legacy_rate = legacy_insert(os.path.join(tmp_dir, f"legacy_{rows}.db"), legacy_rows)
+            buffered_rate = buffered_insert(os.path.join(tmp_dir, f"buffered_{rows}.db"), rows, batch_size)
+
+            sampled = f" (timed over {legacy_rows} rows)" if legacy_rows < rows else ""
+            print(f"{rows} rows:")
+            print(f"  commit per row:      {legacy_rate:>12,.0f} rows/sec{sampled}")
+            print(f"  buffered, batch {batch_size}: {buffered_rate:>12,.0f} rows/sec")
+            print(f"  speedup:             {buffered_rate / legacy_rate:>12.1f}x")
+            print(f"  stats over the last hour: {time_stats(os.path.join(tmp_dir, f'buffered_{rows}.db')):.1f} ms")
+
+if __name__ == "__main__":
+    # Row counts can be given on the command line, e.g. `python benchmark_database.py 10000 1000000`
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (10_000, 1_000_000))
@@ -0,0 +1,50 @@
+import sys
+import time
+import numpy as np
+from ai import AISystemMock, DETECTORS
+from camera import CameraMock
+
+# A located defect counts as correct when its corner is within this many pixels of the ground truth
+LOCALIZATION_TOLERANCE = 2
+
+def score(predictions, defects):
+    """Returns the (accuracy, false positives, false negatives, localized fraction of true positives)."""
+    present = np.array([defect_present for defect_present, _ in predictions])
+    truth = defects[:, 0] >= 0
+    hits = [
+        abs(bounding_box[0] - x) <= LOCALIZATION_TOLERANCE and abs(bounding_box[1] - y) <= LOCALIZATION_TOLERANCE
+        for (defect_present, bounding_box), (x, y, _, _), expected in zip(predictions, defects, truth)
+        if defect_present and expected
+    ]
+    return ((present == truth).mean(), int(np.sum(present & ~truth)), int(np.sum(~present & truth)),
+            np.mean(hits) if hits else 0.0)
+
+def main(frame_count=1000, resolution=(100, 100)):
+    camera = CameraMock(seed=0, resolution=resolution)
+    print(f"Frames: {frame_count} per lighting condition at {resolution[0]}x{resolution[1]}, half with a defect")
+    for low_lighting in (False, True):
+        frames, defects = camera.capture_batch(frame_count, with_defect=np.arange(frame_count) % 2 == 0,
+                                               low_lighting=low_lighting)
+        print(f"{'Low' if low_lighting else 'Normal'} lighting:")
+        for detector in DETECTORS:
+            ai_system = AISystemMock(detector=detector)
+
+            start_time = time.perf_counter()
+            bounding_boxes = [ai_system.locate_defect(ai_system.preprocess_image(frame)) for frame in frames]
+            predictions = [(bounding_box is not None, bounding_box) for bounding_box in bounding_boxes]
+            single_ms = (time.perf_counter() - start_time) / frame_count * 1000
+
+            start_time = time.perf_counter()
+            batch_predictions = ai_system.predict_batch(frames)
+            batch_ms = (time.perf_counter() - start_time) / frame_count * 1000
+
+            accuracy, false_positives, false_negatives, localized = score(batch_predictions, defects)
+            single_accuracy = score(predictions, defects)[0]
+            print(f"  {detector:<8} accuracy {accuracy:6.1%} (single frame {single_accuracy:6.1%}), "
+                  f"{false_positives} FP, {false_negatives} FN, localized {localized:6.1%}, "
+                  f"{single_ms:.3f} ms/frame single, {batch_ms:.3f} ms/frame batched")
+
+if __name__ == "__main__":
+    # Frame count and resolution can be given on the command line, e.g. `python benchmark_detectors.py 1000 480 640`
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*args[:1], *([tuple(args[1:3])] if len(args) >= 3 else []))
@@ -0,0 +1,20 @@
+import os
+import sys
+from inspection_engine import InspectionEngine
+
+def main(frame_count=2000):
+    """Frames/sec of the inspection engine for 1 up to the number of CPU cores predictor processes."""
+    cores = os.cpu_count() or 1
+    conditions = lambda seq: (seq % 2 == 0, seq % 4 < 2)
+    baseline = None
+    print(f"{frame_count} frames, {cores} cores")
+    for workers in sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1))):
+        for ordered in (True, False):
+            engine = InspectionEngine(lambda *args, **details: None, workers=workers, ordered=ordered)
+            report = engine.run(frame_count, conditions=conditions)
+            baseline = baseline or report['frames_per_sec']
+            print(f"  workers={workers} ordered={ordered!s:<5} {report['frames_per_sec']:>9.1f} frames/sec "
+                  f"({report['frames_per_sec'] / baseline:.2f}x)")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,57 @@
+import os
+import time
+import tempfile
+import cv2
+from ai import AISystemMock, PREPROCESS_STAGES
+from camera import CameraMock
+
+def disk_predict(ai_system, image, image_path):
+    """Reproduces the original temp-file path: PNG encode/decode before and after preprocessing."""
+    image.save(image_path)
+    img = cv2.imread(image_path, 1)
+    cv2.imwrite(image_path, ai_system.preprocess_image(img))
+    return ai_system.detect_defect(image_path)
+
+def time_predict(predict, images, repeat=3):
+    """Returns the best mean latency in milliseconds over `repeat` passes through `images`."""
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for image in images:
+            predict(image)
+        best = min(best, (time.perf_counter() - start_time) / len(images))
+    return best * 1000
+
+def stage_costs(images):
+    """Returns the mean duration in milliseconds of every preprocessing stage, each run on its own."""
+    costs = {}
+    for stage in PREPROCESS_STAGES:
+        ai_system = AISystemMock(preprocess_stages=(stage,))
+        total = 0.0
+        for image in images:
+            ai_system.preprocess_image(image)
+            total += ai_system.stage_timings[stage]
+        costs[stage] = total / len(images) * 1000
+    return costs
+
+def main(frame_count=50):
+    camera = CameraMock()
+    ai_system = AISystemMock()
+    images = [camera.capture(with_defect=i % 2 == 0, low_lighting=i % 4 < 2) for i in range(frame_count)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = os.path.join(tmp_dir, "temp_img.png")
+        disk_ms = time_predict(lambda image: disk_predict(ai_system, image, image_path), images)
+    memory_ms = time_predict(ai_system.predict, images)
+
+    print(f"Frames: {frame_count}")
+    print(f"Disk round trip: {disk_ms:.3f} ms/frame")
+    print(f"In-memory:       {memory_ms:.3f} ms/frame")
+    print(f"Speedup:         {disk_ms / memory_ms:.2f}x")
+
+    print("Preprocessing stage costs:")
+    for stage, cost_ms in stage_costs(images).items():
+        print(f"  {stage:<12} {cost_ms:.3f} ms/frame")
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,118 @@
+import time
 import numpy as np
 from PIL import Image
-import random
+
+# Largest frame capture_batch generates, 4K UHD as (height, width)
+MAX_RESOLUTION = (2160, 3840)
+# Defects are 10x10 patches centred at least this far from the border
+DEFECT_MARGIN = 10
+DEFECT_HALF_SIZE = 5
+# Upper bound on the float working memory of one capture_batch chunk
+CHUNK_BYTES = 64 * 1024 * 1024
 
 class CameraMock:
-    def capture(self, with_defect=False, low_lighting=True):
-        """Generates an image with random noise and possibly a defect."""
-        # Create random noise background
+    def __init__(self, seed=None, resolution=(100, 100), metrics=None):
+        """
+        Args:
+            seed (int): Seed of the camera's random generator, the same seed reproduces the same frames.
+            resolution (tuple): Frame size as (height, width).
+            metrics (MetricsRegistry): Optional registry the capture durations are recorded in.
+        """
+        self.rng = np.random.default_rng(seed)
+        self.resolution = self._check_resolution(resolution)
+        self._capture_histogram = None
+        if metrics:
+            self._capture_histogram = metrics.histogram('camera_capture_seconds', 'Duration of CameraMock.capture in seconds')
+
+    def _check_resolution(self, resolution):
+        height, width = resolution
+        if not (2 * DEFECT_MARGIN < height <= MAX_RESOLUTION[0] and 2 * DEFECT_MARGIN < width <= MAX_RESOLUTION[1]):
+            raise ValueError(f"Resolution must be between {2 * DEFECT_MARGIN + 1}x{2 * DEFECT_MARGIN + 1} "
+                             f"and {MAX_RESOLUTION[0]}x{MAX_RESOLUTION[1]}, got {height}x{width}")
+        return (height, width)
+
+    def lighting_levels(self, low_lighting):
+        """Returns the (noise_level, defect_intensity) for the lighting condition."""
         if low_lighting:
             noise_level = 35  # Low light yeilds higher noise
             defect_intensity = 80  # Lower intensity defect in low lighting
         else:
             noise_level = 10  # Better lighting yeilds lower noise
             defect_intensity = 255  # Clear defect visibility in normal lighting
-        
+        return noise_level, defect_intensity
+
+    def capture(self, with_defect=False, low_lighting=True, resolution=None):
+        """Generates an image with random noise and possibly a defect, `resolution` overrides the camera's (height, width)."""
+        capture_start = time.perf_counter()
+        # Create random noise background
+        noise_level, defect_intensity = self.lighting_levels(low_lighting)
+        height, width = self._check_resolution(resolution) if resolution else self.resolution
+
         # Generate an image with random noise
-        image_data = (np.abs(np.random.randn(100,100))*noise_level)
+        image_data = (np.abs(self.rng.standard_normal((height, width)))*noise_level)
 
         # Possibly introduce a defect
         if with_defect:
-            x, y = random.randint(10, 90), random.randint(10, 90)
+            x = self.rng.integers(DEFECT_MARGIN, height - DEFECT_MARGIN, endpoint=True)
+            y = self.rng.integers(DEFECT_MARGIN, width - DEFECT_MARGIN, endpoint=True)
             image_data[x-5:x+5, y-5:y+5] += defect_intensity  # Add defect on top of noise
 
         # Ensure values stay within valid pixel range
         image_data = np.clip(image_data, 0, 255).astype(np.uint8)
         image = Image.fromarray(image_data)
-        
+
+        if self._capture_histogram:
+            self._capture_histogram.observe(time.perf_counter() - capture_start)
         return image
 
+    def capture_batch(self, n, with_defect=False, low_lighting=True, resolution=None):
+        """
+        Generates `n` frames in one vectorized pass, without PIL conversion.
+        Args:
+            n (int): Number of frames.
+            with_defect (bool or array of bool): Whether each frame gets a defect, a single value applies to all.
+            low_lighting (bool or array of bool): Lighting condition of each frame, a single value applies to all.
+            resolution (tuple): (height, width) of the frames, defaults to the camera's resolution.
+        Returns:
+            frames (ndarray): (n, height, width) uint8 frames.
+            defects (ndarray): (n, 4) int ground-truth bounding boxes as (x, y, w, h) in pixel columns/rows,
+                the same layout AISystemMock.locate_defect returns, -1 for frames without a defect.
+        """
+        height, width = self._check_resolution(resolution or self.resolution)
+        with_defect = np.broadcast_to(np.asarray(with_defect, dtype=bool), (n,))
+        low_lighting = np.broadcast_to(np.asarray(low_lighting, dtype=bool), (n,))
+        noise_level = np.where(low_lighting, 35, 10).astype(np.float32)
+        defect_intensity = np.where(low_lighting, 80, 255).astype(np.float32)
+
+        # Defect centres as (row, column), drawn for every frame so the stream only depends on the seed and n
+        rows = self.rng.integers(DEFECT_MARGIN, height - DEFECT_MARGIN, size=n, endpoint=True)
+        cols = self.rng.integers(DEFECT_MARGIN, width - DEFECT_MARGIN, size=n, endpoint=True)
+        defects = np.full((n, 4), -1, dtype=np.int64)
+        defects[with_defect] = np.stack([cols - DEFECT_HALF_SIZE, rows - DEFECT_HALF_SIZE,
+                                         np.full(n, 2 * DEFECT_HALF_SIZE), np.full(n, 2 * DEFECT_HALF_SIZE)],
+                                        axis=1)[with_defect]
+
+        frames = np.empty((n, height, width), dtype=np.uint8)
+        offsets = np.arange(-DEFECT_HALF_SIZE, DEFECT_HALF_SIZE)
+        chunk_size = max(1, CHUNK_BYTES // (height * width * 4))
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            image_data = self.rng.standard_normal((stop - start, height, width), dtype=np.float32)
+            np.abs(image_data, out=image_data)
+            image_data *= noise_level[start:stop, None, None]
+
+            # Add every defect of the chunk with one fancy-indexed update
+            defect_frames = np.flatnonzero(with_defect[start:stop])
+            if len(defect_frames):
+                patch_rows = rows[start + defect_frames, None] + offsets
+                patch_cols = cols[start + defect_frames, None] + offsets
+                image_data[defect_frames[:, None, None], patch_rows[:, :, None], patch_cols[:, None, :]] += \
+                    defect_intensity[start + defect_frames, None, None]
+
+            np.clip(image_data, 0, 255, out=image_data)
+            frames[start:stop] = image_data
+        return frames, defects
+
 if __name__ == "__main__":
     # Create an instance of CameraMock
     camera = CameraMock()
@@ -36,4 +122,4 @@ if __name__ == "__main__":
 
     # Capture and display an image without defect and low lighting
     camera.capture(with_defect=False, low_lighting=True)
-        
+
@@ -1,25 +1,180 @@
+import math
 import sqlite3
+import threading
+import time
+
+# Values SQLite can bind, anything else would only fail once its whole batch is written
+_SQLITE_TYPES = (type(None), int, float, str, bytes)
+
+# Schema migrations applied in order, the number applied so far is tracked in PRAGMA user_version
+MIGRATIONS = [
+    # 1: original results table
+    [
+        '''CREATE TABLE IF NOT EXISTS results
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, image_id INTEGER, defect_detected BOOLEAN)''',
+    ],
+    # 2: identifiers matching the API, capture conditions, latency and indexes for the stats queries
+    [
+        'ALTER TABLE results ADD COLUMN created_at REAL',
+        'ALTER TABLE results ADD COLUMN image_uuid TEXT',
+        'ALTER TABLE results ADD COLUMN prediction_uuid TEXT',
+        'ALTER TABLE results ADD COLUMN low_lighting BOOLEAN',
+        'ALTER TABLE results ADD COLUMN latency_ms REAL',
+        # Covers every windowed stats query, so they are answered from the index alone
+        'CREATE INDEX IF NOT EXISTS idx_results_created_at ON results (created_at, low_lighting, defect_detected, latency_ms)',
+        'CREATE INDEX IF NOT EXISTS idx_results_image_uuid ON results (image_uuid)',
+    ],
+]
 
 class Database:
-    def __init__(self, db_name="test_results.db"):
+    def __init__(self, db_name="test_results.db", batch_size=1, flush_interval=None, metrics=None):
+        """
+        Args:
+            db_name (str): Path of the SQLite database file.
+            batch_size (int): Number of results buffered before they are written in one transaction,
+                1 commits every result immediately.
+            flush_interval (float): If set, buffered results are also flushed every `flush_interval` seconds.
+            metrics (MetricsRegistry): Optional registry the log and flush durations and the buffer size are recorded in.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        # The connection is shared with the interval flusher thread
+        self._lock = threading.Lock()
+        self.configure()
         self.create_table()
 
+        self._log_histogram = self._flush_histogram = None
+        if metrics:
+            self._log_histogram = metrics.histogram('database_log_result_seconds',
+                                                    'Duration of Database.log_result in seconds, including any flush')
+            self._flush_histogram = metrics.histogram('database_flush_seconds',
+                                                      'Duration of writing one batch of results in seconds')
+            metrics.gauge('database_pending_results', 'Results buffered and not yet written', lambda: len(self._pending))
+
+        self._stop_flusher = threading.Event()
+        self._flusher_thread = None
+        if flush_interval:
+            self._flusher_thread = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher_thread.start()
+
+    def configure(self):
+        """Switch to WAL journaling so commits append to the log instead of rewriting pages, and only fsync at checkpoints."""
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
     def create_table(self):
-        """Creates a table in the database to store test results."""
-        self.conn.execute('''
-            CREATE TABLE IF NOT EXISTS results
-            (id INTEGER PRIMARY KEY AUTOINCREMENT, image_id INTEGER, defect_detected BOOLEAN)
-        ''')
-        self.conn.commit()
-
-    def log_result(self, image_id, defect_detected):
-        """Logs the test result in the database."""
-        self.conn.execute('''
-            INSERT INTO results (image_id, defect_detected) VALUES (?, ?)
-        ''', (image_id, defect_detected))
-        self.conn.commit()
+        """Creates the results table, or migrates an existing one to the latest schema."""
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.conn:
+                for statement in statements:
+                    self.conn.execute(statement)
+                self.conn.execute(f'PRAGMA user_version = {number}')
+
+    def log_result(self, image_id, defect_detected, image_uuid=None, prediction_uuid=None,
+                   low_lighting=None, latency_ms=None, created_at=None):
+        """
+        Logs the test result in the database, buffered until the batch is full. Raises TypeError for a value SQLite
+        cannot store without buffering the result, errors writing the batch are raised as sqlite3.Error.
+        """
+        log_start = time.perf_counter()
+        if created_at is None:
+            created_at = time.time()
+        row = (image_id, defect_detected, created_at, image_uuid, prediction_uuid, low_lighting, latency_ms)
+        if not all(isinstance(value, _SQLITE_TYPES) for value in row):
+            raise TypeError(f"Cannot store result {row!r}")
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+        if self._log_histogram:
+            self._log_histogram.observe(time.perf_counter() - log_start)
+
+    def flush(self):
+        """Writes all buffered results in a single transaction."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        flush_start = time.perf_counter()
+        # A batch that fails to insert is discarded with the exception, not retried by every later flush
+        pending, self._pending = self._pending, []
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO results (image_id, defect_detected, created_at, image_uuid, prediction_uuid,
+                                     low_lighting, latency_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', pending)
+        if self._flush_histogram:
+            self._flush_histogram.observe(time.perf_counter() - flush_start)
+
+    def _flush_periodically(self):
+        while not self._stop_flusher.wait(self.flush_interval):
+            self.flush()
+
+    def _query(self, sql, params=()):
+        # Buffered results are flushed first so they show up in the stats
+        with self._lock:
+            self._flush()
+            return self.conn.execute(sql, params).fetchall()
+
+    def defect_rate_per_window(self, window=60, since=0):
+        """Results and defects per `window` seconds since the `since` timestamp."""
+        rows = self._query('''
+            SELECT CAST(created_at / ? AS INTEGER) * ?, COUNT(*), SUM(defect_detected)
+            FROM results WHERE created_at >= ? GROUP BY 1 ORDER BY 1
+        ''', (window, window, since))
+        return [dict(window_start=start, total=total, defects=defects, defect_rate=defects / total)
+                for start, total, defects in rows]
+
+    def defect_rate_per_lighting(self, since=0):
+        """Results and defects per lighting condition since the `since` timestamp."""
+        rows = self._query('''
+            SELECT low_lighting, COUNT(*), SUM(defect_detected)
+            FROM results WHERE created_at >= ? GROUP BY low_lighting ORDER BY low_lighting
+        ''', (since,))
+        return [dict(low_lighting=None if low_lighting is None else bool(low_lighting),
+                     total=total, defects=defects, defect_rate=defects / total)
+                for low_lighting, total, defects in rows]
+
+    def latency_percentiles(self, percentiles=(50, 95), since=0):
+        """Nearest-rank latency percentiles in milliseconds since the `since` timestamp."""
+        # The latencies stay in SQLite, only the row at each rank is read back
+        where = 'FROM results WHERE created_at >= ? AND latency_ms IS NOT NULL'
+        count = self._query(f'SELECT COUNT(*) {where}', (since,))[0][0]
+        latencies = {}
+        for percentile in percentiles:
+            rank = max(1, math.ceil(percentile / 100 * count)) - 1
+            rows = self._query(f'SELECT latency_ms {where} ORDER BY latency_ms LIMIT 1 OFFSET ?', (since, rank)) if count else []
+            latencies[f'p{percentile}'] = rows[0][0] if rows else None
+        return latencies
+
+    def stats(self, window=60, since=0):
+        """Aggregate defect rates and latency percentiles since the `since` timestamp."""
+        per_window = self.defect_rate_per_window(window, since)
+        total = sum(row['total'] for row in per_window)
+        defects = sum(row['defects'] for row in per_window)
+        return dict(
+            total=total,
+            defects=defects,
+            defect_rate=defects / total if total else None,
+            per_window=per_window,
+            per_lighting=self.defect_rate_per_lighting(since),
+            latency_ms=self.latency_percentiles(since=since),
+        )
 
     def close(self):
-        """Closes the database connection."""
-        self.conn.close()
\ No newline at end of file
+        """Flushes buffered results and closes the database connection."""
+        if self._flusher_thread:
+            self._stop_flusher.set()
+            self._flusher_thread.join()
+            self._flusher_thread = None
+        with self._lock:
+            self._flush()
+            self.conn.close()
@@ -0,0 +1,65 @@
+import time
+import threading
+from collections import OrderedDict
+
+class FrameStore:
+    """Bounded in-memory store of captured frames keyed by image UUID, evicting least recently used and expired frames."""
+
+    def __init__(self, max_frames=1000, ttl=60.0, clock=time.monotonic):
+        if max_frames < 1:
+            raise ValueError("max_frames must be at least 1")
+        self.max_frames = max_frames
+        self.ttl = ttl
+        self._clock = clock
+        # image UUID -> (expiry time, frame), ordered from least to most recently used
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def put(self, image_uuid, frame):
+        """Store a frame, evicting the least recently used one when the store is full."""
+        with self._lock:
+            self._frames[image_uuid] = (self._clock() + self.ttl, frame)
+            self._frames.move_to_end(image_uuid)
+            self._evict_expired()
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+                self.evicted += 1
+
+    def get(self, image_uuid):
+        """Return the stored frame, or None if it was never stored, evicted or has expired."""
+        with self._lock:
+            entry = self._frames.get(image_uuid)
+            if entry is None:
+                return None
+            expiry, frame = entry
+            if expiry <= self._clock():
+                del self._frames[image_uuid]
+                self.expired += 1
+                return None
+            self._frames.move_to_end(image_uuid)
+            return frame
+
+    def pop(self, image_uuid):
+        """Remove and return the stored frame, or None if it is not available."""
+        frame = self.get(image_uuid)
+        if frame is not None:
+            with self._lock:
+                self._frames.pop(image_uuid, None)
+        return frame
+
+    def _evict_expired(self):
+        # Reads refresh the order but not the expiry, so expired frames can sit behind live ones; scan from
+        # the least recently used end and stop at the first live frame to keep puts cheap
+        now = self._clock()
+        while self._frames:
+            image_uuid, (expiry, _) = next(iter(self._frames.items()))
+            if expiry > now:
+                break
+            del self._frames[image_uuid]
+            self.expired += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
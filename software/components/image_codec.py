@@ -0,0 +1,108 @@
+import base64
+import io
+import numpy as np
+from PIL import Image
+
+# Content types an image can be transported as, JSON carries either the legacy nested list or base64
+JSON = 'application/json'
+OCTET_STREAM = 'application/octet-stream'
+PNG = 'image/png'
+
+# Headers describing a raw pixel buffer
+SHAPE_HEADER = 'X-Image-Shape'
+DTYPE_HEADER = 'X-Image-Dtype'
+
+# Only 8-bit frames are produced by the camera and accepted by the AI system
+SUPPORTED_DTYPES = ('uint8',)
+
+def encode_shape(shape):
+    """Format an array shape for the shape header, e.g. (100, 100) -> '100,100'."""
+    return ','.join(str(dim) for dim in shape)
+
+def decode_shape(value):
+    """Parse a shape header value back into a tuple."""
+    if not value:
+        raise ValueError(f"{SHAPE_HEADER} header is required for raw image data")
+    try:
+        return tuple(int(dim) for dim in value.split(','))
+    except ValueError:
+        raise ValueError(f"Invalid {SHAPE_HEADER} header: {value!r}")
+
+def check_dtype(dtype):
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported image dtype {dtype!r}, expected one of {SUPPORTED_DTYPES}")
+
+def check_shape(shape):
+    """Only grayscale (height, width) and RGB or RGBA (height, width, 3 or 4) images can be predicted."""
+    if not (len(shape) == 2 or len(shape) == 3 and shape[2] in (3, 4)) or min(shape[:2], default=0) <= 0:
+        raise ValueError(f"Unsupported image shape {tuple(shape)}, expected (height, width) or "
+                         f"(height, width, 3 or 4)")
+
+def _from_lists(value, field):
+    """Nested lists of pixel values to a uint8 array, rejecting ragged lists and values that are not 0-255."""
+    try:
+        pixels = np.array(value)
+    except ValueError:
+        raise ValueError(f"{field} must be nested lists of equal length")
+    if pixels.size and (pixels.dtype.kind not in 'iu' or pixels.min() < 0 or pixels.max() > 255):
+        raise ValueError(f"{field} must hold integer pixel values from 0 to 255")
+    return pixels.astype(np.uint8)
+
+def from_list(value):
+    """Decode the legacy nested list format into an image array."""
+    image_array = _from_lists(value, 'raw_image')
+    check_shape(image_array.shape)
+    return image_array
+
+def from_batch(value):
+    """Decode a batch of images in the nested list format into one (N, height, width[, channels]) array."""
+    if not isinstance(value, list):
+        raise ValueError("raw_images must be a list of images")
+    images = _from_lists(value, 'raw_images')
+    if len(images):
+        check_shape(images.shape[1:])
+    return images
+
+def to_raw(image_array):
+    """Encode an image as raw bytes, returns the body and the headers describing it."""
+    headers = {SHAPE_HEADER: encode_shape(image_array.shape), DTYPE_HEADER: str(image_array.dtype)}
+    return np.ascontiguousarray(image_array).tobytes(), headers
+
+def from_raw(data, shape, dtype='uint8'):
+    """Decode raw bytes into an image array without copying."""
+    check_dtype(dtype)
+    shape = tuple(shape) if isinstance(shape, (tuple, list)) else decode_shape(shape)
+    check_shape(shape)
+    image_array = np.frombuffer(data, dtype=dtype)
+    if image_array.size != int(np.prod(shape)):
+        raise ValueError(f"Image data of {image_array.size} pixels does not match shape {shape}")
+    return image_array.reshape(shape)
+
+def to_png(image_array):
+    """Encode an image as PNG, favouring speed over size."""
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+def from_png(data):
+    """Decode PNG bytes into an image array."""
+    try:
+        image_array = np.asarray(Image.open(io.BytesIO(data)))
+    except OSError as e:
+        raise ValueError(f"Invalid PNG data: {e}")
+    check_shape(image_array.shape)
+    return image_array
+
+def to_base64(image_array):
+    """Encode an image as the JSON fields of the base64 format."""
+    return dict(
+        raw_image_b64=base64.b64encode(np.ascontiguousarray(image_array).tobytes()).decode('ascii'),
+        shape=list(image_array.shape),
+        dtype=str(image_array.dtype),
+    )
+
+def from_base64(data):
+    """Decode the JSON fields of the base64 format into an image array."""
+    if 'shape' not in data:
+        raise ValueError("shape is required for base64 image data")
+    return from_raw(base64.b64decode(data['raw_image_b64']), data['shape'], data.get('dtype', 'uint8'))
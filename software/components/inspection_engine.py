@@ -0,0 +1,151 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+import numpy as np
+from ai import AISystemMock
+from camera import CameraMock
+
+def _predict_worker(task_queue, result_queue, preprocess_stages, detector):
+    """Predictor process: runs the OpenCV pipeline on chunks of frames until it receives the stop marker."""
+    ai_system = AISystemMock(preprocess_stages=preprocess_stages, detector=detector)
+    while True:
+        chunk = task_queue.get()
+        if chunk is None:
+            break
+        results = []
+        for seq, frame, low_lighting in chunk:
+            predict_start = time.perf_counter()
+            defect_present = bool(ai_system.predict(frame))
+            latency_ms = (time.perf_counter() - predict_start) * 1000
+            results.append((seq, defect_present, low_lighting, latency_ms))
+        result_queue.put(results)
+
+class InspectionEngine:
+    """
+    Pipelined capture -> predict -> log engine. A capture thread feeds chunks of frames through a bounded queue
+    to a pool of predictor processes, whose verdicts are handed to a single sink (e.g. ResultWriter.submit)
+    in the calling thread.
+    """
+
+    def __init__(self, sink, workers=None, ordered=True, chunk_size=8, max_pending_chunks=None,
+                 preprocess_stages=None, detector='canny'):
+        """
+        Args:
+            sink (callable): Called as sink(image_id, defect_present, low_lighting=..., latency_ms=...) per frame.
+            workers (int): Number of predictor processes, defaults to the number of CPU cores.
+            ordered (bool): Deliver results in capture order, otherwise as soon as they are ready.
+            chunk_size (int): Frames sent to a predictor per queue message, amortizing the IPC cost.
+            max_pending_chunks (int): Bound on chunks waiting for a predictor, defaults to two per worker.
+            preprocess_stages (tuple): Preprocessing stages of the predictors, defaults to the detector's own.
+            detector (str): Defect detector of the predictors, 'canny' or 'box_sum'.
+        """
+        self.sink = sink
+        self.workers = workers or os.cpu_count() or 1
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.max_pending_chunks = max_pending_chunks or 2 * self.workers
+        self.preprocess_stages = preprocess_stages
+        self.detector = detector
+        self.camera = CameraMock()
+
+    def _capture(self, task_queue, capture_count, conditions, capture_interval):
+        """
+        Capture producer: blocks when the predictors fall behind. Unpaced frames are grouped into chunks,
+        paced frames are sent one by one as soon as they are captured instead of waiting for a full chunk.
+        """
+        if not capture_interval:
+            # Nothing to pace, generate each chunk in one vectorized pass
+            for start in range(0, capture_count, self.chunk_size):
+                seqs = range(start, min(start + self.chunk_size, capture_count))
+                with_defect, low_lighting = zip(*(conditions(seq) for seq in seqs))
+                frames, _ = self.camera.capture_batch(len(seqs), with_defect=with_defect, low_lighting=low_lighting)
+                task_queue.put(list(zip(seqs, frames, low_lighting)))
+            return
+
+        for seq in range(capture_count):
+            with_defect, low_lighting = conditions(seq)
+            frame = np.array(self.camera.capture(with_defect=with_defect, low_lighting=low_lighting))
+            task_queue.put([(seq, frame, low_lighting)])
+            time.sleep(capture_interval)
+
+    def _produce(self, task_queue, result_queue, errors, *args):
+        """Runs the capture producer, a failure is kept in `errors` and wakes the sink with a None marker."""
+        try:
+            self._capture(task_queue, *args)
+        except BaseException as error:
+            errors.append(error)
+            result_queue.put(None)
+
+    def run(self, capture_count, conditions=None, capture_interval=0, first_image_id=0):
+        """
+        Inspect `capture_count` frames and return a report with the frames/sec throughput.
+        Args:
+            conditions (callable): Maps a frame number to its (with_defect, low_lighting) capture conditions,
+                defaults to (True, True) like IntegrationSystem.capture_and_analyze.
+            capture_interval (float): Pause between captures in seconds, 0 captures as fast as possible.
+        Raises the capture thread's exception if capturing fails.
+            first_image_id (int): Image ID passed to the sink for the first frame.
+        """
+        conditions = conditions or (lambda seq: (True, True))
+        task_queue = multiprocessing.Queue(maxsize=self.max_pending_chunks)
+        result_queue = multiprocessing.Queue()
+        predictors = [
+            multiprocessing.Process(target=_predict_worker, args=(task_queue, result_queue, self.preprocess_stages,
+                                                                      self.detector),
+                                    daemon=True)
+            for _ in range(self.workers)
+        ]
+        for predictor in predictors:
+            predictor.start()
+
+        start_time = time.perf_counter()
+        producer_errors = []
+        producer = threading.Thread(target=self._produce,
+                                    args=(task_queue, result_queue, producer_errors, capture_count, conditions,
+                                          capture_interval),
+                                    daemon=True)
+        producer.start()
+
+        # Sink: results arrive per chunk in completion order, the reorder buffer restores capture order if requested
+        delivered = 0
+        next_seq = 0
+        reorder_buffer = {}
+        try:
+            while delivered < capture_count:
+                try:
+                    results = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    if any(predictor.exitcode not in (None, 0) for predictor in predictors):
+                        raise RuntimeError("A predictor process exited unexpectedly")
+                    continue
+                if results is None:
+                    raise producer_errors[0]
+                for seq, defect_present, low_lighting, latency_ms in results:
+                    if not self.ordered:
+                        self.sink(first_image_id + seq, defect_present, low_lighting=low_lighting, latency_ms=latency_ms)
+                        delivered += 1
+                        continue
+                    reorder_buffer[seq] = (defect_present, low_lighting, latency_ms)
+                    while next_seq in reorder_buffer:
+                        defect_present, low_lighting, latency_ms = reorder_buffer.pop(next_seq)
+                        self.sink(first_image_id + next_seq, defect_present, low_lighting=low_lighting,
+                                  latency_ms=latency_ms)
+                        next_seq += 1
+                        delivered += 1
+        except BaseException:
+            # The capture thread is a daemon and may be blocked on the full task queue, leave it behind
+            for predictor in predictors:
+                predictor.terminate()
+            raise
+        elapsed = time.perf_counter() - start_time
+
+        producer.join()
+        for _ in predictors:
+            task_queue.put(None)
+        for predictor in predictors:
+            predictor.join()
+
+        return dict(frames=delivered, workers=self.workers, elapsed=elapsed,
+                    frames_per_sec=delivered / elapsed if elapsed else 0.0)
@@ -1,15 +1,24 @@
 # integrate_system.py
 import time
+import uuid
 import random
+import logging
 from ai import AISystemMock
 from camera import CameraMock
 from database import Database
+from result_writer import ResultWriter, BLOCK
+from inspection_engine import InspectionEngine
+from structured_logging import configure_logging
+
+logger = logging.getLogger(__name__)
 
 class IntegrationSystem:
-    def __init__(self, threshold=145, db_name='test_results.db'):
+    def __init__(self, threshold=145, db_name='test_results.db', max_queue=1000, backpressure=BLOCK):
         self.ai_system = AISystemMock()
         self.camera = CameraMock()
-        self.database = Database(db_name)
+        self.database = Database(db_name, batch_size=100)
+        # Results are logged by a background thread, capture_and_analyze only enqueues them
+        self.result_writer = ResultWriter(self.database, max_queue=max_queue, policy=backpressure)
         self.image_id = 0
 
     def capture_and_analyze(self, with_defect=True, low_lighting=True):
@@ -22,20 +31,52 @@ class IntegrationSystem:
         image = self.camera.capture(with_defect=with_defect, low_lighting=low_lighting)
 
         # Predict the presence of defects
+        predict_start = time.perf_counter()
         defect_present = self.ai_system.predict(image)
+        latency_ms = (time.perf_counter() - predict_start) * 1000
 
-        # Log the result in the database
-        self.database.log_result(self.image_id, defect_present)
+        # Queue the result for the database writer thread
+        self.submit_result(self.image_id, defect_present, low_lighting=low_lighting, latency_ms=latency_ms)
 
-        print(f"Image ID {self.image_id}: Defect present: {defect_present}\n")
+        logger.debug("Image inspected", extra={'fields': {'image_id': self.image_id, 'defect_present': defect_present}})
         self.image_id += 1
 
-    def run(self, capture_interval=1, capture_count=10):
+    def submit_result(self, image_id, defect_present, **details):
+        """Queue a result for the database writer thread under a fresh image UUID."""
+        self.result_writer.submit(image_id, defect_present, image_uuid=str(uuid.uuid4()), **details)
+
+    def run(self, capture_interval=1, capture_count=10, workers=None, ordered=True):
+        """
+        Capture and analyze `capture_count` images, then close the system.
+        With `workers` set, frames are predicted by that many processes of an InspectionEngine instead of
+        one after another, `ordered` decides whether results are logged in capture order.
+        """
+        if workers:
+            engine = InspectionEngine(self.submit_result, workers=workers, ordered=ordered)
+            report = engine.run(capture_count, capture_interval=capture_interval, first_image_id=self.image_id)
+            self.image_id += report['frames']
+            logger.info("Inspection run finished", extra={'fields': {
+                'frames': report['frames'], 'workers': report['workers'],
+                'frames_per_sec': round(report['frames_per_sec'], 1)}})
+            self.close()
+            return report
+
         for _ in range(capture_count):
             self.capture_and_analyze()
             time.sleep(capture_interval)
+        self.close()
+
+    def flush_results(self):
+        """Block until every queued result is committed to the database."""
+        self.result_writer.drain()
+
+    def close(self):
+        """Drain the result queue and close the database, returns the writer's written/dropped/spilled counts."""
+        stats = self.result_writer.close()
         self.database.close()
+        return stats
 
 if __name__ == "__main__":
+    configure_logging(logging.INFO)
     system = IntegrationSystem()
     system.run()
\ No newline at end of file
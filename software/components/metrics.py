@@ -0,0 +1,100 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from 50 us (a capture or a blur) up to 2.5 s (a 4K frame through NL-means)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5)
+
+class Histogram:
+    """Fixed-bucket histogram, an observation is one bisect and three additions."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf bucket, not cumulative until rendered
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the `with` block in seconds."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time)
+
+class MetricsRegistry:
+    """
+    Named histograms and gauges, rendered in the Prometheus text exposition format.
+    Args:
+        labels: Labels added to every series, e.g. worker=os.getpid() to tell the processes of a server apart.
+    """
+
+    def __init__(self, **labels):
+        self.labels = tuple(sorted(labels.items()))
+        # name -> (help, {labels tuple: Histogram})
+        self._histograms = {}
+        # name -> (help, {labels tuple: callable returning the current value})
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS, **labels):
+        """Returns the histogram for `name` and `labels`, created on first use. Callers keep it for the hot path."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            _, series = self._histograms.setdefault(name, (help, {}))
+            if key not in series:
+                series[key] = Histogram(buckets)
+            return series[key]
+
+    def gauge(self, name, help, function, **labels):
+        """Registers a gauge whose value is read from `function()` at render time, e.g. a queue's qsize."""
+        with self._lock:
+            _, series = self._gauges.setdefault(name, (help, {}))
+            series[tuple(sorted(labels.items()))] = function
+
+    def render(self):
+        """Current values of every metric in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            histograms = {name: (help, dict(series)) for name, (help, series) in self._histograms.items()}
+            gauges = {name: (help, dict(series)) for name, (help, series) in self._gauges.items()}
+
+        for name, (help, series) in sorted(gauges.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, function in sorted(series.items()):
+                labels += self.labels
+                lines.append(f"{name}{_format_labels(labels)} {float(function())}")
+
+        for name, (help, series) in sorted(histograms.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                with histogram._lock:
+                    counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+                labels += self.labels
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
@@ -0,0 +1,69 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class PredictionCache:
+    """Bounded LRU cache of predictions keyed by a hash of the frame's pixels and the detector configuration."""
+
+    def __init__(self, max_entries=10000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        # key -> prediction, ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(pixels, config=()):
+        """
+        Cache key of a frame: a SHA-256 digest of its pixel bytes, shape and dtype, plus `config`,
+        a hashable description of everything else the prediction depends on (detector, stages, thresholds).
+        """
+        # OpenSSL's SHA-256 runs on the CPU's SHA extensions, several times faster than BLAKE2b or MD5 there
+        pixels = np.ascontiguousarray(pixels)
+        digest = hashlib.sha256(pixels.data)
+        digest.update(f"{pixels.shape}{pixels.dtype}".encode())
+        return digest.digest(), config
+
+    def get(self, key, default=None):
+        """Return the cached prediction and count a hit, or count a miss and return `default`."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, prediction):
+        """Cache a prediction, evicting the least recently used one when the cache is full."""
+        with self._lock:
+            self._entries[key] = prediction
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def get_or_compute(self, key, compute):
+        """Return the cached prediction, or compute and cache it. Concurrent misses on one key may both compute."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        prediction = compute()
+        self.put(key, prediction)
+        return prediction
+
+    def stats(self):
+        with self._lock:
+            return dict(entries=len(self._entries), hits=self.hits, misses=self.misses, evicted=self.evicted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,170 @@
+import os
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+# What submit does when the queue is full
+BLOCK = 'block'              # wait for the writer to make room
+DROP_OLDEST = 'drop-oldest'  # discard the oldest queued result
+SPILL = 'spill-to-file'      # append the result to a spill file, replayed into the database on close
+POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+class ResultWriter:
+    """Logs results to a Database from a dedicated thread so callers only pay for a queue put."""
+
+    def __init__(self, database, max_queue=1000, policy=BLOCK, spill_path='results_spill.jsonl',
+                 replay_existing=False):
+        """
+        Args:
+            database (Database): Where the results are logged.
+            max_queue (int): Results queued for the writer thread before the policy applies.
+            policy (str): BLOCK, DROP_OLDEST or SPILL.
+            spill_path (str): JSON lines file of the SPILL policy.
+            replay_existing (bool): Log the results of a spill file left behind by an earlier writer, e.g. after
+                a crash. By default the file is renamed to <spill_path>.stale-<time> instead, since its results
+                may have been logged already.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Policy must be one of {POLICIES}")
+        self.database = database
+        self.policy = policy
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        # Serializes drop-oldest and spill handling between submitting threads
+        self._overflow_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        # Results lost to database errors
+        self.failed = 0
+        # Results logged since the last successful flush, lost with it if the flush fails
+        self._uncommitted = 0
+        if os.path.exists(spill_path):
+            if replay_existing:
+                self._replay_spill()
+                self._commit()
+            else:
+                stale_path = f"{spill_path}.stale-{time.strftime('%Y%m%d-%H%M%S')}"
+                os.replace(spill_path, stale_path)
+                logger.warning("Moved an earlier spill file aside without replaying it",
+                               extra={'fields': {'path': stale_path}})
+        self._thread = threading.Thread(target=self._write_results, daemon=True)
+        self._thread.start()
+
+    def submit(self, image_id, defect_detected, **details):
+        """Queue a result for logging, applying the backpressure policy if the queue is full.
+        `details` are passed on to Database.log_result (image_uuid, low_lighting, latency_ms, ...)."""
+        details.setdefault('created_at', time.time())
+        item = (image_id, defect_detected, details)
+        if self.policy == BLOCK:
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._overflow_lock:
+                if self.policy == SPILL:
+                    with open(self.spill_path, 'a') as spill_file:
+                        spill_file.write(json.dumps([image_id, bool(defect_detected), details]) + "\n")
+                    self.spilled += 1
+                    return
+                # Drop the oldest queued results until the new one fits
+                while True:
+                    try:
+                        self._queue.put_nowait(item)
+                        return
+                    except queue.Full:
+                        try:
+                            self._queue.get_nowait()
+                            self._queue.task_done()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+
+    def drain(self):
+        """Block until every queued result has been written and committed."""
+        self._queue.join()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _write_results(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                image_id, defect_detected, details = item
+                self._log(image_id, defect_detected, details)
+                # Commit once the backlog is cleared, the database batches everything written until then
+                if self._queue.empty():
+                    self._commit()
+            finally:
+                self._queue.task_done()
+
+    def close(self, timeout=30.0):
+        """
+        Drain the queue, replay spilled results and stop the writer thread, waiting at most about `timeout` seconds
+        for it. Returns the writer's counters.
+        """
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("Result writer did not make room to stop", extra={'fields': {'queued': self._queue.qsize()}})
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("Result writer thread did not stop", extra={'fields': {'queued': self._queue.qsize()}})
+        if self.spilled and os.path.exists(self.spill_path):
+            self._replay_spill()
+        self._commit()
+        stats = dict(written=self.written, dropped=self.dropped, spilled=self.spilled, failed=self.failed)
+        if self.failed:
+            logger.error("Result writer stopped with failed results", extra={'fields': stats})
+        else:
+            logger.info("Result writer stopped", extra={'fields': stats})
+        return stats
+
+    def _replay_spill(self):
+        """Log the results of the spill file and remove it, _commit() then flushes them."""
+        with open(self.spill_path) as spill_file:
+            for line in spill_file:
+                try:
+                    image_id, defect_detected, details = json.loads(line)
+                except (ValueError, TypeError):
+                    logger.exception("Failed to replay a spilled result")
+                    self.failed += 1
+                    continue
+                self._log(image_id, defect_detected, details)
+        os.remove(self.spill_path)
+
+    def _log(self, image_id, defect_detected, details):
+        """Buffer one result in the database, counting the results a failure loses."""
+        try:
+            self.database.log_result(image_id, defect_detected, **details)
+        except sqlite3.Error:
+            # The result completed a batch the database failed to write and discarded, uncommitted results included
+            logger.exception("Failed to write results", extra={'fields': {'results': self._uncommitted + 1}})
+            self.failed += self._uncommitted + 1
+            self._uncommitted = 0
+        except Exception:
+            # Only this result was rejected, the ones buffered before it are still committed later
+            logger.exception("Failed to log result", extra={'fields': {'image_id': image_id}})
+            self.failed += 1
+        else:
+            self._uncommitted += 1
+
+    def _commit(self):
+        try:
+            self.database.flush()
+            self.written += self._uncommitted
+        except Exception:
+            logger.exception("Failed to write results", extra={'fields': {'results': self._uncommitted}})
+            self.failed += self._uncommitted
+        self._uncommitted = 0
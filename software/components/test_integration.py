@@ -1,10 +1,24 @@
 import unittest
 import os
-from ai import AISystemMock
+import glob
+import json
+import time
+import threading
+from unittest import mock
+from ai import AISystemMock, DEFAULT_PREPROCESS_STAGES
 from camera import CameraMock
 from database import Database
 from integrate_system import IntegrationSystem
+from inspection_engine import InspectionEngine
+from frame_store import FrameStore
+from prediction_cache import PredictionCache
+from metrics import MetricsRegistry
+from structured_logging import configure_logging, DeferredQueueHandler
+from result_writer import ResultWriter, DROP_OLDEST, SPILL
+import io
+import logging
 import sqlite3
+import numpy as np
 from PIL import Image
 
 class TestIntegrationSystem(unittest.TestCase):
@@ -18,8 +32,8 @@ class TestIntegrationSystem(unittest.TestCase):
     def tearDown(self):
         """Tear down the test environment after each test."""
         print("Tearing down the test environment...")
-        # Close the database connection before removing the file
-        self.integration_system.database.close()
+        # Stop the result writer and close the database connection before removing the file
+        self.integration_system.close()
         # Remove the database file
         os.remove(self.db_name)
         print("Test environment torn down.\n")
@@ -41,6 +55,9 @@ class TestIntegrationSystem(unittest.TestCase):
         print("Capturing and analyzing image without defect, low lighting...")
         self.integration_system.capture_and_analyze(with_defect=False, low_lighting=True)
 
+        print("Waiting for the result writer to commit the queued results...")
+        self.integration_system.flush_results()
+
         print("Reopening the database to verify results...")
         # Reopen the connection for verification
         conn = sqlite3.connect(self.db_name)
@@ -88,5 +105,476 @@ class TestIntegrationSystem(unittest.TestCase):
 
         print("Test for defect detection completed.\n")
 
+    def test_parallel_run(self):
+        """Test that the multi-worker engine logs every frame in capture order."""
+        print("Running the integration system with 2 predictor processes...")
+        report = self.integration_system.run(capture_interval=0, capture_count=12, workers=2)
+        self.assertEqual(report['frames'], 12)
+        self.assertGreater(report['frames_per_sec'], 0)
+
+        conn = sqlite3.connect(self.db_name)
+        rows = conn.execute("SELECT image_id, defect_detected FROM results ORDER BY id").fetchall()
+        conn.close()
+        self.assertEqual([row[0] for row in rows], list(range(12)))
+        self.assertTrue(all(row[1] == 1 for row in rows))  # run() captures with a defect in low lighting
+        print("Parallel run test completed.\n")
+
+    def test_paced_run(self):
+        """Test that paced frames are predicted as they are captured, not once a chunk is full."""
+        captured = {}
+        delivered = []
+
+        def conditions(seq):
+            captured[seq] = time.perf_counter()
+            return True, True
+
+        engine = InspectionEngine(lambda image_id, *args, **details: delivered.append(time.perf_counter()),
+                                  workers=1)
+        report = engine.run(3, conditions=conditions, capture_interval=0.5)
+        self.assertEqual(report['frames'], 3)
+        self.assertLess(delivered[0], captured[2])
+
+    def test_capture_failure(self):
+        """Test that an exception in the capture thread is raised by run() instead of hanging it."""
+        def conditions(seq):
+            if seq == 3:
+                raise ValueError("No camera")
+            return True, True
+
+        for capture_interval in (0, 0.01):
+            engine = InspectionEngine(lambda *args, **details: None, workers=1, chunk_size=2)
+            with self.assertRaisesRegex(ValueError, "No camera"):
+                engine.run(10, conditions=conditions, capture_interval=capture_interval)
+
+    def test_in_memory_prediction(self):
+        """Test that predictions run on in-memory arrays without touching the disk."""
+        print("Starting test for in-memory prediction...\n")
+        ai_system = self.integration_system.ai_system
+
+        image_with_defect = self.integration_system.camera.capture(with_defect=True, low_lighting=False)
+        image_array = np.array(image_with_defect)
+
+        print("Predicting from PIL image, NumPy array and raw buffer...")
+        # Nothing may be written: neither through OpenCV nor through PIL
+        with mock.patch("ai.cv2.imwrite") as imwrite, mock.patch.object(Image.Image, "save") as save:
+            self.assertTrue(ai_system.predict(image_with_defect))
+            self.assertTrue(ai_system.predict(image_array))
+            self.assertTrue(ai_system.predict(image_array.tobytes(), shape=image_array.shape))
+        imwrite.assert_not_called()
+        save.assert_not_called()
+
+        print("Checking that a raw buffer without a shape is rejected...")
+        with self.assertRaises(ValueError):
+            ai_system.predict(image_array.tobytes())
+
+        print("Test for in-memory prediction completed.\n")
+
+    def test_preprocess_stages(self):
+        """Test that only the configured preprocessing stages run and are timed."""
+        print("Starting test for configurable preprocessing stages...\n")
+        image = self.integration_system.camera.capture(with_defect=True, low_lighting=False)
+
+        print("Running the default pipeline...")
+        ai_system = self.integration_system.ai_system
+        self.assertTrue(ai_system.predict(image))
+        self.assertEqual(list(ai_system.stage_timings), list(DEFAULT_PREPROCESS_STAGES))
+
+        print("Running a custom pipeline with an extra box filter...")
+        ai_system = AISystemMock(preprocess_stages=('grayscale', 'box_filter', 'gaussian'))
+        self.assertTrue(ai_system.predict(image))
+        self.assertEqual(list(ai_system.stage_timings), ['grayscale', 'box_filter', 'gaussian'])
+        self.assertTrue(all(duration >= 0 for duration in ai_system.stage_timings.values()))
+
+        print("Checking that unknown stages are rejected...")
+        with self.assertRaises(ValueError):
+            AISystemMock(preprocess_stages=('gaussian', 'sharpen'))
+
+        print("Test for configurable preprocessing stages completed.\n")
+
+    def test_box_sum_detector(self):
+        """Test that the box-sum detector agrees with the ground truth in both lighting modes."""
+        print("Starting test for the box-sum detector...\n")
+        ai_system = AISystemMock(detector='box_sum')
+        self.assertEqual(list(ai_system.preprocess_stages), ['grayscale'])
+        camera = CameraMock(seed=11)
+        for low_lighting in (False, True):
+            with_defect = np.arange(20) % 2 == 0
+            frames, defects = camera.capture_batch(20, with_defect=with_defect, low_lighting=low_lighting)
+            print(f"Predicting a batch with low_lighting={low_lighting}...")
+            for (defect_present, bounding_box), truth in zip(ai_system.predict_batch(frames), defects):
+                self.assertEqual(defect_present, truth[0] >= 0)
+                if defect_present:
+                    self.assertLessEqual(abs(bounding_box[0] - truth[0]), 2)
+                    self.assertLessEqual(abs(bounding_box[1] - truth[1]), 2)
+            self.assertTrue(ai_system.predict(frames[0]))
+            self.assertFalse(ai_system.predict(frames[1]))
+
+        print("Checking that unknown detectors are rejected...")
+        with self.assertRaises(ValueError):
+            AISystemMock(detector='sobel')
+
+        print("Test for the box-sum detector completed.\n")
+
+class TestCameraMock(unittest.TestCase):
+    def test_capture_batch_is_reproducible(self):
+        """Test that a seeded camera generates the same batch every time."""
+        frames, defects = CameraMock(seed=7).capture_batch(4, with_defect=True)
+        frames_again, defects_again = CameraMock(seed=7).capture_batch(4, with_defect=True)
+        self.assertEqual(frames.shape, (4, 100, 100))
+        self.assertEqual(frames.dtype, np.uint8)
+        np.testing.assert_array_equal(frames, frames_again)
+        np.testing.assert_array_equal(defects, defects_again)
+
+    def test_capture_batch_ground_truth(self):
+        """Test that the returned bounding boxes locate the generated defects."""
+        with_defect = np.array([True, False, True, True])
+        frames, defects = CameraMock(seed=3).capture_batch(4, with_defect=with_defect, low_lighting=False,
+                                                           resolution=(120, 160))
+        self.assertEqual(frames.shape, (4, 120, 160))
+        np.testing.assert_array_equal(defects[1], [-1, -1, -1, -1])
+        for frame, (x, y, w, h) in zip(frames[with_defect], defects[with_defect]):
+            self.assertEqual((w, h), (10, 10))
+            # Normal lighting defects saturate the patch
+            self.assertTrue(np.all(frame[y:y+h, x:x+w] == 255))
+
+        print("Checking the predictor agrees with the ground truth...")
+        for (defect_present, bounding_box), truth in zip(AISystemMock().predict_batch(frames), defects):
+            self.assertEqual(defect_present, truth[0] >= 0)
+            if defect_present:
+                self.assertLessEqual(abs(bounding_box[0] - truth[0]), 2)
+                self.assertLessEqual(abs(bounding_box[1] - truth[1]), 2)
+
+    def test_invalid_resolution(self):
+        """Test that resolutions beyond 4K or too small for a defect are rejected."""
+        with self.assertRaises(ValueError):
+            CameraMock(resolution=(2161, 3840))
+        with self.assertRaises(ValueError):
+            CameraMock().capture_batch(1, resolution=(20, 20))
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        """Set up a buffered database in a fresh file."""
+        self.db_name = "test_buffered_results.db"
+        self.database = Database(self.db_name, batch_size=3)
+
+    def tearDown(self):
+        """Close the database and remove its files."""
+        self.database.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+
+    def count_rows(self):
+        conn = sqlite3.connect(self.db_name)
+        count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        conn.close()
+        return count
+
+    def test_buffered_logging(self):
+        """Test that results are written once the batch is full, on flush and on close."""
+        journal_mode = self.database.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+
+        self.database.log_result(0, True)
+        self.database.log_result(1, False)
+        self.assertEqual(self.count_rows(), 0)
+        self.database.log_result(2, True)
+        self.assertEqual(self.count_rows(), 3)
+
+        self.database.log_result(3, False)
+        self.database.flush()
+        self.assertEqual(self.count_rows(), 4)
+
+        self.database.log_result(4, True)
+        self.database.close()
+        self.assertEqual(self.count_rows(), 5)
+
+    def test_migrates_original_schema(self):
+        """Test that a database created with the original schema is migrated in place."""
+        self.database.close()
+        os.remove(self.db_name)
+        conn = sqlite3.connect(self.db_name)
+        conn.execute("CREATE TABLE results (id INTEGER PRIMARY KEY AUTOINCREMENT, image_id INTEGER, defect_detected BOOLEAN)")
+        conn.execute("INSERT INTO results (image_id, defect_detected) VALUES (7, 1)")
+        conn.commit()
+        conn.close()
+
+        self.database = Database(self.db_name)
+        self.database.log_result(8, False, image_uuid="uuid-8", low_lighting=True, latency_ms=1.5)
+        conn = sqlite3.connect(self.db_name)
+        rows = conn.execute("SELECT image_id, defect_detected, image_uuid, low_lighting, latency_ms FROM results").fetchall()
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(results)")}
+        conn.close()
+
+        self.assertEqual(rows, [(7, 1, None, None, None), (8, 0, "uuid-8", 1, 1.5)])
+        self.assertIn("idx_results_created_at", indexes)
+        self.assertIn("idx_results_image_uuid", indexes)
+        self.assertNotIn("idx_results_latency_ms", indexes)
+
+    def test_latency_percentiles(self):
+        """Test that nearest-rank percentiles ignore results without a latency or before `since`."""
+        self.assertEqual(self.database.latency_percentiles(), dict(p50=None, p95=None))
+        self.database.log_result(0, False, latency_ms=1000.0, created_at=1.0)
+        self.database.log_result(1, False, created_at=2.0)
+        for latency in [5.0, 1.0, 4.0, 2.0, 3.0]:
+            self.database.log_result(2, False, latency_ms=latency, created_at=3.0)
+        self.assertEqual(self.database.latency_percentiles((0, 50, 95, 100), since=2.0),
+                         dict(p0=1.0, p50=3.0, p95=5.0, p100=5.0))
+
+    def test_interval_flush(self):
+        """Test that buffered results are flushed on the configured interval."""
+        self.database.close()
+        self.database = Database(self.db_name, batch_size=1000, flush_interval=0.05)
+        self.database.log_result(0, True)
+        time.sleep(0.3)
+        self.assertEqual(self.count_rows(), 1)
+
+class TestResultWriter(unittest.TestCase):
+    def setUp(self):
+        """Set up a database whose writes can be held up to fill the queue."""
+        self.db_name = "test_writer_results.db"
+        self.database = Database(self.db_name, batch_size=100)
+        self.release = threading.Event()
+        log_result = self.database.log_result
+
+        def slow_log_result(image_id, defect_detected, **details):
+            self.release.wait()
+            log_result(image_id, defect_detected, **details)
+        self.database.log_result = slow_log_result
+
+    def tearDown(self):
+        """Close the database and remove its files."""
+        self.release.set()
+        self.database.close()
+        for name in [self.db_name, self.db_name + "-wal", self.db_name + "-shm", "test_spill.jsonl"] + \
+                glob.glob("test_spill.jsonl.stale-*"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def logged_ids(self):
+        conn = sqlite3.connect(self.db_name)
+        rows = conn.execute("SELECT image_id FROM results ORDER BY image_id").fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+
+    def fill(self, writer, count):
+        """Submit results while the writer thread is held on the first one."""
+        for image_id in range(count):
+            writer.submit(image_id, image_id % 2 == 0)
+
+    def test_drop_oldest(self):
+        """Test that the oldest queued results are dropped when the queue is full."""
+        writer = ResultWriter(self.database, max_queue=2, policy=DROP_OLDEST)
+        writer.submit(0, True)
+        time.sleep(0.05)  # Let the writer take result 0 and block on it
+        self.fill(writer, 5)
+        self.release.set()
+        stats = writer.close()
+        self.assertEqual(stats, dict(written=3, dropped=3, spilled=0, failed=0))
+        self.assertEqual(self.logged_ids(), [0, 3, 4])
+
+    def test_spill_to_file(self):
+        """Test that overflowing results are spilled to a file and replayed on close."""
+        writer = ResultWriter(self.database, max_queue=2, policy=SPILL, spill_path="test_spill.jsonl")
+        writer.submit(0, True)
+        time.sleep(0.05)
+        self.fill(writer, 5)
+        self.release.set()
+        stats = writer.close()
+        self.assertEqual(stats, dict(written=6, dropped=0, spilled=3, failed=0))
+        self.assertEqual(self.logged_ids(), [0, 0, 1, 2, 3, 4])
+        self.assertFalse(os.path.exists("test_spill.jsonl"))
+
+    def test_existing_spill_file(self):
+        """Test that a spill file left by an earlier writer is moved aside, or replayed when asked to."""
+        self.release.set()
+        for image_id in (7, 8):
+            with open("test_spill.jsonl", "w") as spill_file:
+                spill_file.write(json.dumps([image_id, True, {}]) + "\n")
+            if image_id == 7:
+                with self.assertLogs('result_writer', level='WARNING'):
+                    writer = ResultWriter(self.database, policy=SPILL, spill_path="test_spill.jsonl")
+                stats = writer.close()
+                self.assertEqual(stats['written'], 0)
+                self.assertEqual(len(glob.glob("test_spill.jsonl.stale-*")), 1)
+            else:
+                writer = ResultWriter(self.database, policy=SPILL, spill_path="test_spill.jsonl", replay_existing=True)
+                self.assertEqual(writer.close()['written'], 1)
+            self.assertFalse(os.path.exists("test_spill.jsonl"))
+        self.assertEqual(self.logged_ids(), [8])
+
+    def test_database_errors(self):
+        """Test that failing writes are logged and counted while the writer keeps going and closes."""
+        writer = ResultWriter(self.database, max_queue=2)
+        self.release.set()
+        with self.assertLogs('result_writer', level='ERROR'):
+            for image_id in range(6):
+                # SQLite cannot store the latency of result 2, which is rejected
+                writer.submit(image_id, True, latency_ms=object() if image_id == 2 else 1.0)
+                writer.drain()
+            stats = writer.close(timeout=5.0)
+        # Result 2 was lost, the thread kept writing the later ones
+        self.assertEqual(stats, dict(written=5, dropped=0, spilled=0, failed=1))
+        self.assertEqual(self.logged_ids(), [0, 1, 3, 4, 5])
+
+    def test_bad_result_in_batch(self):
+        """Test that a bad result batched with good ones only counts itself as failed."""
+        writer = ResultWriter(self.database, max_queue=10)
+        with self.assertLogs('result_writer', level='ERROR'):
+            # The writer is held so all six results are committed together
+            for image_id in range(6):
+                writer.submit(image_id, True, latency_ms=object() if image_id == 2 else 1.0)
+            self.release.set()
+            stats = writer.close(timeout=5.0)
+        self.assertEqual(stats, dict(written=5, dropped=0, spilled=0, failed=1))
+        self.assertEqual(self.logged_ids(), [0, 1, 3, 4, 5])
+
+    def test_failed_commit(self):
+        """Test that the results of a commit that raised are all counted as failed."""
+        writer = ResultWriter(self.database, max_queue=10)
+        self.fill(writer, 3)
+        self.database.conn.execute("DROP TABLE results")
+        with self.assertLogs('result_writer', level='ERROR'):
+            self.release.set()
+            stats = writer.close(timeout=5.0)
+        self.assertEqual(stats, dict(written=0, dropped=0, spilled=0, failed=3))
+
+class TestFrameStore(unittest.TestCase):
+    def setUp(self):
+        """Set up a frame store driven by a fake clock."""
+        self.now = 0.0
+        self.store = FrameStore(max_frames=3, ttl=10.0, clock=lambda: self.now)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used frame is evicted once the store is full."""
+        for i in range(3):
+            self.store.put(f"frame{i}", np.full((2, 2), i, dtype=np.uint8))
+        self.assertIsNotNone(self.store.get("frame0"))  # frame0 becomes the most recently used
+        self.store.put("frame3", np.zeros((2, 2), dtype=np.uint8))
+
+        self.assertEqual(len(self.store), 3)
+        self.assertIsNone(self.store.get("frame1"))
+        self.assertIsNotNone(self.store.get("frame0"))
+        self.assertEqual(self.store.evicted, 1)
+
+    def test_ttl_expiry(self):
+        """Test that frames expire once their time to live has passed."""
+        self.store.put("frame0", np.zeros((2, 2), dtype=np.uint8))
+        self.now = 5.0
+        self.store.put("frame1", np.zeros((2, 2), dtype=np.uint8))
+        self.assertIsNotNone(self.store.get("frame0"))
+
+        self.now = 12.0
+        self.assertIsNone(self.store.get("frame0"))
+        self.assertIsNotNone(self.store.pop("frame1"))
+        self.assertIsNone(self.store.get("frame1"))
+        self.assertEqual(self.store.expired, 1)
+
+class TestPredictionCache(unittest.TestCase):
+    def test_key_and_eviction(self):
+        """Test that keys follow the pixels and configuration, and the least recently used verdict is evicted."""
+        frame = np.zeros((4, 4), dtype=np.uint8)
+        self.assertEqual(PredictionCache.key(frame, ('canny',)), PredictionCache.key(frame.copy(), ('canny',)))
+        self.assertNotEqual(PredictionCache.key(frame, ('canny',)), PredictionCache.key(frame, ('box_sum',)))
+        self.assertNotEqual(PredictionCache.key(frame), PredictionCache.key(frame.reshape(2, 8)))
+
+        cache = PredictionCache(max_entries=2)
+        for i in range(2):
+            cache.put(i, i)
+        self.assertEqual(cache.get(0), 0)  # 0 becomes the most recently used
+        cache.put(2, 2)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get_or_compute(2, lambda: self.fail("cached verdict recomputed")), 2)
+        self.assertEqual(cache.stats(), dict(entries=2, hits=2, misses=1, evicted=1))
+
+    def test_ai_system_cache(self):
+        """Test that repeated frames are answered from the cache, in single and batched predictions."""
+        camera = CameraMock(seed=3)
+        frames = [np.array(camera.capture(with_defect=i % 2 == 0, low_lighting=False)) for i in range(4)]
+        cache = PredictionCache()
+        ai_system = AISystemMock(cache=cache)
+
+        self.assertTrue(ai_system.predict(frames[0]))
+        self.assertTrue(ai_system.predict(frames[0].tobytes(), shape=frames[0].shape))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        uncached = AISystemMock().predict_batch(frames)
+        self.assertEqual(ai_system.predict_batch(frames), uncached)
+        self.assertEqual(ai_system.predict_batch(frames), uncached)
+        self.assertEqual((cache.hits, cache.misses), (6, 4))
+
+        # Another detector configuration never reads the verdicts of the first one
+        AISystemMock(detector='box_sum', cache=cache).predict(frames[0])
+        self.assertEqual(cache.misses, 5)
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_rendering(self):
+        """Test that observations land in cumulative buckets and gauges are read at render time."""
+        metrics = MetricsRegistry()
+        histogram = metrics.histogram('stage_seconds', 'Stage duration', buckets=(0.001, 0.01), stage='blur')
+        self.assertIs(metrics.histogram('stage_seconds', 'Stage duration', stage='blur'), histogram)
+        for value in (0.0005, 0.001, 0.005, 0.5):
+            histogram.observe(value)
+        queue_depth = [3]
+        metrics.gauge('queue_depth', 'Queued items', lambda: queue_depth[0])
+        queue_depth[0] = 5
+
+        text = metrics.render()
+        self.assertIn('stage_seconds_bucket{stage="blur",le="0.001"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="blur",le="0.01"} 3', text)
+        self.assertIn('stage_seconds_bucket{stage="blur",le="+Inf"} 4', text)
+        self.assertIn('stage_seconds_count{stage="blur"} 4', text)
+        self.assertIn('queue_depth 5.0', text)
+
+        # Registry labels are added to every series, before the bucket bound
+        metrics = MetricsRegistry(worker=7)
+        metrics.histogram('stage_seconds', 'Stage duration', buckets=(0.001,), stage='blur').observe(0.0005)
+        metrics.gauge('queue_depth', 'Queued items', lambda: 1)
+        text = metrics.render()
+        self.assertIn('stage_seconds_bucket{stage="blur",worker="7",le="0.001"} 1', text)
+        self.assertIn('queue_depth{worker="7"} 1.0', text)
+
+    def test_component_instrumentation(self):
+        """Test that the camera, AI system and database record into a shared registry."""
+        metrics = MetricsRegistry()
+        camera = CameraMock(seed=1, metrics=metrics)
+        ai_system = AISystemMock(metrics=metrics)
+        ai_system.predict(camera.capture(with_defect=True))
+        text = metrics.render()
+        self.assertIn('camera_capture_seconds_count 1', text)
+        for stage in ('load', 'grayscale', 'gaussian', 'detect'):
+            self.assertIn(f'ai_stage_seconds_count{{mode="frame",stage="{stage}"}} 1', text)
+
+class TestStructuredLogging(unittest.TestCase):
+    def tearDown(self):
+        root = logging.getLogger()
+        for handler in [h for h in root.handlers if isinstance(h, DeferredQueueHandler)]:
+            root.removeHandler(handler)
+            handler.listener.stop()
+        root.setLevel(logging.WARNING)
+
+    def test_sampled_background_logging(self):
+        """Test that records are written by the listener thread as key=value lines, sampled events thinned out."""
+        stream = io.StringIO()
+        listener = configure_logging(logging.DEBUG, stream=stream, sample_rates={'contour': 5})
+        logger = logging.getLogger('test')
+        for index in range(20):
+            logger.debug("Contour", extra={'fields': {'index': index}, 'sample': 'contour'})
+        self.assertTrue(AISystemMock().predict(CameraMock(seed=2).capture(with_defect=True, low_lighting=False)))
+        listener.stop()
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([line.split()[-1] for line in lines if ' test Contour ' in line],
+                         ['index=0', 'index=5', 'index=10', 'index=15'])
+        self.assertTrue(any(' DEBUG ai Defect found contour=' in line for line in lines))
+
+    def test_debug_off(self):
+        """Test that nothing reaches the queue below the configured level."""
+        stream = io.StringIO()
+        listener = configure_logging(logging.INFO, stream=stream)
+        AISystemMock().predict(CameraMock(seed=2).capture(with_defect=True, low_lighting=False))
+        listener.stop()
+        self.assertEqual(stream.getvalue(), "")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,26 @@
+# Production server for app.py: `gunicorn -c gunicorn.conf.py` from the software directory.
+# Every setting can be overridden on the command line, e.g. `gunicorn -c gunicorn.conf.py --workers 8`.
+import os
+import multiprocessing
+
+wsgi_app = "app:app"
+bind = os.environ.get("INSPECTION_BIND", "0.0.0.0:8000")
+
+# One process per core runs the OpenCV work in parallel, threads overlap the request I/O within a worker
+workers = int(os.environ.get("INSPECTION_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("INSPECTION_THREADS", 4))
+
+# Every worker imports app.py itself and so builds its own camera, AI system, frame store and SQLite
+# connection. Preloading would fork one connection into every worker, which SQLite does not support.
+preload_app = False
+
+# On SIGTERM (or POST /shutdown) workers stop accepting and get this long to finish in-flight requests
+graceful_timeout = 30
+timeout = 60
+
+def worker_exit(server, worker):
+    """Flush the worker's buffered results once its in-flight requests have drained."""
+    import app
+    app.database.close()
+    server.log.info("Worker %s flushed its results", worker.pid)
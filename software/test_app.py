@@ -0,0 +1,216 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+
+# The app opens its database on import, point it at a scratch directory instead of the default path
+DB_DIR = tempfile.mkdtemp(prefix="inspection-test-")
+os.environ["INSPECTION_DB"] = os.path.join(DB_DIR, "test_results.db")
+
+from app import app, database, prediction_cache
+from components import image_codec
+
+class TestApp(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        """Close the database the app module opened and remove its scratch directory."""
+        database.close()
+        shutil.rmtree(DB_DIR, ignore_errors=True)
+
+    def setUp(self):
+        """Set up a Flask test client before each test."""
+        self.client = app.test_client()
+
+    def capture(self, with_defect, low_lighting=False):
+        response = self.client.post('/capture_image', json={'with_defect': with_defect, 'low_lighting': low_lighting})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_capture_and_predict(self):
+        """Test that a captured frame can be posted back for a prediction."""
+        print("Capturing a frame with a defect and predicting it...")
+        captured = self.capture(with_defect=True)
+        self.assertEqual(np.array(captured['raw_image']).shape, (100, 100))
+
+        response = self.client.post('/predict_defect', json={'raw_image': captured['raw_image']})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['has_defect'])
+
+    def test_capture_resolution(self):
+        """Test that a capture can ask for its own frame size, within the camera's limits."""
+        print("Capturing a 480x640 frame...")
+        response = self.client.post('/capture_image', json={'with_defect': True, 'resolution': [480, 640]},
+                                    headers={'Accept': image_codec.OCTET_STREAM})
+        self.assertEqual(response.headers[image_codec.SHAPE_HEADER], '480,640')
+        self.assertEqual(len(response.get_data()), 480 * 640)
+
+        for resolution in ([5, 5], [10000, 10000], '480x640'):
+            response = self.client.post('/capture_image', json={'resolution': resolution})
+            self.assertEqual(response.status_code, 400)
+
+    def test_predict_by_image_uuid(self):
+        """Test that a captured frame can be predicted by its UUID without sending it back."""
+        print("Predicting a captured frame by image_UUID...")
+        captured = self.capture(with_defect=True)
+        response = self.client.post('/predict_defect', json={'image_UUID': captured['image_UUID']})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['has_defect'])
+
+        print("Predicting an unknown image_UUID...")
+        response = self.client.post('/predict_defect', json={'image_UUID': 'not-a-captured-frame'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_capture_and_predict_endpoint(self):
+        """Test that capture and prediction run in a single request."""
+        print("Capturing and predicting in one request...")
+        for with_defect in (True, False):
+            response = self.client.post('/capture_and_predict', json={'with_defect': with_defect})
+            self.assertEqual(response.status_code, 200)
+            result = response.get_json()
+            self.assertEqual(result['has_defect'], with_defect)
+            self.assertNotIn('raw_image', result)
+            self.assertIn('image_UUID', result)
+            self.assertIn('prediction_UUID', result)
+
+    def test_stats(self):
+        """Test that predictions are logged and aggregated by the stats route."""
+        print("Logging predictions and reading the stats...")
+        before = self.client.get('/stats').get_json()
+        for with_defect, low_lighting in ((True, False), (False, False), (True, True)):
+            self.client.post('/capture_and_predict', json={'with_defect': with_defect, 'low_lighting': low_lighting})
+
+        response = self.client.get('/stats?window=3600&last=600')
+        self.assertEqual(response.status_code, 200)
+        stats = response.get_json()
+        self.assertEqual(stats['total'] - before['total'], 3)
+        self.assertEqual(stats['defects'] - before['defects'], 2)
+        self.assertIsNotNone(stats['latency_ms']['p50'])
+        self.assertLessEqual(stats['latency_ms']['p50'], stats['latency_ms']['p95'])
+        per_lighting = {row['low_lighting']: row for row in stats['per_lighting']}
+        self.assertGreaterEqual(per_lighting[True]['defects'], 1)
+
+        self.assertEqual(self.client.get('/stats?window=0').status_code, 400)
+        self.assertEqual(self.client.get('/stats?window=abc').status_code, 400)
+
+    def test_binary_transport(self):
+        """Test that raw, PNG and base64 frames round trip through capture and predict."""
+        print("Capturing raw bytes and posting them back...")
+        response = self.client.post('/capture_image', json={'with_defect': True},
+                                    headers={'Accept': image_codec.OCTET_STREAM})
+        self.assertEqual(response.mimetype, image_codec.OCTET_STREAM)
+        self.assertEqual(response.headers[image_codec.SHAPE_HEADER], '100,100')
+        self.assertIn('X-Image-UUID', response.headers)
+        raw_image = response.get_data()
+        self.assertEqual(len(raw_image), 100 * 100)
+        response = self.client.post('/predict_defect', data=raw_image, content_type=image_codec.OCTET_STREAM,
+                                    headers={image_codec.SHAPE_HEADER: '100,100'})
+        self.assertTrue(response.get_json()['has_defect'])
+
+        print("Capturing a PNG and posting it back...")
+        response = self.client.post('/capture_image', json={'with_defect': True}, headers={'Accept': image_codec.PNG})
+        self.assertEqual(response.mimetype, image_codec.PNG)
+        response = self.client.post('/predict_defect', data=response.get_data(), content_type=image_codec.PNG)
+        self.assertTrue(response.get_json()['has_defect'])
+
+        print("Capturing base64 JSON and posting it back...")
+        captured = self.client.post('/capture_image', json={'with_defect': True, 'encoding': 'base64'}).get_json()
+        self.assertNotIn('raw_image', captured)
+        self.assertEqual(captured['shape'], [100, 100])
+        payload = {key: captured[key] for key in ('raw_image_b64', 'shape', 'dtype')}
+        response = self.client.post('/predict_defect', json=payload)
+        self.assertTrue(response.get_json()['has_defect'])
+
+    def test_invalid_binary_payloads(self):
+        """Test that malformed binary payloads are rejected with a 400."""
+        response = self.client.post('/predict_defect', data=b'\x00' * 10, content_type=image_codec.OCTET_STREAM)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/predict_defect', data=b'\x00' * 10, content_type=image_codec.OCTET_STREAM,
+                                    headers={image_codec.SHAPE_HEADER: '100,100'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/predict_defect', data=b'\x00' * 16, content_type=image_codec.OCTET_STREAM,
+                                    headers={image_codec.SHAPE_HEADER: '4,4', image_codec.DTYPE_HEADER: 'float32'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/predict_defect', data=b'not a png', content_type=image_codec.PNG)
+        self.assertEqual(response.status_code, 400)
+        # 1-D buffers and 2-channel images cannot be predicted
+        response = self.client.post('/predict_defect', data=b'\x00' * 16, content_type=image_codec.OCTET_STREAM,
+                                    headers={image_codec.SHAPE_HEADER: '16'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/predict_defect', data=b'\x00' * 32, content_type=image_codec.OCTET_STREAM,
+                                    headers={image_codec.SHAPE_HEADER: '4,4,2'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_batches(self):
+        """Test that malformed batches are rejected with a 400 and an error message."""
+        frame = [[0] * 4] * 4
+        for body in ({}, [frame], {'raw_images': frame[0]}, {'raw_images': [frame, [[0] * 3] * 4]},
+                     {'raw_images': [[[256] * 4] * 4]}, {'raw_images': [[['a'] * 4] * 4]}):
+            response = self.client.post('/predict_defect_batch', json=body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('error', response.get_json())
+        response = self.client.post('/predict_defect', json={'raw_image': [[1.5] * 4] * 4})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_json_bodies(self):
+        """Test that JSON bodies that are not an object, or a non-string image_UUID, are rejected with a 400."""
+        for body in (None, [1, 2], 'frame', {'image_UUID': ['a']}, {'image_UUID': 7}, {}):
+            response = self.client.post('/predict_defect', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('error', response.get_json())
+        response = self.client.post('/predict_defect', data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_predict_batch(self):
+        """Test that a batch prediction returns one verdict and bounding box per frame."""
+        print("Predicting a batch of frames with and without defects...")
+        raw_images = [self.capture(with_defect=i % 2 == 0)['raw_image'] for i in range(6)]
+
+        response = self.client.post('/predict_defect_batch', json={'raw_images': raw_images})
+        self.assertEqual(response.status_code, 200)
+        predictions = response.get_json()['predictions']
+
+        self.assertEqual(len(predictions), 6)
+        self.assertEqual([p['has_defect'] for p in predictions], [True, False] * 3)
+        for prediction in predictions:
+            if prediction['has_defect']:
+                x, y, w, h = prediction['bounding_box']
+                self.assertTrue(8 <= w <= 12 and 8 <= h <= 12)
+            else:
+                self.assertIsNone(prediction['bounding_box'])
+
+    def test_prediction_cache(self):
+        """Test that a frame posted again is answered from the prediction cache, whatever its encoding."""
+        print("Posting the same frame as JSON and as raw bytes...")
+        captured = self.client.post('/capture_image', json={'with_defect': True},
+                                    headers={'Accept': image_codec.OCTET_STREAM})
+        hits, misses = prediction_cache.hits, prediction_cache.misses
+        frame = np.frombuffer(captured.get_data(), dtype=np.uint8).reshape(100, 100)
+        response = self.client.post('/predict_defect', json={'raw_image': frame.tolist()})
+        self.assertTrue(response.get_json()['has_defect'])
+        response = self.client.post('/predict_defect', data=captured.get_data(), content_type=image_codec.OCTET_STREAM,
+                                    headers={image_codec.SHAPE_HEADER: '100,100'})
+        self.assertTrue(response.get_json()['has_defect'])
+        self.assertEqual((prediction_cache.hits - hits, prediction_cache.misses - misses), (1, 1))
+        self.assertIn('prediction_cache_hits', self.client.get('/metrics').get_data(as_text=True))
+
+    def test_metrics(self):
+        """Test that stage timings and in-flight counts are exposed in the Prometheus format."""
+        print("Predicting a frame and scraping /metrics...")
+        self.client.post('/capture_and_predict', json={'with_defect': True})
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        # Every series carries the pid of the worker process that answered the scrape
+        worker = f'worker="{os.getpid()}"'
+        for sample in ('camera_capture_seconds_count',
+                       f'ai_stage_seconds_bucket{{mode="frame",stage="gaussian",{worker},le="+Inf"}}',
+                       f'ai_stage_seconds_count{{mode="frame",stage="detect",{worker}}}', 'database_log_result_seconds_count',
+                       f'http_request_seconds_count{{route="capture_and_predict",{worker}}}',
+                       f'http_requests_in_flight{{{worker}}} 1.0', 'database_pending_results', 'frame_store_frames'):
+            self.assertIn(sample, text)
+
+if __name__ == '__main__':
+    unittest.main()
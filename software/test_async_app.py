@@ -0,0 +1,91 @@
+import unittest
+import os
+import time
+import async_app
+from async_app import app
+
+DB_NAME = "test_async_results.db"
+
+def slow_predict(image_array):
+    """Stands in for a prediction that outlives the request timeout."""
+    time.sleep(0.5)
+    return True, 500.0
+
+class TestAsyncApp(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """Start the app's executors and open a test client."""
+        app.config.update(DATABASE=DB_NAME, PREDICT_WORKERS=2, MAX_IN_FLIGHT=64, PREDICT_TIMEOUT=5.0)
+        self.test_app = app.test_app()
+        await self.test_app.startup()
+        self.client = self.test_app.test_client()
+
+    async def asyncTearDown(self):
+        """Drain the executors and remove the test database."""
+        await self.test_app.shutdown()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_NAME + suffix):
+                os.remove(DB_NAME + suffix)
+
+    async def test_capture_and_predict(self):
+        """Test that a captured frame can be predicted by value and by UUID."""
+        print("Capturing a frame and predicting it through the process pool...")
+        response = await self.client.post('/capture_image', json={'with_defect': True})
+        captured = await response.get_json()
+
+        response = await self.client.post('/predict_defect', json={'raw_image': captured['raw_image']})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue((await response.get_json())['has_defect'])
+
+        response = await self.client.post('/predict_defect', json={'image_UUID': captured['image_UUID']})
+        self.assertTrue((await response.get_json())['has_defect'])
+        response = await self.client.post('/predict_defect', json={'image_UUID': 'not-a-captured-frame'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_invalid_batches(self):
+        """Test that malformed batches are rejected with a 400 instead of failing in the predictor."""
+        for body in ({}, {'raw_images': [[[0] * 4] * 4, [[0] * 3] * 4]}, {'raw_images': [[0] * 16]}):
+            response = await self.client.post('/predict_defect_batch', json=body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('error', await response.get_json())
+
+    async def test_invalid_json_bodies(self):
+        """Test that JSON bodies that are not an object, or a non-string image_UUID, are rejected with a 400."""
+        for body in ('null', '[1, 2]', '{"image_UUID": ["a"]}', 'not json'):
+            response = await self.client.post('/predict_defect', data=body, headers={'Content-Type': 'application/json'})
+            self.assertEqual(response.status_code, 400, body)
+        # Outside serve() and hypercorn there is no server to stop
+        self.assertEqual((await self.client.post('/shutdown')).status_code, 501)
+
+    async def test_results_are_logged(self):
+        """Test that predictions written on the I/O thread show up in the stats."""
+        print("Capturing and predicting, then reading the stats...")
+        for with_defect in (True, False, True):
+            response = await self.client.post('/capture_and_predict', json={'with_defect': with_defect})
+            self.assertEqual((await response.get_json())['has_defect'], with_defect)
+
+        stats = await (await self.client.get('/stats?window=3600&last=600')).get_json()
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual(stats['defects'], 2)
+
+        text = await (await self.client.get('/metrics')).get_data(as_text=True)
+        self.assertIn(f'predictions_in_flight{{worker="{os.getpid()}"}} 0.0', text)
+        self.assertIn('ai_predict_seconds_count', text)
+
+    async def test_overload_and_timeout(self):
+        """Test that a full in-flight limit returns 503 and a slow prediction 504."""
+        print("Filling the in-flight limit with a slow prediction...")
+        app.config.update(PREDICT_TIMEOUT=0.1)
+        async_app.in_flight = async_app.asyncio.Semaphore(1)
+        original_predict = async_app._predict
+        async_app._predict = slow_predict
+        try:
+            response = await self.client.post('/capture_and_predict', json={'with_defect': True})
+            self.assertEqual(response.status_code, 504)
+            # The timed out prediction is still running and holds the only slot
+            response = await self.client.post('/capture_and_predict', json={'with_defect': True})
+            self.assertEqual(response.status_code, 503)
+        finally:
+            async_app._predict = original_predict
+
+if __name__ == '__main__':
+    unittest.main()